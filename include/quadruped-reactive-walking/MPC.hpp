@@ -7,14 +7,21 @@
 #include <cmath>
 #include <limits>
 #include <vector>
+#include <algorithm>
+#include <chrono>
+#include <cstring>
+#include <thread>
+#include <exception>
 #include <Eigen/Core>
 #include <Eigen/Dense>
+#include "eiquadprog/eiquadprog-fast.hpp"
 #include "osqp_folder/include/osqp.h"
 #include "osqp_folder/include/cs.h"
 #include "osqp_folder/include/auxil.h"
 #include "osqp_folder/include/util.h"
 #include "osqp_folder/include/osqp_configure.h"
 #include "other/st_to_cc.hpp"
+#include "quadruped-reactive-walking/OSQPSettings.hpp"
 
 typedef Eigen::MatrixXd matXd;
 
@@ -24,6 +31,7 @@ class MPC {
   int n_steps, cpt_ML, cpt_P;
 
   Eigen::Matrix<double, 3, 3> gI;
+  Eigen::Matrix<double, 3, 3> gI_inv;  // Inverse of the inertia matrix in base frame
   Eigen::Matrix<double, 6, 1> q;
   Eigen::Matrix<double, 6, 1> v = Eigen::Matrix<double, 6, 1>::Zero();
   Eigen::Matrix<double, 3, 4> footholds = Eigen::Matrix<double, 3, 4>::Zero();
@@ -39,12 +47,12 @@ class MPC {
   Eigen::MatrixXd x_f_applied;
 
   // Matrix ML
-  const static int size_nz_ML = 5000;
+  int size_nz_ML;  // Number of non-zero values in ML (depends on the number of time steps)
   // int r_ML [size_nz_ML] = {}; // row indexes of non-zero values in matrix ML
   // int c_ML [size_nz_ML] = {}; // col indexes of non-zero values in matrix ML
   // double v_ML [size_nz_ML] = {};  // non-zero values in matrix ML
   // csc* ML_triplet; // Compressed Sparse Column matrix (triplet format)
-  csc *ML;  // Compressed Sparse Column matrix
+  csc *ML = nullptr;  // Compressed Sparse Column matrix
   inline void add_to_ML(int i, int j, double v, int *r_ML, int *c_ML,
                         double *v_ML);                                            // function to fill the triplet r/c/v
   inline void add_to_P(int i, int j, double v, int *r_P, int *c_P, double *v_P);  // function to fill the triplet r/c/v
@@ -55,18 +63,58 @@ class MPC {
   int i_update_B[12 * 4] = {};
   // TODO FOR S ????
 
+  // Cache of the coefficients of B updated in ML for each time step, keyed by the reference yaw, position and
+  // footholds and duration of the node [yaw, x, y, z, footholds, dt]. Since the horizon is shifted by one time step
+  // between two solves, a node is compared with the same and the shifted nodes of the previous solve and with the
+  // previous node of the current solve.
+  // Enabled by default: it makes the update of ML faster for long horizons (N = 32 and 64) and when turning, but the
+  // lookups cost more than they save on a short horizon with a constant reference (about 22 us instead of 19 us for
+  // N = 16), see benchmark-MPC. It can be disabled with set_B_cache in that case.
+  bool use_B_cache = true;
+  Eigen::Matrix<double, 17, Eigen::Dynamic> B_keys, B_keys_prev;
+  Eigen::Matrix<double, 48, Eigen::Dynamic> B_values, B_values_prev;
+  Eigen::Matrix<double, 9, Eigen::Dynamic> I_inv_values, I_inv_values_prev;  // Inverse inertia keyed by yaw
+
   // Matrix NK
   const static int size_nz_NK = 5000;
   double v_NK_up[size_nz_NK] = {};   // maxtrix NK (upper bound)
   double v_NK_low[size_nz_NK] = {};  // maxtrix NK (lower bound)
-  double v_warmxf[size_nz_NK] = {};  // maxtrix NK (lower bound)
+  double v_warmxf[size_nz_NK] = {};  // initial guess of the primal variables
+  double v_warmy[size_nz_NK] = {};   // initial guess of the dual variables
+
+  // Warm start the solver with the previous solution shifted by one time step (otherwise OSQP starts from its
+  // previous solution without shift)
+  bool shifted_warm_start = false;
+
+  // Reduced formulation: the forces of the feet in swing phase are removed from the optimization vector and the
+  // friction constraints are only written for the feet in contact. The QP problem is built in CSC format from the
+  // matrices of the full formulation and its size depends on the contact sequence, so the solver is set up again
+  // when the contact sequence changes and updated otherwise.
+  int formulation;  // Declared before the workspace and the settings of the solver, see the constructor
+  static int check_formulation(int formulation_in);
+  int n_contacts = 0;                                 // Number of (time step, foot) in contact in the horizon
+  Eigen::Matrix<int, Eigen::Dynamic, 1> S_gait_red;  // Contact sequence of the problem given to the solver
+  std::vector<c_int> A_i_red, A_p_red, P_i_red, P_p_red;
+  std::vector<c_float> A_x_red, P_x_red, q_red, l_red, u_red, warm_red, warm_y_red;
+
+  // Condensed formulation: the states are eliminated with the dynamics (X = X_free + Gamma.F) so that only the
+  // forces of the feet in contact remain. The dense QP problem (1/2 F^T.H.F + g^T.F with 6 inequality constraints
+  // per contact) is solved by eiquadprog.
+  Eigen::MatrixXd Gamma;                           // Effect of the forces on the states over the horizon
+  Eigen::VectorXd X_free;                          // States over the horizon without forces
+  Eigen::VectorXd W_cond, R_cond;                  // Weights of the states and forces (diagonal of P)
+  Eigen::MatrixXd H_cond, CE_cond, CI_cond;
+  Eigen::VectorXd g_cond, ce0_cond, ci0_cond, f_cond;
+  double cost_free = 0.0;                          // Cost of the states without forces (constant term)
+  eiquadprog::solvers::EiquadprogFast qp_cond;
+  OSQPInfo info_cond;                              // Statistics of the last solve in the format of OSQP
 
   // Matrix P
   const static int size_nz_P = 5000;
   // c_int r_P [size_nz_P] = {}; // row indexes of non-zero values in matrix ML
   // c_int c_P [size_nz_P] = {}; // col indexes of non-zero values in matrix ML
   // c_float v_P [size_nz_P] = {};  // non-zero values in matrix ML
-  csc *P;  // Compressed Sparse Column matrix
+  csc *P = nullptr;  // Compressed Sparse Column matrix
 
   // Matrix Q
   const static int size_nz_Q = 5000;
@@ -74,8 +122,39 @@ class MPC {
 
   // OSQP solver variables
   OSQPWorkspace *workspce = new OSQPWorkspace();
-  OSQPData *data;
+  OSQPData *data = nullptr;
   OSQPSettings *settings = (OSQPSettings *)c_malloc(sizeof(OSQPSettings));
+  bool initialized = false;  // Set to true after the setup of the solver during the first solve
+  OSQPSettings settings_reset;  // Settings given by the constructor and set_setting, restored by reset
+
+  // The constraint matrix is only updated in the solver (which factorizes the KKT matrix again) when its values
+  // changed since the previous update. Workspaces of the solver can also be kept in a pool keyed by the contact
+  // sequence of their problem (S_gait_red for the active one) so that the periodic contact sequence of a gait reuses
+  // them, with their factorization if the constraint matrix is the same, instead of updating a single workspace
+  // (full formulation) or setting a new one up (reduced formulation). The least recently used is the last one.
+  struct PooledWorkspace {
+    Eigen::Matrix<int, Eigen::Dynamic, 1> S_gait;
+    OSQPWorkspace *work;
+    std::vector<c_float> A_x;  // Values of the constraint matrix in the workspace
+    bool initialized;          // Whether the workspace has been set up
+  };
+  std::vector<PooledWorkspace> workspace_pool;
+  int workspace_pool_size = 1;      // Maximum number of workspaces, including the active one
+  std::vector<c_float> A_x_solver;  // Values of the constraint matrix in the active workspace
+  int n_setups = 0;                 // Number of setups of a workspace
+  int n_updates_A = 0;              // Number of updates of the constraint matrix (factorizations)
+  bool switch_workspace();
+  bool update_A_values(const c_float *A_x, int n);
+
+  // Move blocking: node k of the horizon lasts blocks(k) time steps dt (one by default). The reference trajectory
+  // and the footsteps are given for the n_steps_dt time steps of the horizon and sampled at the end of each node,
+  // the contact state and footholds of a node are the ones of the phase of the gait at its start (node_phase).
+  int n_steps_dt;
+  Eigen::Matrix<int, Eigen::Dynamic, 1> blocks;
+  Eigen::Matrix<int, Eigen::Dynamic, 1> i_xref;      // Number of time steps dt at the end of each node
+  Eigen::Matrix<int, Eigen::Dynamic, 1> i_shift;     // Node of the previous solve at the end of each node
+  Eigen::Matrix<int, Eigen::Dynamic, 1> node_phase;  // Phase of the gait of each node
+  Eigen::Matrix<double, Eigen::Dynamic, 1> dt_nodes;
 
   // Matrices whose size depends on the arguments sent to the constructor function
   Eigen::Matrix<double, 12, Eigen::Dynamic> xref;
@@ -87,9 +166,25 @@ class MPC {
   Eigen::Matrix<double, Eigen::Dynamic, Eigen::Dynamic> D;
   Eigen::Matrix<int, Eigen::Dynamic, 1> i_off;
 
+  // Nodes whose contact state changed during the last update of S_gait, only their lines to enable/disable forces
+  // are updated in ML. The update can be checked against a full rebuild after each update of ML.
+  std::vector<int> S_changed;
+  bool check_S_update = false;
+
  public:
   MPC();
-  MPC(double dt_in, int n_steps_in, double T_gait_in);
+  MPC(double dt_in, int n_steps_in, double T_gait_in, int formulation_in = FULL);
+  MPC(double dt_in, const Eigen::MatrixXd &blocks_in, double T_gait_in, int formulation_in = FULL);
+  ~MPC();
+
+  // The workspaces of the solver and the matrices are owned by the MPC
+  MPC(const MPC &) = delete;
+  MPC &operator=(const MPC &) = delete;
+
+  // Formulations of the QP problem
+  static const int FULL = 0;       // States and forces of all feet, forces of feet in swing phase constrained to 0
+  static const int REDUCED = 1;    // States and forces of feet in contact only
+  static const int CONDENSED = 2;  // Forces of feet in contact only, dense problem solved by eiquadprog
 
   int create_matrices();
   int create_ML();
@@ -98,19 +193,55 @@ class MPC {
   int update_matrices(Eigen::MatrixXd fsteps);
   int update_ML(Eigen::MatrixXd fsteps);
   int update_NK();
+  int shift_warm_start();
+  int shift_warm_start_reduced();
+  int create_reduced_problem();
   int call_solver(int);
+  int call_solver_reduced(int);
+  int create_condensed_problem();
+  int call_solver_condensed();
   int retrieve_result();
   double *get_x_next();
+  int update_problem(int num_iter, const Eigen::MatrixXd &xref_in, const Eigen::MatrixXd &fsteps_in);
   int run(int num_iter, const Eigen::MatrixXd &xref_in, const Eigen::MatrixXd &fsteps_in);
+  void reset();
+  static std::vector<Eigen::MatrixXd> run_batch(double dt_in, int n_steps_in, double T_gait_in,
+                                                const std::vector<Eigen::MatrixXd> &xrefs,
+                                                const std::vector<Eigen::MatrixXd> &fsteps, int n_threads = 0,
+                                                int formulation_in = FULL);
 
   Eigen::Matrix<double, 3, 3> getSkew(Eigen::Matrix<double, 3, 1> v);
+  Eigen::Matrix<double, 3, 3> get_I_inv(double yaw);
+  int find_cached(int k, int n_rows);
   int construct_S();
+  void check_S();
+  void set_blocks(const Eigen::MatrixXd &blocks_in);
   int construct_gait(Eigen::MatrixXd fsteps_in);
 
   // Getters
   Eigen::MatrixXd get_latest_result();
   Eigen::MatrixXd get_gait();
   Eigen::MatrixXd get_Sgait();
+  int get_iter();
+  double get_solve_time();
+  const OSQPInfo *get_info();
+  int get_formulation() { return formulation; }
+  int get_n_variables();
+  int get_n_constraints();
+  Eigen::MatrixXd get_blocks() { return blocks.cast<double>(); }
+  int get_n_steps_dt() { return n_steps_dt; }
+
+  // Setters
+  void set_shifted_warm_start(bool enable) { shifted_warm_start = enable; }
+  bool get_shifted_warm_start() { return shifted_warm_start; }
+  void set_B_cache(bool enable) { use_B_cache = enable; }
+  void set_check_S_update(bool enable) { check_S_update = enable; }
+  void set_workspace_pool_size(int size);
+  int get_workspace_pool_size() { return workspace_pool_size; }
+  int get_n_setups() { return n_setups; }
+  int get_n_updates_A() { return n_updates_A; }
+  void set_setting(const std::string &name, double value);
+  double get_setting(const std::string &name);
 
 
   // Utils
@@ -0,0 +1,32 @@
+#ifndef OSQPSETTINGS_H_INCLUDED
+#define OSQPSETTINGS_H_INCLUDED
+
+#include <string>
+#include <vector>
+#include <stdexcept>
+#include "osqp_folder/include/osqp.h"
+
+/*
+Access by name to the settings of the OSQP solvers (MPC and QPWBC)
+
+Before the setup of the solver the settings are written in the settings structure given to osqp_setup.
+After the setup they are updated in the workspace with the osqp_update_* functions, the settings that
+cannot be updated (rho adaptation, sigma, scaling) raise an exception.
+*/
+
+// Names of the settings that can be accessed
+std::vector<std::string> get_osqp_setting_names();
+
+// Check that a setting exists and that it can be set (before the setup of the solver if initialized is false),
+// throw an exception otherwise
+void check_osqp_setting(const std::string &name, bool initialized);
+
+// Set a setting of the solver (work is only used if initialized is true)
+void set_osqp_setting(OSQPSettings *settings, OSQPWorkspace *work, bool initialized, const std::string &name,
+                      double value);
+
+// Get a setting of the solver (from the workspace if initialized is true)
+double get_osqp_setting(const OSQPSettings *settings, const OSQPWorkspace *work, bool initialized,
+                        const std::string &name);
+
+#endif  // OSQPSETTINGS_H_INCLUDED
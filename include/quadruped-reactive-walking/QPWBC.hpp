@@ -16,6 +16,7 @@
 #include "osqp_folder/include/util.h"
 #include "osqp_folder/include/osqp_configure.h"
 #include "other/st_to_cc.hpp"
+#include "quadruped-reactive-walking/OSQPSettings.hpp"
 
 class QPWBC {
  private:
@@ -93,6 +94,14 @@ class QPWBC {
   Eigen::MatrixXd get_f_res();
   Eigen::MatrixXd get_ddq_res();
   Eigen::MatrixXd get_H();
+  const OSQPInfo *get_info();
+  int get_iter();
+  int get_status();
+  double get_run_time();
+
+  // Settings of the OSQP solver
+  void set_setting(const std::string &name, double value);
+  double get_setting(const std::string &name);
 
   // Utils
   void my_print_csc_matrix(csc *M, const char *name);
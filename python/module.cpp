@@ -2,12 +2,54 @@
 #include "quadruped-reactive-walking/Planner.hpp"
 #include "quadruped-reactive-walking/InvKin.hpp"
 #include "quadruped-reactive-walking/QPWBC.hpp"
+#include "quadruped-reactive-walking/OSQPSettings.hpp"
 
 #include <eigenpy/eigenpy.hpp>
 #include <boost/python.hpp>
 
 namespace bp = boost::python;
 
+// Release the GIL for the lifetime of the object so that other Python threads can run during long C++ calls
+struct ScopedGILRelease {
+  ScopedGILRelease() { state_ = PyEval_SaveThread(); }
+  ~ScopedGILRelease() { PyEval_RestoreThread(state_); }
+
+ private:
+  PyThreadState* state_;
+};
+
+// Statistics of the last solve of an OSQP solver (empty dict before the first solve)
+bp::dict osqp_info_to_dict(const OSQPInfo* info) {
+  bp::dict stats;
+  if (info == OSQP_NULL) return stats;
+
+  stats["iter"] = info->iter;
+  stats["status"] = std::string(info->status);
+  stats["status_val"] = info->status_val;
+  stats["status_polish"] = info->status_polish;
+  stats["obj_val"] = info->obj_val;
+  stats["pri_res"] = info->pri_res;
+  stats["dua_res"] = info->dua_res;
+  stats["setup_time"] = info->setup_time;
+  stats["solve_time"] = info->solve_time;
+  stats["update_time"] = info->update_time;
+  stats["polish_time"] = info->polish_time;
+  stats["run_time"] = info->run_time;
+  stats["rho_updates"] = info->rho_updates;
+  stats["rho_estimate"] = info->rho_estimate;
+  return stats;
+}
+
+// All the settings of an OSQP solver by name
+template <typename Solver>
+bp::dict osqp_settings_to_dict(Solver& solver) {
+  bp::dict settings;
+  for (const std::string& name : get_osqp_setting_names()) {
+    settings[name] = solver.get_setting(name);
+  }
+  return settings;
+}
+
 template <typename MPC>
 struct MPCPythonVisitor : public bp::def_visitor<MPCPythonVisitor<MPC> > {
   template <class PyClassMPC>
@@ -15,17 +57,103 @@ struct MPCPythonVisitor : public bp::def_visitor<MPCPythonVisitor<MPC> > {
     cl.def(bp::init<>(bp::arg(""), "Default constructor."))
         .def(bp::init<double, int, double>(bp::args("dt_in", "n_steps_in", "T_gait_in"),
                                            "Constructor with parameters."))
+        .def(bp::init<double, int, double, int>(bp::args("dt_in", "n_steps_in", "T_gait_in", "formulation_in"),
+                                                "Constructor with parameters and formulation (MPC.FULL, "
+                                                "MPC.REDUCED or MPC.CONDENSED).\n"))
+        .def(bp::init<double, const Eigen::MatrixXd&, double, int>(
+            bp::args("dt_in", "blocks_in", "T_gait_in", "formulation_in"),
+            "Constructor with the number of time steps of each node of the horizon (move blocking) and "
+            "formulation.\n"))
 
         // Run MPC from Python
-        .def("run", &MPC::run, bp::args("num_iter", "xref_in", "fsteps_in"), "Run MPC from Python.\n")
+        .def("run", &MPCPythonVisitor::run, bp::args("self", "num_iter", "xref_in", "fsteps_in"),
+             "Run MPC from Python (the GIL is released during the solve).\n")
+        .def("run_batch", &MPCPythonVisitor::run_batch,
+             (bp::arg("dt_in"), bp::arg("n_steps_in"), bp::arg("T_gait_in"), bp::arg("xrefs"), bp::arg("fsteps"),
+              bp::arg("n_threads") = 0, bp::arg("formulation_in") = (int)MPC::FULL),
+             "Solve a batch of problems (Bx12xN+1 xrefs and Bx20x13 fsteps) with several threads and return the "
+             "Bx24xN results (the GIL is released during the solves).\n")
+        .staticmethod("run_batch")
+        .def("reset", &MPC::reset,
+             "Forget the previous problems, the next one (num_iter = 0) is solved as by a new MPC.\n")
         .def("get_latest_result", &MPC::get_latest_result,
              "Get latest result (predicted trajectory + forces to apply).\n")
         .def("get_gait", &MPC::get_gait, "Get gait matrix.\n")
-        .def("get_Sgait", &MPC::get_Sgait, "Get S_gait matrix.\n");
+        .def("get_Sgait", &MPC::get_Sgait, "Get S_gait matrix.\n")
+        .def("get_iter", &MPC::get_iter, "Get number of iterations of the solver during the last solve.\n")
+        .def("get_solve_time", &MPC::get_solve_time, "Get duration of the last solve (s).\n")
+        .def("get_formulation", &MPC::get_formulation, "Get formulation of the QP problem.\n")
+        .def("get_n_variables", &MPC::get_n_variables, "Get number of variables of the last QP problem.\n")
+        .def("get_n_constraints", &MPC::get_n_constraints, "Get number of constraints of the last QP problem.\n")
+        .def("get_blocks", &MPC::get_blocks, "Get number of time steps of each node of the horizon.\n")
+        .def("get_n_steps_dt", &MPC::get_n_steps_dt, "Get number of time steps of the horizon.\n")
+
+        // Warm start of the solver
+        .def("set_shifted_warm_start", &MPC::set_shifted_warm_start, bp::args("self", "enable"),
+             "Warm start the solver with the previous solution shifted by one time step.\n")
+        .def("get_shifted_warm_start", &MPC::get_shifted_warm_start,
+             "Get whether the solver is warm started with the shifted previous solution.\n")
+        .def("set_B_cache", &MPC::set_B_cache, bp::args("self", "enable"),
+             "Reuse the coefficients of B of time steps with the same yaw, position and footholds (default).\n")
+        .def("set_check_S_update", &MPC::set_check_S_update, bp::args("self", "enable"),
+             "Check the incremental update of the contact state of the nodes against a full rebuild (raises an "
+             "exception if they differ).\n")
+        .def("set_workspace_pool_size", &MPC::set_workspace_pool_size, bp::args("self", "size"),
+             "Set the maximum number of workspaces of the solver kept for the contact sequences (1 by default).\n")
+        .def("get_workspace_pool_size", &MPC::get_workspace_pool_size,
+             "Get the maximum number of workspaces of the solver kept for the contact sequences.\n")
+        .def("get_n_setups", &MPC::get_n_setups, "Get number of setups of a workspace of the solver.\n")
+        .def("get_n_updates_A", &MPC::get_n_updates_A,
+             "Get number of updates of the constraint matrix in the solver (factorizations).\n")
+
+        // Settings and statistics of the OSQP solver
+        .def("set_setting", &MPC::set_setting, bp::args("self", "name", "value"),
+             "Set a setting of the OSQP solver (some of them only before the first solve).\n")
+        .def("get_setting", &MPC::get_setting, bp::args("self", "name"), "Get a setting of the OSQP solver.\n")
+        .def("get_settings", &MPCPythonVisitor::get_settings, "Get all the settings of the OSQP solver.\n")
+        .def("get_solver_stats", &MPCPythonVisitor::get_solver_stats,
+             "Get the statistics of the last solve (iterations, status, residuals, timings).\n");
+  }
+
+  static bp::dict get_settings(MPC& self) { return osqp_settings_to_dict(self); }
+
+  static bp::dict get_solver_stats(MPC& self) { return osqp_info_to_dict(self.get_info()); }
+
+  static int run(MPC& self, int num_iter, const Eigen::MatrixXd& xref_in, const Eigen::MatrixXd& fsteps_in) {
+    ScopedGILRelease release;
+    return self.run(num_iter, xref_in, fsteps_in);
+  }
+
+  static bp::object run_batch(double dt_in, int n_steps_in, double T_gait_in, bp::object xrefs, bp::object fsteps,
+                              int n_threads, int formulation_in) {
+    std::vector<Eigen::MatrixXd> xrefs_in, fsteps_in;
+    for (int i = 0; i < bp::len(xrefs); i++) {
+      xrefs_in.push_back(bp::extract<Eigen::MatrixXd>(xrefs[i]));
+    }
+    for (int i = 0; i < bp::len(fsteps); i++) {
+      fsteps_in.push_back(bp::extract<Eigen::MatrixXd>(fsteps[i]));
+    }
+
+    std::vector<Eigen::MatrixXd> results;
+    {
+      ScopedGILRelease release;
+      results = MPC::run_batch(dt_in, n_steps_in, T_gait_in, xrefs_in, fsteps_in, n_threads, formulation_in);
+    }
+
+    bp::list results_list;
+    for (const Eigen::MatrixXd& result : results) {
+      results_list.append(result);
+    }
+    bp::object np = bp::import("numpy");
+    return np.attr("reshape")(np.attr("array")(results_list), bp::make_tuple(results.size(), 24, n_steps_in));
   }
 
   static void expose() {
-    bp::class_<MPC>("MPC", bp::no_init).def(MPCPythonVisitor<MPC>());
+    bp::class_<MPC, boost::noncopyable>("MPC", bp::no_init)
+        .def(MPCPythonVisitor<MPC>())
+        .setattr("FULL", (int)MPC::FULL)
+        .setattr("REDUCED", (int)MPC::REDUCED)
+        .setattr("CONDENSED", (int)MPC::CONDENSED);
 
     ENABLE_SPECIFIC_MATRIX_TYPE(matXd);
   }
@@ -42,6 +170,7 @@ struct PlannerPythonVisitor : public bp::def_visitor<PlannerPythonVisitor<Planne
             bp::args("dt_in", "dt_tsid_in", "T_gait_in", "T_mpc_in", "k_mpc_in", "on_solo8_in", "h_ref_in",
                      "fsteps_in"),
             "Constructor with parameters."))
+        .def(bp::init<const Planner&>(bp::args("other"), "Copy constructor."))
 
         .def("get_xref", &Planner::get_xref, "Get xref matrix.\n")
         .def("get_fsteps", &Planner::get_fsteps, "Get fsteps matrix.\n")
@@ -101,10 +230,25 @@ struct QPWBCPythonVisitor : public bp::def_visitor<QPWBCPythonVisitor<QPWBC> > {
         .def("get_ddq_res", &QPWBC::get_ddq_res, "Get acceleration goals matrix.\n")
         .def("get_H", &QPWBC::get_H, "Get H weight matrix.\n")
 
+        // Settings and statistics of the OSQP solver
+        .def("set_setting", &QPWBC::set_setting, bp::args("self", "name", "value"),
+             "Set a setting of the OSQP solver (some of them only before the first solve).\n")
+        .def("get_setting", &QPWBC::get_setting, bp::args("self", "name"), "Get a setting of the OSQP solver.\n")
+        .def("get_settings", &QPWBCPythonVisitor::get_settings, "Get all the settings of the OSQP solver.\n")
+        .def("get_solver_stats", &QPWBCPythonVisitor::get_solver_stats,
+             "Get the statistics of the last solve (iterations, status, residuals, timings).\n")
+        .def("get_iter", &QPWBC::get_iter, "Get number of iterations of the solver during the last solve.\n")
+        .def("get_status", &QPWBC::get_status, "Get the status of the solver after the last solve.\n")
+        .def("get_run_time", &QPWBC::get_run_time, "Get the duration of the last solve (setup and solve) [s].\n")
+
         // Run QPWBC from Python
         .def("run", &QPWBC::run, bp::args("M", "Jc", "f_cmd", "RNEA", "k_contacts"), "Run QPWBC from Python.\n");
   }
 
+  static bp::dict get_settings(QPWBC& self) { return osqp_settings_to_dict(self); }
+
+  static bp::dict get_solver_stats(QPWBC& self) { return osqp_info_to_dict(self.get_info()); }
+
   static void expose() {
     bp::class_<QPWBC>("QPWBC", bp::no_init).def(QPWBCPythonVisitor<QPWBC>());
 
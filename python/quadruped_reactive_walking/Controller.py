@@ -85,6 +85,22 @@ class Controller:
         self.t_list_InvKin = [0] * int(N_SIMULATION)
         self.t_list_QPWBC = [0] * int(N_SIMULATION)
 
+        # List to log the wakeup latency of the asynchronous MPC
+        self.t_list_mpc_wakeup = [0] * int(N_SIMULATION)
+
+        # List to log the age of the MPC result used by the control loop (in control ticks)
+        self.list_mpc_result_age = [0] * int(N_SIMULATION)
+
+        # List to log when the time-shifted previous result of the MPC is used because a solve is late
+        self.list_mpc_fallback = [False] * int(N_SIMULATION)
+
+        # Lists to log the number of iterations and the status code of the solver of the MPC for its last result
+        self.list_mpc_iter = [0] * int(N_SIMULATION)
+        self.list_mpc_status = [0] * int(N_SIMULATION)
+
+        # List to log the effective frequency of the MPC (from the interval between its last two solves)
+        self.list_mpc_frequency = [0.0] * int(N_SIMULATION)
+
         # Init joint torques to correct shape
         self.jointTorques = np.zeros((12, 1))
 
@@ -118,9 +134,52 @@ class Controller:
 
         # Wrapper that makes the link with the solver that you want to use for the MPC
         # First argument to True to have PA's MPC, to False to have Thomas's MPC
+        # The MPC runs in a parallel process if multiprocessing is enabled, otherwise in a thread of the control
+        # process if multithreading is enabled, otherwise it is solved directly by the control loop
         self.enable_multiprocessing = True
+        self.enable_multithreading = False
+        # If the result of the parallel MPC is not received within this delay the previous one is shifted in time
+        self.mpc_deadline = 0.9 * dt_mpc
+        # Options of the solver of the MPC (see MPC_Backends), the shifted warm start of the OSQP MPC can be compared
+        # with the default one with benchmark_warm_start.py and the reduced formulation with the full one with
+        # check_reduced_mpc.py. The OSQP settings trade accuracy for latency, e.g. {"max_iter": 200, "eps_abs": 1e-4}
+        # and move blocking reduces the number of nodes of the horizon, e.g. "blocks": [1] * 8 + [2] * 4 + [4] * 4 for
+        # T_mpc = 0.64 s (see benchmark-MPC for the latency against the horizon). A pool of solver workspaces, e.g.
+        # "workspace_pool": 16, reuses the factorizations of the periodic contact sequence when trotting in place
+        self.mpc_options = {"formulation": "full", "shifted_warm_start": False, "settings": {}}
         self.mpc_wrapper = MPC_Wrapper.MPC_Wrapper(type_MPC, dt_mpc, np.int(T_mpc/dt_mpc),
-                                                   k_mpc, T_mpc, self.q, self.enable_multiprocessing)
+                                                   k_mpc, T_mpc, self.q, self.enable_multiprocessing,
+                                                   self.enable_multithreading, self.mpc_deadline, self.mpc_options)
+
+        # Adaptive rate of the MPC: instead of once every k_mpc iterations, a solve is triggered as soon as the
+        # previous one has completed, at most once every k_mpc_min iterations and at least once every k_mpc_max
+        # iterations of the control loop. The reference trajectory is aligned with the start of the solve. It is meant
+        # for the parallel MPC, the synchronous one is solved once every k_mpc_min iterations.
+        self.enable_adaptive_mpc = False
+        self.k_mpc_min = max(1, k_mpc // 4)
+        self.k_mpc_max = 2 * k_mpc
+        self.k_last_mpc = 0  # Iteration of the last solve
+        self.mpc_frequency = 1.0 / dt_mpc  # Effective frequency of the MPC
+        self.n_mpc_solves = 0  # Number of solves since the start
+
+        # Placement of the processes: CPU cores they can run on (None to keep the default affinity) and SCHED_FIFO
+        # priority (None to keep the default policy). Real-time priorities require the CAP_SYS_NICE capability,
+        # without it the default policy is kept.
+        self.scheduling = {"control": (None, None), "mpc": (None, None), "gamepad": (None, None),
+                           "clone": (None, None)}
+        self.mpc_wrapper.set_scheduling("mpc", *self.scheduling["mpc"])
+
+        # Speculative MPC: changes of gait are delayed by a few iterations of the MPC during which a second parallel
+        # MPC solves the problem after the change, it replaces the first one when the change is committed
+        self.enable_speculative_mpc = False
+        self.mpc_wrapper_spec = None
+        if self.enable_speculative_mpc and (self.enable_multiprocessing or self.enable_multithreading):
+            self.planner.gait_change_delay = 3
+            self.mpc_wrapper_spec = MPC_Wrapper.MPC_Wrapper(type_MPC, dt_mpc, np.int(T_mpc/dt_mpc),
+                                                            k_mpc, T_mpc, self.q, self.enable_multiprocessing,
+                                                            self.enable_multithreading, self.mpc_deadline,
+                                                            self.mpc_options)
+            self.mpc_wrapper_spec.set_scheduling("mpc (spec)", *self.scheduling["mpc"])
 
         # ForceMonitor to display contact forces in PyBullet with red lines
         # import ForceMonitor
@@ -129,6 +188,14 @@ class Controller:
         # Define the default controller
         self.myController = wbc_controller(dt_wbc, N_SIMULATION)
 
+        # The MPC processes have been started with their wrapper and have created their solver in the meantime
+        for wrapper in [self.mpc_wrapper, self.mpc_wrapper_spec]:
+            if wrapper is not None and wrapper.multiprocessing:
+                if wrapper.wait_ready():
+                    print("MPC process ready, resident memory: {:.1f} MB".format(wrapper.get_worker_rss() / 1e6))
+                else:
+                    print("MPC process not ready, it will be restarted by the supervision if needed")
+
         self.envID = envID
         self.velID = velID
         self.dt_wbc = dt_wbc
@@ -212,22 +279,36 @@ class Controller:
                                  self.v[0:6, 0:1].copy(), self.joystick.v_ref, self.q_estim[2, 0], 0.0, self.joystick)
         t_planner = time.time()
 
-        # Process MPC once every k_mpc iterations of TSID
-        if (self.k % self.k_mpc) == 0:
+        # Process MPC once every k_mpc iterations of TSID, or as soon as the previous solve has completed with the
+        # adaptive rate (a committed change of gait is always solved right away)
+        if self.enable_adaptive_mpc:
+            elapsed = self.k - self.k_last_mpc
+            solve_mpc = (self.k == 0) or (elapsed >= self.k_mpc_max) or self.planner.gait_change_committed \
+                or (elapsed >= self.k_mpc_min and not self.mpc_wrapper.pending)
+        else:
+            solve_mpc = (self.k % self.k_mpc) == 0
+        if solve_mpc:
+            if self.k > 0:
+                self.mpc_frequency = 1.0 / ((self.k - self.k_last_mpc) * self.dt_wbc)
+            self.k_last_mpc = self.k
+            self.n_mpc_solves += 1
+            if self.planner.gait_change_committed and self.mpc_wrapper_spec is not None:
+                # The speculative MPC has been solving the problem after the change of gait, it is already warm
+                self.mpc_wrapper, self.mpc_wrapper_spec = self.mpc_wrapper_spec, self.mpc_wrapper
             try:
                 self.mpc_wrapper.solve(self.k, self.planner)
+                if self.planner.speculative is not None and self.mpc_wrapper_spec is not None:
+                    self.mpc_wrapper_spec.solve(self.k, self.planner.speculative)
             except ValueError:
                 print("MPC Problem")
 
+        # Keep track of the results of the speculative MPC so that they are up to date when it takes over
+        if self.planner.speculative is not None and self.mpc_wrapper_spec is not None:
+            self.mpc_wrapper_spec.get_latest_result(self.k)
+
         # Retrieve reference contact forces
-        if self.enable_multiprocessing or (self.k == 0):
-            # Check if the MPC has outputted a new result
-            self.x_f_mpc = self.mpc_wrapper.get_latest_result()
-        else:
-            print("TODO: Check non multiprocessing mode.")
-            self.joystick.stop = True
-            # if (self.k % self.k_mpc) == 2:  # Mimic a 4 ms delay
-            #     self.f_applied = self.mpc_wrapper.get_latest_result()
+        # Check if the MPC has outputted a new result (directly the result of the solve in synchronous mode)
+        self.x_f_mpc = self.mpc_wrapper.get_latest_result(self.k)
         t_mpc = time.time()
 
         # Target state for the whole body control
@@ -326,6 +407,33 @@ class Controller:
             self.result.v_des[:] = np.zeros(12)
             self.result.tau_ff[:] = np.zeros(12)
 
+    def apply_scheduling(self, clone_pid=None):
+        """Apply the placement defined in self.scheduling to the gamepad process, the clone process and the control
+        loop, then print the placement of all processes (the MPC is placed when its scheduling is set)
+
+        The control loop is placed last so that the processes started before do not inherit its affinity.
+
+        Args:
+            clone_pid (int): id of the clone process (None if there is no clone)
+        """
+
+        report = []
+        for wrapper in [self.mpc_wrapper, self.mpc_wrapper_spec]:
+            if wrapper is not None and wrapper.scheduling_report is not None:
+                report.append(wrapper.scheduling_report)
+        if hasattr(self.joystick, "gp"):
+            report.append(utils_mpc.set_process_scheduling("gamepad", self.joystick.gp.process.pid,
+                                                           *self.scheduling["gamepad"]))
+        if clone_pid is not None:
+            report.append(utils_mpc.set_process_scheduling("clone", clone_pid, *self.scheduling["clone"]))
+        report.append(utils_mpc.set_process_scheduling("control", 0, *self.scheduling["control"]))
+
+        print("Placement of the processes:")
+        for line in report:
+            print("  " + line)
+
+        return 0
+
     def log_misc(self, tic, t_filter, t_planner, t_mpc, t_wbc):
 
         # Log joystick command
@@ -339,3 +447,9 @@ class Controller:
         self.t_list_loop[self.k] = time.time() - tic
         self.t_list_InvKin[self.k] = self.myController.tac - self.myController.tic
         self.t_list_QPWBC[self.k] = self.myController.toc - self.myController.tac
+        self.t_list_mpc_wakeup[self.k] = self.mpc_wrapper.get_wakeup_latency()[0]
+        self.list_mpc_result_age[self.k] = self.mpc_wrapper.get_result_age(self.k)
+        self.list_mpc_fallback[self.k] = self.mpc_wrapper.fallback
+        self.list_mpc_iter[self.k] = self.mpc_wrapper.result_iter
+        self.list_mpc_status[self.k] = self.mpc_wrapper.result_status
+        self.list_mpc_frequency[self.k] = self.mpc_frequency
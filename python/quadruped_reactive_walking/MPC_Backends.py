@@ -0,0 +1,318 @@
+# coding: utf8
+
+import abc
+import numpy as np
+
+
+class Dummy:
+    """Dummy class to store variables"""
+
+    def __init__(self):
+
+        self.xref = None  # Desired trajectory
+        self.fsteps = None  # Desired location of footsteps
+
+        pass
+
+
+class MPC_Backend(abc.ABC):
+    """Common interface of the solvers that can be used by MPC_Wrapper. Each backend solves the MPC problem for
+    the desired trajectory and footsteps of the planner and outputs the result in the format of the OSQP MPC.
+    A backend that does not implement solve cannot be created.
+
+    Args:
+        dt (float): Time step of the MPC
+        n_steps (int): Number of time steps in the prediction horizon
+        k_mpc (int): Number of inv dyn time step for one iteration of the MPC
+        T_gait (float): Duration of one period of gait
+        options (dict): options of the backend (see the documentation of each backend)
+    """
+
+    def __init__(self, dt, n_steps, k_mpc, T_gait, options=None):
+
+        self.dt = dt
+        self.n_steps = n_steps
+        self.k_mpc = k_mpc
+        self.T_gait = T_gait
+        self.options = {} if options is None else options
+
+        # Number of solves since the creation of the backend (the first one sets the solver up)
+        self.n_solves = 0
+
+        # Predicted trajectory (12 first lines) and contact forces (12 last lines) over the prediction horizon
+        self.result = np.zeros((24, n_steps))
+
+    @abc.abstractmethod
+    def solve(self, k, xref, fsteps):
+        """Solve the MPC problem
+
+        Args:
+            k (int): Number of inv dynamics iterations since the start of the simulation
+            xref (12xN+1 array): current state (first column) and desired trajectory of the base
+            fsteps (20x13 array): duration of each phase of the gait (first column) and location of footsteps
+                                  (nan replaced by 0.0)
+        """
+
+    def get_latest_result(self):
+        """Return the predicted trajectory (12 first lines) and the desired contact forces (12 last lines)
+        computed by the last solve (24xN array)
+        """
+
+        return self.result
+
+    def get_solver_stats(self):
+        """Return the statistics of the last solve as a dict (empty if the solver does not report them)
+        """
+
+        return {}
+
+    def get_solver_health(self):
+        """Return the number of iterations and the status code of the last solve (0 if the solver does not report
+        them)
+        """
+
+        stats = self.get_solver_stats()
+
+        return stats.get("iter", 0), stats.get("status_val", 0)
+
+
+class OSQP_Backend(MPC_Backend):
+    """OSQP MPC of libquadruped_reactive_walking
+
+    Options:
+        formulation (string): "full" (forces of all feet, the ones in swing phase are constrained to zero),
+                              "reduced" (forces of the feet in contact only, smaller problem set up again when the
+                              contact sequence changes) or "condensed" (states eliminated, dense problem with the
+                              forces of the feet in contact solved by eiquadprog, for short horizons)
+        shifted_warm_start (bool): warm start the solver with the previous solution shifted by one time step
+        settings (dict): settings of the OSQP solver by name (eps_abs, eps_rel, max_iter, time_limit, polish,
+                         adaptive_rho, ...), see get_settings of the MPC for the available ones
+        workspace_pool (int): number of workspaces of the solver kept for the contact sequences of the gait, the
+                              periodic contact sequence reuses them instead of updating or setting up a single one
+        blocks (list): number of time steps of each node of the horizon (move blocking, n_steps time steps in
+                       total), one node per time step if None. The result is interpolated back to one column per
+                       time step.
+    """
+
+    def __init__(self, dt, n_steps, k_mpc, T_gait, options=None):
+
+        super().__init__(dt, n_steps, k_mpc, T_gait, options)
+
+        import libquadruped_reactive_walking as MPC
+        formulations = {"full": MPC.MPC.FULL, "reduced": MPC.MPC.REDUCED, "condensed": MPC.MPC.CONDENSED}
+        formulation = self.options.get("formulation", "full")
+        if formulation not in formulations:
+            raise ValueError("Unknown formulation " + formulation + ", available formulations: " +
+                             ", ".join(formulations))
+        self.blocks = self.options.get("blocks", None)
+        if self.blocks is None:
+            self.mpc = MPC.MPC(dt, n_steps, T_gait, formulations[formulation])
+        else:
+            if np.sum(self.blocks) != n_steps:
+                raise ValueError("The blocks should last " + str(n_steps) + " time steps in total")
+            self.mpc = MPC.MPC(dt, np.array(self.blocks, dtype=float).reshape((-1, 1)), T_gait,
+                               formulations[formulation])
+            self.i_nodes = np.cumsum(self.blocks)
+        self.mpc.set_shifted_warm_start(self.options.get("shifted_warm_start", False))
+        self.mpc.set_workspace_pool_size(self.options.get("workspace_pool", 1))
+        for name, value in self.options.get("settings", {}).items():
+            self.mpc.set_setting(name, value)
+
+    def solve(self, k, xref, fsteps):
+
+        # The matrices and the solver are created during the first solve, then they are updated
+        self.mpc.run(self.n_solves, xref, fsteps)
+        self.n_solves += 1
+        if self.blocks is None:
+            self.result = self.mpc.get_latest_result()
+        else:
+            # States interpolated between the ends of the nodes (the first node starts from the current state)
+            # and forces held during each node
+            result = self.mpc.get_latest_result()
+            steps = np.arange(1, self.n_steps + 1)
+            for i in range(12):
+                self.result[i, :] = np.interp(steps, np.concatenate(([0], self.i_nodes)),
+                                              np.concatenate(([xref[i, 0]], result[i, :])))
+            self.result[12:, :] = np.repeat(result[12:, :], self.blocks, axis=1)
+
+        return 0
+
+    def get_solver_stats(self):
+
+        return self.mpc.get_solver_stats()
+
+
+class DDP_Backend(MPC_Backend):
+    """Common options of the backends of the crocoddyl MPC wrappers (crocoddyl_class), each one creates its wrapper
+    with nthreads and gives it to set_mpc
+
+    Options:
+        time_budget (float): duration allowed for each solve (s), the solver stops iterating at the deadline or
+                             when the cost stalls and keeps its best feasible iterate. None for a fixed number of
+                             iterations.
+        stall_threshold (float): minimum relative decrease of the cost for an iteration with a time budget
+        nthreads (int): number of threads used by crocoddyl to compute the models of the nodes
+    """
+
+    def __init__(self, dt, n_steps, k_mpc, T_gait, options=None):
+
+        super().__init__(dt, n_steps, k_mpc, T_gait, options)
+
+        self.nthreads = self.options.get("nthreads", 1)
+        self.mpc = None
+
+    def set_mpc(self, mpc):
+        """Set the wrapper of the backend and give it the time budget of the solves
+
+        Args:
+            mpc (utils_ddp.BudgetedDDP): crocoddyl MPC wrapper
+        """
+
+        mpc.time_budget = self.options.get("time_budget", None)
+        mpc.stall_threshold = self.options.get("stall_threshold", mpc.stall_threshold)
+        self.mpc = mpc
+
+    def get_solver_stats(self):
+
+        return {"iter": self.mpc.solve_iterations, "solve_time": self.mpc.solve_time}
+
+
+class Crocoddyl_Backend(DDP_Backend):
+    """DDP MPC of crocoddyl_class.MPC_crocoddyl (options of DDP_Backend)
+    """
+
+    def __init__(self, dt, n_steps, k_mpc, T_gait, options=None):
+
+        super().__init__(dt, n_steps, k_mpc, T_gait, options)
+
+        from crocoddyl_class.MPC_crocoddyl import MPC_crocoddyl
+        self.set_mpc(MPC_crocoddyl(dt=dt, T_mpc=T_gait, mu=0.9, inner=False, linearModel=True,
+                                   n_period=int((dt * n_steps)/T_gait), nthreads=self.nthreads))
+        self.planner = Dummy()
+
+    def solve(self, k, xref, fsteps):
+
+        self.planner.xref = xref
+        self.planner.fsteps = fsteps
+        # No warm start during the first solve
+        self.mpc.solve(self.n_solves, self.planner)
+        self.n_solves += 1
+
+        self.result[0:12, :] = self.mpc.get_xrobot()
+        self.result[12:, :] = self.mpc.get_fpredicted()
+
+        return 0
+
+
+class Crocoddyl_2_Backend(DDP_Backend):
+    """DDP MPC of crocoddyl_class.MPC_crocoddyl_2, its first nodes have the time step of the control loop
+
+    The current state is the first column of xref and the reference velocity is taken from its second column.
+
+    Options (and the ones of DDP_Backend):
+        persistent (bool): update the action models, shooting problem and solver in place instead of creating new
+                           ones at each solve
+    """
+
+    def __init__(self, dt, n_steps, k_mpc, T_gait, options=None):
+
+        super().__init__(dt, n_steps, k_mpc, T_gait, options)
+
+        from crocoddyl_class.MPC_crocoddyl_2 import MPC_crocoddyl_2
+        self.set_mpc(MPC_crocoddyl_2(dt=dt, T_mpc=T_gait, mu=0.9, inner=False, linearModel=True,
+                                     n_period=int((dt * n_steps)/T_gait), dt_tsid=dt/k_mpc,
+                                     persistent=self.options.get("persistent", False), nthreads=self.nthreads))
+        self.v_ref = np.zeros((6, 1))
+
+        # Time of the nodes of the OSQP MPC
+        self.t_nodes = dt * np.arange(1, n_steps + 1)
+
+    def solve(self, k, xref, fsteps):
+
+        self.v_ref[:, 0] = xref[6:12, 1]
+        self.mpc.updateProblem(k, fsteps, xref, xref[0:3, 0:1], xref[3:6, 0:1], xref[6:9, 0:1], xref[9:12, 0:1],
+                               self.v_ref, xref[2, 1])
+        # The number of nodes changes with the time remaining before the next iteration of the MPC, so there is no
+        # warm start
+        self.mpc.solve_ddp([], [])
+        self.n_solves += 1
+
+        # Result at the nodes that are the closest to the nodes of the OSQP MPC
+        xs = self.mpc.get_xrobot()
+        us = self.mpc.get_fpredicted()
+        idx = np.clip(np.searchsorted(self.mpc.dt_vector[1:], self.t_nodes - 1e-6), 0, xs.shape[1] - 1)
+        self.result[0:12, :] = xs[:, idx]
+        self.result[12:, :] = us[:, idx]
+
+        return 0
+
+
+class Crocoddyl_Planner_Backend(DDP_Backend):
+    """DDP MPC of crocoddyl_class.MPC_crocoddyl_planner that also optimizes the location of footsteps with its own
+    gait. The position of the feet is taken from the first footsteps of the planner (options of DDP_Backend).
+    """
+
+    def __init__(self, dt, n_steps, k_mpc, T_gait, options=None):
+
+        super().__init__(dt, n_steps, k_mpc, T_gait, options)
+
+        from crocoddyl_class.MPC_crocoddyl_planner import MPC_crocoddyl_planner
+        self.set_mpc(MPC_crocoddyl_planner(dt=dt, T_mpc=T_gait, n_periods=int((dt * n_steps)/T_gait),
+                                           nthreads=self.nthreads))
+        self.l_feet = np.zeros((3, 4))
+
+    def solve(self, k, xref, fsteps):
+
+        # Position of each foot in its first phase with a footstep
+        for i in range(4):
+            index = np.flatnonzero(fsteps[:, 1+3*i])
+            if index.size > 0:
+                self.l_feet[:, i] = fsteps[index[0], (1+3*i):(4+3*i)]
+
+        # The gait of the planner MPC is moved one step further at each solve after the first one
+        self.mpc.solve(self.n_solves, xref, self.l_feet)
+        self.n_solves += 1
+
+        # States and forces without the step nodes
+        self.result[0:12, :] = self.mpc.Xs[0:12, :]
+        self.result[12:, :] = self.mpc.Us[:, 0:self.n_steps]
+
+        return 0
+
+
+# Available backends by name
+backends = {"osqp": OSQP_Backend,
+            "crocoddyl": Crocoddyl_Backend,
+            "crocoddyl_2": Crocoddyl_2_Backend,
+            "crocoddyl_planner": Crocoddyl_Planner_Backend}
+
+
+def get_backend_name(mpc_type):
+    """Return the name of the backend for a type of MPC, given either as a name or as a boolean (True for the OSQP
+    MPC, False for the crocoddyl MPC)
+
+    Args:
+        mpc_type (bool or string): type of MPC
+    """
+
+    if isinstance(mpc_type, str):
+        if mpc_type not in backends:
+            raise ValueError("Unknown MPC backend " + mpc_type + ", available backends: " + ", ".join(backends))
+        return mpc_type
+
+    return "osqp" if mpc_type else "crocoddyl"
+
+
+def create_backend(mpc_type, dt, n_steps, k_mpc, T_gait, options=None):
+    """Create a backend of the MPC
+
+    Args:
+        mpc_type (bool or string): type of MPC (name of the backend, True for OSQP, False for crocoddyl)
+        dt (float): Time step of the MPC
+        n_steps (int): Number of time steps in the prediction horizon
+        k_mpc (int): Number of inv dyn time step for one iteration of the MPC
+        T_gait (float): Duration of one period of gait
+        options (dict): options of the backend (None for the default ones)
+    """
+
+    return backends[get_backend_name(mpc_type)](dt, n_steps, k_mpc, T_gait, options)
@@ -0,0 +1,144 @@
+# coding: utf8
+
+import os
+import time
+import numpy as np
+from multiprocessing import shared_memory
+from MPC_Backends import create_backend
+
+# This module is the entry point of the parallel process of the MPC, started with forkserver or spawn. It only imports
+# what the MPC needs (numpy and the solver of the backend). multiprocessing also imports the main script again in the
+# process (as __mp_main__), so the scripts that start the MPC import the modules of the control loop in their functions.
+
+
+class MPC_Worker:
+    """Parallel process with an infinite loop that runs the asynchronous MPC
+
+    Inputs and outputs of the asynchronous MPC are exchanged through numpy views of the shared memory blocks
+    created by MPC_Wrapper, attached by name (k_shared, xref_shared, fsteps_shared, result_shared, ...).
+    Results are published with a sequence number, see publish_result
+
+    Args:
+        mpc_type (string): name of the backend of the MPC
+        dt (float): Time step of the MPC
+        n_steps (int): Number of time steps in the prediction horizon
+        k_mpc (int): Number of inv dyn time step for one iteration of the MPC
+        T_gait (float): Duration of one period of gait
+        options (dict): options of the backend
+        shm_names (dict): name of the shared memory block and shape of each shared array
+        newData (Event): shared event that is set by the control loop when new data is available
+        running (Value): shared variable to stop the infinite loop when set to False
+        t_notify (Value): time at which the control loop has signaled new data
+        wakeup_latency (Value): delay between the signal and the wakeup of the MPC
+        wakeup_latency_max (Value): maximum of this delay since the start
+    """
+
+    def __init__(self, mpc_type, dt, n_steps, k_mpc, T_gait, options, shm_names, newData, running, t_notify,
+                 wakeup_latency, wakeup_latency_max):
+
+        self.newData = newData
+        self.running = running
+        self.t_notify = t_notify
+        self.wakeup_latency = wakeup_latency
+        self.wakeup_latency_max = wakeup_latency_max
+
+        # Attach the shared memory blocks (the references to the blocks are kept to keep the views valid)
+        self.shm_blocks = []
+        for key, (name, shape) in shm_names.items():
+            shm = shared_memory.SharedMemory(name=name)
+            self.shm_blocks.append(shm)
+            setattr(self, key, np.ndarray(shape, dtype=np.float64, buffer=shm.buf))
+
+        # Local copies of the inputs so that the control loop can write new data while the MPC is running
+        self.xref = np.zeros((12, n_steps+1))
+        self.fsteps = np.zeros((20, 13))
+
+        # Create the MPC before the first data arrives so that the control loop does not wait for it
+        self.loop_mpc = create_backend(mpc_type, dt, n_steps, k_mpc, T_gait, options)
+
+        # Signal that the MPC is ready and report the memory used by the process
+        with open("/proc/self/statm") as f:
+            self.worker_info[1] = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        self.worker_info[0] = 1.0
+
+    def run(self):
+        """Solve the MPC each time the control loop sends new data until running is set to False
+        """
+
+        seq = int(self.result_published[1])  # Sequence number of the last published result
+
+        # A previous MPC process may have been killed while writing in the buffer that is not published
+        for i in range(2):
+            if self.result_info_shared[i, 0] % 2 == 1.0:
+                self.result_info_shared[i, 0] += 1.0
+
+        while self.running.value:
+            self.heartbeat[0] += 1.0
+
+            # Sleep until new data is available to trigger the asynchronous MPC
+            # (timeout to regularly check if the process should stop)
+            if self.newData.wait(0.1):
+
+                # Measure the delay between the signal of the control loop and the wakeup
+                latency = time.time() - self.t_notify.value
+                self.wakeup_latency.value = latency
+                if latency > self.wakeup_latency_max.value:
+                    self.wakeup_latency_max.value = latency
+
+                # Clear the event to avoid re-trigering the asynchronous MPC
+                self.newData.clear()
+
+                # Retrieve data from the shared memory
+                k_loop = int(self.k_shared[1])
+                t_start = time.time()
+                np.copyto(self.xref, self.xref_shared)
+                np.copyto(self.fsteps, self.fsteps_shared)
+
+                # Run the asynchronous MPC with the data that as been retrieved
+                self.loop_mpc.solve(k_loop, self.xref, self.fsteps)
+
+                self.heartbeat[0] += 1.0
+
+                # Store the result (predicted state + desired forces) in the shared memory
+                seq += 1
+                self.publish_result(seq, k_loop, t_start, self.loop_mpc.get_latest_result(),
+                                    self.loop_mpc.get_solver_health())
+
+        return 0
+
+    def publish_result(self, seq, k, t_start, result, health):
+        """Write a result of the asynchronous MPC in the buffer that is not published then publish it
+
+        The buffer used by the result n is n % 2 so the buffer that is written is never the last published one.
+        Its version is odd during the write so that a reader still copying the previous result of this buffer
+        can detect the tear and retry.
+
+        Args:
+            seq (int): sequence number of the result (starts at 1)
+            k (int): iteration of the control loop for which the result has been computed
+            t_start (float): time at which the solve started
+            result (24xN array): predicted trajectory and desired contact forces
+            health (tuple): number of iterations and status code of the solver
+        """
+
+        i = seq % 2
+        info = self.result_info_shared[i]
+        info[0] += 1.0  # Odd version: write in progress
+        self.result_shared[i, :, :] = result
+        info[1:7] = [seq, k, t_start, time.time(), *health]
+        info[0] += 1.0  # Even version: buffer is consistent
+
+        # Publish the buffer, the sequence number is written last since it is what the reader polls
+        self.result_published[0] = i
+        self.result_published[1] = seq
+
+        return 0
+
+
+def run_worker(*args):
+    """Entry point of the parallel process of the MPC, see MPC_Worker for the arguments
+    """
+
+    MPC_Worker(*args).run()
+
+    return 0
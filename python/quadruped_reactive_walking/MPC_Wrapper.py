@@ -1,66 +1,110 @@
 # coding: utf8
 
 import numpy as np
-import libquadruped_reactive_walking as MPC
-from multiprocessing import Process, Value, Array
-from utils_mpc import quaternionToRPY
-# import crocoddyl_class.MPC_crocoddyl as MPC_crocoddyl
-
-
-class Dummy:
-    """Dummy class to store variables"""
-
-    def __init__(self):
-
-        self.xref = None  # Desired trajectory
-        self.fsteps = None  # Desired location of footsteps
-
-        pass
+import time
+import threading
+from multiprocessing import Value, get_context, shared_memory
+from utils_mpc import quaternionToRPY, set_process_scheduling
+from MPC_Backends import create_backend, get_backend_name
+import MPC_Worker
 
 
 class MPC_Wrapper:
-    """Wrapper to run both types of MPC (OQSP or Crocoddyl) with the possibility to run OSQP in
-    a parallel process
+    """Wrapper to run the MPC backends (OQSP or Crocoddyl, see MPC_Backends) with the possibility to run them in
+    a parallel process or in a thread of the control process
 
     Args:
-        mpc_type (bool): True to have PA's MPC, False to have Thomas's MPC
+        mpc_type (bool or string): name of the backend in MPC_Backends.backends, or True to have PA's MPC (osqp),
+                                   False to have Thomas's MPC (crocoddyl)
         dt (float): Time step of the MPC
         n_steps (int): Number of time steps in one gait cycle
         k_mpc (int): Number of inv dyn time step for one iteration of the MPC
         T_gait (float): Duration of one period of gait
         q_init (array): the default position of the robot
         multiprocessing (bool): Enable/Disable running the MPC with another process
+        multithreading (bool): Enable/Disable running the MPC in another thread of the control process
+                               (ignored if multiprocessing is enabled)
+        deadline (float): Time budget of one solve of the parallel MPC, after which the previous result is shifted
+                          in time to replace the missing one (None to disable)
+        options (dict): options of the backend of the MPC (see MPC_Backends)
+        start_method (string): start method of the MPC process, "forkserver" or "spawn" so that it does not inherit
+                               the memory of the control process, or "fork"
     """
 
-    def __init__(self, mpc_type, dt, n_steps, k_mpc, T_gait, q_init, multiprocessing=False):
+    def __init__(self, mpc_type, dt, n_steps, k_mpc, T_gait, q_init, multiprocessing=False, multithreading=False,
+                 deadline=None, options=None, start_method="forkserver"):
 
         self.f_applied = np.zeros((12,))
         self.not_first_iter = False
 
         # Number of TSID steps for 1 step of the MPC
         self.k_mpc = k_mpc
+        self.k_solve = 0  # Iteration of the control loop of the last solve
 
         self.dt = dt
         self.n_steps = n_steps
         self.T_gait = T_gait
         self.gait_memory = np.zeros(4)
+        self.xref_aligned = np.zeros((12, n_steps + 1))  # Reference trajectory of a solve between two steps of the gait
 
-        self.mpc_type = mpc_type
+        self.mpc_type = get_backend_name(mpc_type)
+        self.options = options
+        self.started = False  # True once the parallel process or thread has been started
+        self.scheduling = ("mpc", None, None)  # Name, CPU cores and SCHED_FIFO priority of the parallel MPC
+        self.scheduling_report = None  # Placement applied to the parallel MPC when it has been started
         self.multiprocessing = multiprocessing
+        self.multithreading = multithreading and not multiprocessing
         if multiprocessing:  # Setup variables in the shared memory
-            self.newData = Value('b', False)
-            self.newResult = Value('b', False)
-            self.dataIn = Array('d', [0.0] * (1 + (np.int(self.n_steps)+1) * 12 + 13*20))
-            self.dataOut = Array('d', [0] * 24 * (np.int(self.n_steps)))
+            # The MPC process is started from a server that has only imported MPC_Worker (forkserver) or from a new
+            # interpreter (spawn) so that it does not carry a copy of the control process. It still imports the main
+            # script as __mp_main__, whose top-level imports must stay light (see main_solo12_control.py)
+            self.ctx = get_context(start_method)
+            if start_method == "forkserver":
+                self.ctx.set_forkserver_preload(["MPC_Worker"])
+            self.newData = self.ctx.Event()  # Set by the control loop to wake up the MPC process
+            # Named shared memory blocks allocated once and seen as preshaped numpy arrays by both processes, the MPC
+            # process attaches them by name (see MPC_Worker)
+            self.shm_blocks = []
+            self.shm_names = {}  # Name of the block and shape of each shared array
+            self.k_shared = self.create_shared_array("k_shared", (2, ))  # Iteration of the MPC and of the control loop
+            self.xref_shared = self.create_shared_array("xref_shared", (12, self.n_steps+1))  # Desired trajectory
+            self.fsteps_shared = self.create_shared_array("fsteps_shared", (20, 13))  # Desired location of footsteps
+            # Double buffer for the results (predicted trajectory + forces), the MPC process always writes in the
+            # buffer that is not published so that the control loop never reads a result that is being written
+            self.result_shared = self.create_shared_array("result_shared", (2, 24, self.n_steps))
+            # Metadata of each buffer: [version, sequence number, k, solve start time, solve end time, iterations of
+            # the solver, status of the solver]. The version is odd while the buffer is being written (seqlock)
+            self.result_info_shared = self.create_shared_array("result_info_shared", (2, 7))
+            # Index of the last published buffer and its sequence number
+            self.result_published = self.create_shared_array("result_published", (2, ))
+            # Heartbeat counter incremented by the MPC process at each iteration of its loop
+            self.heartbeat = self.create_shared_array("heartbeat", (1, ))
+            # [ready flag, resident memory in bytes] written by the MPC process once its solver has been created
+            self.worker_info = self.create_shared_array("worker_info", (2, ))
+            self.fsteps_future = np.zeros((20, 13))
+            # Single writer values without lock so that a killed MPC process cannot leave a lock acquired
+            self.running = self.ctx.Value('b', True, lock=False)
+            self.t_notify = self.ctx.Value('d', 0.0, lock=False)  # Time at which the control loop has signaled data
+            self.wakeup_latency = self.ctx.Value('d', 0.0, lock=False)  # Delay between the signal and the wakeup
+            self.wakeup_latency_max = self.ctx.Value('d', 0.0, lock=False)  # Maximum of this delay since the start
+        elif self.multithreading:  # Setup variables shared with the MPC thread
+            self.newData = threading.Event()  # Set by the control loop to wake up the MPC thread
+            self.lock = threading.Lock()  # Protects the inputs and the result exchanged with the MPC thread
+            self.k_thread = np.zeros(2)  # Iteration of the MPC and of the control loop
+            self.xref_thread = np.zeros((12, self.n_steps+1))  # Desired trajectory
+            self.fsteps_thread = np.zeros((20, 13))  # Desired location of footsteps
+            self.result_thread = np.zeros((24, self.n_steps))  # Predicted trajectory + forces
+            # [sequence number, k, solve start time, solve end time, iterations of the solver, status of the solver]
+            self.result_info_thread = np.zeros(6)
+            self.heartbeat = np.zeros(1)  # Heartbeat counter incremented by the MPC thread at each iteration
             self.fsteps_future = np.zeros((20, 13))
-            self.running = Value('b', True)
+            self.running = Value('b', True, lock=False)
+            self.t_notify = Value('d', 0.0, lock=False)  # Time at which the control loop has signaled new data
+            self.wakeup_latency = Value('d', 0.0, lock=False)  # Delay between the signal and the wakeup of the MPC
+            self.wakeup_latency_max = Value('d', 0.0, lock=False)  # Maximum of this delay since the start
         else:
             # Create the new version of the MPC solver object
-            if mpc_type:
-                self.mpc = MPC.MPC(dt, n_steps, T_gait)
-            else:
-                self.mpc = MPC_crocoddyl.MPC_crocoddyl(
-                    dt=dt, T_mpc=T_gait, mu=0.9, inner=False, linearModel=True, n_period=int((dt * n_steps)/T_gait))
+            self.mpc = create_backend(self.mpc_type, dt, n_steps, k_mpc, T_gait, self.options)
 
         # Setup initial result for the first iteration of the main control loop
         x_init = np.zeros(12)
@@ -69,6 +113,39 @@ class MPC_Wrapper:
         self.last_available_result = np.zeros((24, (np.int(self.n_steps))))
         self.last_available_result[:, 0] = np.hstack((x_init, np.array([0.0, 0.0, 8.0] * 4)))
 
+        # Metadata of the last available result
+        self.result_seq = 0  # Sequence number (0 if no result has been received yet)
+        self.result_k = 0  # Iteration of the control loop for which the result has been computed
+        self.result_t_start = 0.0  # Time at which the solve started
+        self.result_t_end = 0.0  # Time at which the solve ended
+        self.result_iter = 0  # Number of iterations of the solver (0 if the backend does not report it)
+        self.result_status = 0  # Status code of the solver (0 if the backend does not report it)
+
+        # Supervision of the parallel MPC
+        self.worker = None  # Process or thread of the parallel MPC
+        self.generation = 0  # Incremented at each start of the parallel MPC, older MPC threads exit
+        self.old_workers = []  # Killed MPC processes that have not been reaped yet
+        self.stall_ticks = 20 * k_mpc  # The MPC is stalled if no heartbeat during that many ticks while it solves
+        self.heartbeat_last = 0.0  # Last heartbeat seen by the control loop
+        self.heartbeat_k = 0  # Iteration of the control loop at which the heartbeat has last changed
+        self.ready_generation = 0  # Generation of the last MPC thread that has created its backend
+        self.n_restarts = 0  # Number of restarts of the parallel MPC
+
+        # Deadline of the solves of the parallel MPC
+        self.deadline = deadline
+        self.request_k = 0  # Iteration of the control loop of the last data sent to the MPC
+        self.request_t = 0.0  # Time at which the last data has been sent to the MPC
+        self.pending = False  # True while the result of the last data sent to the MPC has not been received
+        self.result_received = self.last_available_result.copy()  # Last result as received from the MPC
+        self.fallback_result = np.zeros((24, self.n_steps))  # Last result shifted in time
+        self.fallback = False  # True if the last returned result is the time-shifted fallback
+        self.n_late = 0  # Number of results received after the deadline
+        self.n_missed = 0  # Number of solves whose result had not been received when the next one started
+
+        # Start the MPC process now so that it creates its solver while the control process initializes
+        if multiprocessing:
+            self.start_worker()
+
     def solve(self, k, fstep_planner):
         """Call either the asynchronous MPC or the synchronous MPC depending on the value of multiprocessing during
         the creation of the wrapper
@@ -78,13 +155,26 @@ class MPC_Wrapper:
             fstep_planner (object): FootstepPlanner object of the control loop
         """
 
+        if self.multiprocessing or self.multithreading:
+            if self.pending:
+                self.n_missed += 1
+            self.pending = True
+            self.request_k = k
+            self.request_t = time.time()
+
+        xref = self.align_xref(k, fstep_planner.xref)
         if self.multiprocessing:  # Run in parallel process
-            self.run_MPC_asynchronous(k, fstep_planner)
+            self.run_MPC_asynchronous(k, xref, fstep_planner)
+        elif self.multithreading:  # Run in a thread of the control process
+            self.run_MPC_threaded(k, xref, fstep_planner)
         else:  # Run in the same process than main loop
-            self.run_MPC_synchronous(k, fstep_planner)
+            self.run_MPC_synchronous(k, xref, fstep_planner)
 
+        # Shift by the number of steps of the gait since the previous solve (one at a fixed rate)
         if k > 2:
-            self.last_available_result[12:(12+self.n_steps), :] = np.roll(self.last_available_result[12:(12+self.n_steps), :], -1, axis=1)
+            shift = k // self.k_mpc - self.k_solve // self.k_mpc
+            self.last_available_result[12:(12+self.n_steps), :] = np.roll(self.last_available_result[12:(12+self.n_steps), :], -shift, axis=1)
+        self.k_solve = k
 
         pt = 0
         while (fstep_planner.gait[pt, 0] != 0):
@@ -100,20 +190,38 @@ class MPC_Wrapper:
 
         return 0
 
-    def get_latest_result(self):
+    def get_latest_result(self, k=None):
         """Return the desired contact forces that have been computed by the last iteration of the MPC
-        If a new result is available, return the new result. Otherwise return the old result again.
+        If a new result is available, return the new result. Otherwise return the old result again, shifted in time
+        if the solve of the parallel MPC has exceeded its deadline.
+
+        Args:
+            k (int): current iteration of the control loop (None to disable the deadline check)
         """
 
         if (self.not_first_iter):
+            if (k is not None) and (self.multiprocessing or self.multithreading):
+                self.supervise(k)
             if self.multiprocessing:
-                if self.newResult.value:
-                    self.newResult.value = False
-                    # Retrieve desired contact forces with through the memory shared with the asynchronous
-                    self.last_available_result = self.convert_dataOut()
-                    return self.last_available_result
-                else:
-                    return self.last_available_result
+                if self.result_published[1] > self.result_seq:
+                    # Retrieve desired contact forces through the memory shared with the asynchronous MPC
+                    self.read_published_result()
+                    self.receive_result()
+                return self.check_deadline(k)
+            elif self.multithreading:
+                if self.result_info_thread[0] > self.result_seq:
+                    # Retrieve desired contact forces computed by the MPC thread
+                    with self.lock:
+                        np.copyto(self.last_available_result, self.result_thread)
+                        seq, k_result, t_start, t_end, n_iter, status = self.result_info_thread
+                    self.result_seq = int(seq)
+                    self.result_k = int(k_result)
+                    self.result_t_start = t_start
+                    self.result_t_end = t_end
+                    self.result_iter = int(n_iter)
+                    self.result_status = int(status)
+                    self.receive_result()
+                return self.check_deadline(k)
             else:
                 # Directly retrieve desired contact force of the synchronous MPC object
                 return self.f_applied
@@ -122,144 +230,348 @@ class MPC_Wrapper:
             self.not_first_iter = True
             return self.last_available_result
 
-    def run_MPC_synchronous(self, k, fstep_planner):
+    def align_xref(self, k, xref):
+        """Return the reference trajectory of a solve that starts r = k % k_mpc iterations of the control loop after
+        the last step of the gait (adaptive rate of the MPC). The nodes of the MPC end at the next steps of the gait,
+        so column i of the reference (planned i.dt after the current state) is interpolated at i.dt - r.dt/k_mpc.
+        The reference is unchanged if the solve starts at a step of the gait (fixed rate).
+
+        Args:
+            k (int): Number of inv dynamics iterations since the start of the simulation
+            xref (12xN+1 array): current state (first column) and desired trajectory of the base
+        """
+
+        r = k % self.k_mpc
+        if r == 0:
+            return xref
+
+        alpha = r / self.k_mpc
+        self.xref_aligned[:, 0] = xref[:, 0]
+        self.xref_aligned[:, 1:] = (1.0 - alpha) * xref[:, 1:] + alpha * xref[:, :-1]
+
+        return self.xref_aligned
+
+    def run_MPC_synchronous(self, k, xref, fstep_planner):
         """Run the MPC (synchronous version) to get the desired contact forces for the feet currently in stance phase
 
         Args:
             k (int): Number of inv dynamics iterations since the start of the simulation
+            xref (12xN+1 array): current state (first column) and desired trajectory of the base
             fstep_planner (object): FootstepPlanner object of the control loop
         """
 
         # Run the MPC to get the reference forces and the next predicted state
         # Result is stored in mpc.f_applied, mpc.q_next, mpc.v_next
 
-        if self.mpc_type:
-            # OSQP MPC
-            # Replace NaN values by 0.0 (shared memory cannot handle np.nan)
-            fstep_planner.fsteps_mpc[np.isnan(fstep_planner.fsteps_mpc)] = 0.0
-            self.mpc.run(np.int(k), fstep_planner.xref.copy(), fstep_planner.fsteps_mpc.copy())
-        else:
-            # Crocoddyl MPC
-            self.mpc.solve(k, fstep_planner)
+        t_start = time.time()
+        # Replace NaN values by 0.0 (the MPC cannot handle np.nan)
+        self.mpc.solve(k, xref.copy(), np.nan_to_num(fstep_planner.fsteps))
 
         # Output of the MPC
         self.f_applied = self.mpc.get_latest_result()
+        self.result_seq += 1
+        self.result_k = k
+        self.result_t_start = t_start
+        self.result_t_end = time.time()
+        self.result_iter, self.result_status = self.mpc.get_solver_health()
 
-    def run_MPC_asynchronous(self, k, fstep_planner):
+    def run_MPC_asynchronous(self, k, xref, fstep_planner):
         """Run the MPC (asynchronous version) to get the desired contact forces for the feet currently in stance phase
 
         Args:
             k (int): Number of inv dynamics iterations since the start of the simulation
+            xref (12xN+1 array): current state (first column) and desired trajectory of the base
             fstep_planner (object): FootstepPlanner object of the control loop
         """
 
-        # If this is the first iteration, creation of the parallel process
-        if (k == 0):
-            p = Process(target=self.create_MPC_asynchronous, args=(
-                self.newData, self.newResult, self.dataIn, self.dataOut, self.running))
-            p.start()
-
         # Stacking data to send them to the parallel process
-        self.compress_dataIn(k, fstep_planner)
-        self.newData.value = True
+        self.compress_dataIn(k, xref, fstep_planner)
+
+        # Wake up the parallel process
+        self.t_notify.value = time.time()
+        self.newData.set()
+
+        return 0
+
+    def run_MPC_threaded(self, k, xref, fstep_planner):
+        """Run the MPC (threaded version) to get the desired contact forces for the feet currently in stance phase
+
+        Same contract as the asynchronous version but the MPC runs in a thread of the control process, which avoids
+        the creation of a process and the copies through the shared memory. The C++ MPC releases the GIL while it
+        solves so that the control loop keeps running in the meantime.
+
+        Args:
+            k (int): Number of inv dynamics iterations since the start of the simulation
+            xref (12xN+1 array): current state (first column) and desired trajectory of the base
+            fstep_planner (object): FootstepPlanner object of the control loop
+        """
+
+        # If this is the first call, creation of the MPC thread
+        if not self.started:
+            self.start_worker()
+
+        # Copy the inputs for the MPC thread
+        with self.lock:
+            self.k_thread[0] = k / self.k_mpc
+            self.k_thread[1] = k
+            np.copyto(self.xref_thread, xref)
+            np.copyto(self.fsteps_thread, fstep_planner.fsteps)
+            np.nan_to_num(self.fsteps_thread, copy=False)
+
+        # Wake up the MPC thread
+        self.t_notify.value = time.time()
+        self.newData.set()
 
         return 0
 
-    def create_MPC_asynchronous(self, newData, newResult, dataIn, dataOut, running):
-        """Parallel process with an infinite loop that run the asynchronous MPC
+    def start_worker(self):
+        """Start the parallel process or the thread of the MPC and apply its placement on the CPU cores
+        """
+
+        self.generation += 1
+        if self.multiprocessing:
+            self.worker_info[0] = 0.0
+            self.worker = self.ctx.Process(target=MPC_Worker.run_worker,
+                                           args=(self.mpc_type, self.dt, self.n_steps, self.k_mpc, self.T_gait,
+                                                 self.options, self.shm_names, self.newData, self.running, self.t_notify,
+                                                 self.wakeup_latency, self.wakeup_latency_max))
+            self.worker.start()
+            pid = self.worker.pid
+        else:
+            self.worker = threading.Thread(target=self.create_MPC_threaded, args=(self.generation, ), daemon=True)
+            self.worker.start()
+            pid = self.worker.native_id
+        self.started = True
+        self.scheduling_report = set_process_scheduling(self.scheduling[0], pid, *self.scheduling[1:])
+
+        return 0
+
+    def supervise(self, k):
+        """Detect if the parallel MPC is dead or stalled (no heartbeat during self.stall_ticks iterations of the
+        control loop while it should be solving) and restart it
 
         Args:
-            newData (Value): shared variable that is true if new data is available, false otherwise
-            newResult (Value): shared variable that is true if a new result is available, false otherwise
-            dataIn (Array): shared array that contains the data the asynchronous MPC will use as inputs
-            dataOut (Array): shared array that contains the result of the asynchronous MPC
-            running (Value): shared variable to stop the infinite loop when set to False
+            k (int): current iteration of the control loop
         """
 
-        # print("Entering infinite loop")
-        while running.value:
-            # Checking if new data is available to trigger the asynchronous MPC
-            if newData.value:
-
-                # Set the shared variable to false to avoid re-trigering the asynchronous MPC
-                newData.value = False
-                # print("New data detected")
-
-                # Retrieve data thanks to the decompression function and reshape it
-                kf, xref_1dim, fsteps_1dim = self.decompress_dataIn(dataIn)
-
-                # Reshaping 1-dimensional data
-                k = int(kf[0])
-                xref = np.reshape(xref_1dim, (12, self.n_steps+1))
-                fsteps = np.reshape(fsteps_1dim, (20, 13))
-
-                # Create the MPC object of the parallel process during the first iteration
-                if k == 0:
-                    # loop_mpc = MPC.MPC(self.dt, self.n_steps, self.T_gait)
-                    if self.mpc_type:
-                        loop_mpc = MPC.MPC(self.dt, self.n_steps, self.T_gait)
-                    else:
-                        loop_mpc = MPC_crocoddyl.MPC_crocoddyl(self.dt, self.T_gait, 1, True)
-                        dummy_fstep_planner = Dummy()
-
-                # Run the asynchronous MPC with the data that as been retrieved
-                if self.mpc_type:
-                    fsteps[np.isnan(fsteps)] = 0.0
-                    loop_mpc.run(np.int(k), xref, fsteps)
-                else:
-                    dummy_fstep_planner.xref = xref
-                    dummy_fstep_planner.fsteps = fsteps
-                    loop_mpc.solve(k, dummy_fstep_planner)
-
-                # Store the result (predicted state + desired forces) in the shared memory
-                # print(len(self.dataOut))
-                # print((loop_mpc.get_latest_result()).shape)
-
-                self.dataOut[:] = loop_mpc.get_latest_result().ravel(order='F')
-
-                # Set shared variable to true to signal that a new result is available
-                newResult.value = True
+        if not self.started:
+            return 0
+
+        # Reap the killed MPC processes that have exited
+        if self.old_workers:
+            self.old_workers = [w for w in self.old_workers if w.is_alive()]
+
+        if self.heartbeat[0] != self.heartbeat_last:
+            self.heartbeat_last = self.heartbeat[0]
+            self.heartbeat_k = k
+            return 0
+
+        # The creation of the backend (imports, setup of the problem) can last longer than stall_ticks, a new MPC is
+        # only considered stalled once it is ready
+        if not self.is_worker_ready():
+            self.heartbeat_k = k
+
+        dead = not self.worker.is_alive()
+        if dead or (self.pending and (k - self.heartbeat_k) > self.stall_ticks):
+            print("MPC " + ("dead" if dead else "stalled") + " at iteration " + str(k) + ", restarting it")
+            self.restart_worker()
+            self.heartbeat_k = k
 
         return 0
 
-    def compress_dataIn(self, k, fstep_planner):
-        """Compress data in a single C-type array that belongs to the shared memory to send data from the main control
-        loop to the asynchronous MPC
+    def restart_worker(self):
+        """Replace the parallel MPC by a new one without waiting for the old one. The new MPC builds its solver
+        from scratch and solves the last data sent by the control loop right away.
+        """
+
+        self.n_restarts += 1
+        if self.multiprocessing:
+            if self.worker.is_alive():
+                self.worker.kill()
+                self.old_workers.append(self.worker)
+            # New event since the killed process may have left the one it was waiting on in an unusable state
+            self.newData = self.ctx.Event()
+        # An old MPC thread cannot be killed but exits at its next iteration since its generation is outdated
+
+        self.start_worker()
+
+        # Send the last data again
+        if self.pending:
+            self.t_notify.value = time.time()
+            self.newData.set()
+
+        return 0
+
+    def create_MPC_threaded(self, generation):
+        """Loop of the MPC thread that runs the MPC each time the control loop sends new data
 
         Args:
-            k (int): Number of inv dynamics iterations since the start of the simulation
-            fstep_planner (object): FootstepPlanner object of the control loop
+            generation (int): generation of the thread, it stops if a newer thread has been started
         """
 
-        # Replace NaN values by 0.0 to be stored in C-type arrays
-        fstep_planner.fsteps[np.isnan(fstep_planner.fsteps)] = 0.0
+        # Local copies of the inputs so that the control loop can write new data while the MPC is running
+        xref = np.zeros((12, self.n_steps+1))
+        fsteps = np.zeros((20, 13))
+        seq = int(self.result_info_thread[0])  # Sequence number of the last result
+        loop_mpc = None
+        newData = self.newData
+
+        while self.running.value and (generation == self.generation):
+            self.heartbeat[0] += 1.0
+
+            # Sleep until new data is available (timeout to regularly check if the thread should stop)
+            if newData.wait(0.1):
+
+                # Measure the delay between the signal of the control loop and the wakeup
+                latency = time.time() - self.t_notify.value
+                self.wakeup_latency.value = latency
+                if latency > self.wakeup_latency_max.value:
+                    self.wakeup_latency_max.value = latency
+
+                newData.clear()
+                if not self.running.value or (generation != self.generation):
+                    break
+
+                # Retrieve the inputs
+                with self.lock:
+                    k_loop = int(self.k_thread[1])
+                    np.copyto(xref, self.xref_thread)
+                    np.copyto(fsteps, self.fsteps_thread)
+                t_start = time.time()
+
+                # Create the MPC object of the thread during its first iteration
+                # (not necessarily at the start of the control loop, the backend sets its solver up then)
+                if loop_mpc is None:
+                    loop_mpc = create_backend(self.mpc_type, self.dt, self.n_steps, self.k_mpc, self.T_gait,
+                                              self.options)
+                    self.ready_generation = generation
+
+                # Run the MPC, the GIL is released during the solve of the OSQP MPC
+                loop_mpc.solve(k_loop, xref, fsteps)
+                result = loop_mpc.get_latest_result()
+                health = loop_mpc.get_solver_health()
+                self.heartbeat[0] += 1.0
+
+                # Store the result for the control loop (unless a newer thread has replaced this one)
+                with self.lock:
+                    if generation == self.generation:
+                        seq += 1
+                        np.copyto(self.result_thread, result)
+                        self.result_info_thread[:] = [seq, k_loop, t_start, time.time(), *health]
 
-        # Compress data in the shared input array
-        self.dataIn[:] = np.concatenate([[(k/self.k_mpc)], fstep_planner.xref.ravel(),
-                                         fstep_planner.fsteps.ravel()], axis=0)
+        return 0
 
-        return 0.0
+    def read_published_result(self):
+        """Copy the last published result of the asynchronous MPC in self.last_available_result together with its
+        metadata. The copy is retried if the buffer has been modified while it was read.
+        """
+
+        while True:
+            i = int(self.result_published[0])
+            info = self.result_info_shared[i]
+            version = info[0]
+            if version % 2 == 1.0:
+                continue  # The MPC process is writing in this buffer
+            np.copyto(self.last_available_result, self.result_shared[i])
+            seq, k, t_start, t_end, n_iter, status = info[1:7]
+            if info[0] == version:
+                break
+
+        self.result_seq = int(seq)
+        self.result_k = int(k)
+        self.result_t_start = t_start
+        self.result_t_end = t_end
+        self.result_iter = int(n_iter)
+        self.result_status = int(status)
+
+        return 0
+
+    def receive_result(self):
+        """Keep a copy of a new result of the parallel MPC and check if it has arrived after the deadline
+        """
+
+        np.copyto(self.result_received, self.last_available_result)
+        if self.pending and self.result_k == self.request_k:
+            self.pending = False
+            if self.deadline is not None and (time.time() - self.request_t) > self.deadline:
+                self.n_late += 1
 
-    def decompress_dataIn(self, dataIn):
-        """Decompress data from a single C-type array that belongs to the shared memory to retrieve data from the main control
-        loop in the asynchronous MPC
+        return 0
+
+    def check_deadline(self, k):
+        """Return the last result of the parallel MPC if the current solve is within its deadline. Otherwise return
+        the last received result shifted by the number of steps of the gait since the iteration it has been computed
+        for, the last column being repeated to fill the end of the horizon.
 
         Args:
-            dataIn (Array): shared array that contains the data the asynchronous MPC will use as inputs
+            k (int): current iteration of the control loop (None to disable the deadline check)
         """
 
-        # Sizes of the different variables that are stored in the C-type array
-        sizes = [0, 1, (np.int(self.n_steps)+1) * 12, 13*20]
-        csizes = np.cumsum(sizes)
+        self.fallback = False
+        if (k is None) or (self.deadline is None) or (not self.pending) \
+                or (time.time() - self.request_t) <= self.deadline:
+            return self.last_available_result
+
+        self.fallback = True
+        shift = min(max(k // self.k_mpc - self.result_k // self.k_mpc, 0), self.n_steps - 1)
+        self.fallback_result[:, :(self.n_steps - shift)] = self.result_received[:, shift:]
+        self.fallback_result[:, (self.n_steps - shift):] = self.result_received[:, -1:]
 
-        # Return decompressed variables in a list
-        return [dataIn[csizes[i]:csizes[i+1]] for i in range(len(sizes)-1)]
+        return self.fallback_result
 
-    def convert_dataOut(self):
-        """Return the result of the asynchronous MPC (desired contact forces) that is stored in the shared memory
+    def get_deadline_stats(self):
+        """Return the number of results of the parallel MPC that have been received after the deadline and the number
+        of solves whose result had not been received when the next one started
         """
 
-        return np.array(self.dataOut[:]).reshape((24, -1), order='F')
+        return self.n_late, self.n_missed
+
+    def get_result_age(self, k):
+        """Return the age of the last available result in control ticks, that is to say the number of iterations
+        of the control loop since the iteration for which it has been computed
+
+        Args:
+            k (int): current iteration of the control loop
+        """
+
+        return k - self.result_k
+
+    def create_shared_array(self, key, shape):
+        """Allocate a named shared memory block and return a numpy view of it with the given shape.
+        The parallel process attaches the block by its name so that both processes work on the same memory.
+
+        Args:
+            key (string): name of the array in the parallel process
+            shape (tuple): shape of the array
+        """
+
+        shm = shared_memory.SharedMemory(create=True, size=8 * int(np.prod(shape)))
+        self.shm_blocks.append(shm)
+        self.shm_names[key] = (shm.name, shape)
+        array = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+        array[:] = 0.0
+
+        return array
+
+    def compress_dataIn(self, k, xref, fstep_planner):
+        """Write the data sent from the main control loop to the asynchronous MPC directly into the shared memory
+        views, without intermediate allocation
+
+        Args:
+            k (int): Number of inv dynamics iterations since the start of the simulation
+            xref (12xN+1 array): current state (first column) and desired trajectory of the base
+            fstep_planner (object): FootstepPlanner object of the control loop
+        """
+
+        self.k_shared[0] = k / self.k_mpc
+        self.k_shared[1] = k
+        np.copyto(self.xref_shared, xref)
+        np.copyto(self.fsteps_shared, fstep_planner.fsteps)
+
+        # Replace NaN values by 0.0 (the MPC cannot handle np.nan)
+        np.nan_to_num(self.fsteps_shared, copy=False)
+
+        return 0.0
 
     def roll_asynchronous(self, fsteps):
         """Move one step further in the gait cycle. Since the output of the asynchronous MPC is retrieved by
@@ -295,10 +607,89 @@ class MPC_Wrapper:
 
         return 0
 
+    def set_scheduling(self, name, cores=None, priority=None):
+        """Set the placement of the parallel MPC, applied when the process or thread is started or right away if it
+        is already running
+
+        Args:
+            name (string): name of the MPC in the placement report
+            cores (list): CPU cores the MPC can run on (None to keep the default affinity)
+            priority (int): SCHED_FIFO priority of the MPC (None to keep the default policy)
+        """
+
+        self.scheduling = (name, cores, priority)
+        if self.started:
+            pid = self.worker.pid if self.multiprocessing else self.worker.native_id
+            self.scheduling_report = set_process_scheduling(name, pid, cores, priority)
+
+        return 0
+
+    def is_worker_ready(self):
+        """Return True if the parallel MPC has created its backend (the MPC process creates it at its start, the
+        MPC thread with the first data)
+        """
+
+        if self.multiprocessing:
+            return self.worker_info[0] == 1.0
+
+        return self.ready_generation == self.generation
+
+    def wait_ready(self, timeout=10.0):
+        """Wait until the MPC process has created its solver. Return True if it is ready, False if the timeout has
+        been reached (always True if the MPC does not run in a parallel process)
+
+        Args:
+            timeout (float): maximum waiting time in seconds
+        """
+
+        if not self.multiprocessing:
+            return True
+
+        t_end = time.time() + timeout
+        while self.worker_info[0] == 0.0:
+            if time.time() > t_end or not self.worker.is_alive():
+                return False
+            time.sleep(0.001)
+
+        return True
+
+    def get_worker_rss(self):
+        """Return the resident memory of the MPC process in bytes once its solver has been created
+        (0 if it is not ready or if the MPC does not run in a parallel process)
+        """
+
+        if not self.multiprocessing:
+            return 0
+
+        return int(self.worker_info[1])
+
+    def get_wakeup_latency(self):
+        """Return the delay between the last signal sent to the asynchronous MPC and its wakeup, as well as the
+        maximum delay since the start (0.0 if the MPC is not running in a parallel process)
+        """
+
+        if self.multiprocessing or self.multithreading:
+            return self.wakeup_latency.value, self.wakeup_latency_max.value
+        else:
+            return 0.0, 0.0
+
     def stop_parallel_loop(self):
-        """Stop the infinite loop in the parallel process to properly close the simulation
+        """Stop the infinite loop in the parallel process (or thread) to properly close the simulation
         """
 
+        if not (self.multiprocessing or self.multithreading):
+            return 0
+
         self.running.value = False
+        self.newData.set()  # Wake up the parallel process so that it sees it has to stop
+
+        if self.multithreading:
+            if self.worker is not None:
+                self.worker.join()
+            return 0
+
+        # Release the shared memory blocks (the memory is freed once both processes have exited)
+        for shm in self.shm_blocks:
+            shm.unlink()
 
         return 0
@@ -12,6 +12,40 @@ import FootTrajectoryGenerator as ftg
 import libquadruped_reactive_walking as la
 np.set_printoptions(precision=3, linewidth=300)
 
+
+class SpeculativePlanner:
+    """Copy of the C++ planner on which a pending change of gait is applied right away. It outputs the same
+    quantities as PyPlanner for the MPC so that the problem after the change of gait can be solved in advance.
+
+    Args:
+        Cplanner (object): C++ planner of the control loop
+        joystick_code (int): code of the pending change of gait
+        k_commit (int): iteration of the control loop at which the change of gait is committed
+    """
+
+    def __init__(self, Cplanner, joystick_code, k_commit):
+
+        self.Cplanner = la.Planner(Cplanner)
+        self.requested_code = joystick_code
+        self.joystick_code = joystick_code  # Code sent during the next run of the copy
+        self.k_commit = k_commit
+
+        self.xref = None  # Desired trajectory
+        self.fsteps = None  # Desired location of footsteps
+        self.gait = None  # Gait matrix
+
+    def run_planner(self, k, q, v, b_vref, h_estim, z_average):
+        """Run the copy of the planner with the same inputs as the planner of the control loop"""
+
+        # The change of gait is applied during the first run of the copy
+        self.Cplanner.run_planner(k, q, v, b_vref, np.double(h_estim), np.double(z_average), self.joystick_code)
+        self.joystick_code = 0
+
+        self.xref = self.Cplanner.get_xref()
+        self.fsteps = self.Cplanner.get_fsteps()
+        self.gait = self.Cplanner.get_gait()
+
+
 class PyPlanner:
     """Planner that outputs current and future locations of footsteps, the reference trajectory of the base and
     the position, velocity, acceleration commands for feet in swing phase based on the reference velocity given by
@@ -113,6 +147,14 @@ class PyPlanner:
         # C++ class
         self.Cplanner = la.Planner(dt, dt_tsid, T_gait, T_mpc, k_mpc, on_solo8, h_ref, fsteps_init)
 
+        # Delayed changes of gait. If the delay is not 0, a change of gait is committed gait_change_delay iterations
+        # of the MPC after the button press. In the meantime the speculative planner outputs the problem after the
+        # change so that it can be solved in advance by another MPC.
+        self.gait_change_delay = 0
+        self.speculative = None  # SpeculativePlanner of the pending change of gait (None if no change is pending)
+        self.q_gait_change = np.zeros((7, 1))  # Position of the base when the pending change has been requested
+        self.gait_change_committed = False  # True during the iteration a pending change of gait is committed
+
         self.log_debug1 = np.zeros((10001, 3))
         self.log_debug2 = np.zeros((10001, 3))
 
@@ -555,6 +597,30 @@ class PyPlanner:
 
         return 0
 
+    def handle_joystick_code(self, joystick_code, q):
+        """Update the gait related variables of the Python planner for a joystick event (change of gait)
+
+        Args:
+            joystick_code (int): 1 for pacing, 2 for bounding, 3 for trot, 4 for static, 0 for no event
+            q (7x1 array): position of the base in world frame when the event has been triggered
+        """
+
+        if joystick_code == 1:
+            self.new_desired_gait = self.pacing_gait()
+            self.is_static = False
+        elif joystick_code == 2:
+            self.new_desired_gait = self.bounding_gait()
+            self.is_static = False
+        elif joystick_code == 3:
+            self.new_desired_gait = self.trot_gait()
+            self.is_static = False
+        elif joystick_code == 4:
+            self.new_desired_gait = self.static_gait()
+            self.is_static = True
+            self.q_static[0:7, 0:1] = q.copy()
+
+        return 0
+
     def run_planner(self, k, k_mpc, q, v, b_vref, h_estim, z_average, joystick=None):
 
         # Get the reference velocity in world frame (given in base frame)
@@ -575,26 +641,32 @@ class PyPlanner:
         if joystick is not None:
             if joystick.northButton:
                 joystick_code = 1
-                self.new_desired_gait = self.pacing_gait()
-                self.is_static = False
                 joystick.northButton = False
             elif joystick.eastButton:
                 joystick_code = 2
-                self.new_desired_gait = self.bounding_gait()
-                self.is_static = False
                 joystick.eastButton = False
             elif joystick.southButton:
                 joystick_code = 3
-                self.new_desired_gait = self.trot_gait()
-                self.is_static = False
                 joystick.southButton = False
             elif joystick.westButton:
                 joystick_code = 4
-                self.new_desired_gait = self.static_gait()
-                self.is_static = True
-                self.q_static[0:7, 0:1] = q.copy()
                 joystick.westButton = False
 
+        # Delay the change of gait, it is only applied on the speculative planner until it is committed
+        self.gait_change_committed = False
+        if joystick_code != 0 and self.gait_change_delay > 0:
+            k_commit = (k // k_mpc + self.gait_change_delay) * k_mpc
+            self.speculative = SpeculativePlanner(self.Cplanner, joystick_code, k_commit)
+            self.q_gait_change[:, :] = q
+            joystick_code = 0
+        if self.speculative is not None and k >= self.speculative.k_commit:
+            # Commit the pending change of gait, the speculative planner becomes the planner of the control loop
+            self.Cplanner = self.speculative.Cplanner
+            self.handle_joystick_code(self.speculative.requested_code, self.q_gait_change)
+            self.speculative = None
+            self.gait_change_committed = True
+        self.handle_joystick_code(joystick_code, q)
+
         """if (k == 2000):
             self.new_desired_gait = self.static_gait()
         """
@@ -623,6 +695,8 @@ class PyPlanner:
         # self.update_target_footsteps()
 
         self.Cplanner.run_planner(k, q, v, b_vref, np.double(h_estim), np.double(z_average), joystick_code)
+        if self.speculative is not None:
+            self.speculative.run_planner(k, q, v, b_vref, h_estim, z_average)
 
         # Update trajectory generator (3D pos, vel, acc)
         # self.update_trajectory_generator(k, h_estim, q)
@@ -36,6 +36,9 @@ class wbc_controller():
         self.log_feet_pos_target = np.zeros((3, 4, N_SIMULATION))
         self.log_feet_vel_target = np.zeros((3, 4, N_SIMULATION))
         self.log_feet_acc_target = np.zeros((3, 4, N_SIMULATION))
+        self.log_qp_iter = np.zeros(N_SIMULATION, dtype=int)  # Number of iterations of the box QP solver
+        self.log_qp_status = np.zeros(N_SIMULATION, dtype=int)  # Status code of the box QP solver (1 if solved)
+        self.log_qp_time = np.zeros(N_SIMULATION)  # Setup/update + solve time of the box QP solver
 
         # Arrays to store results (for solo12)
         self.qdes = np.zeros((19, ))
@@ -98,6 +101,9 @@ class wbc_controller():
 
         # Solve the QP problem with C++ bindings
         self.box_qp.run(self.M, self.Jc, f_cmd.reshape((-1, 1)), RNEA.reshape((-1, 1)), self.k_since_contact)
+        self.log_qp_iter[self.k_log] = self.box_qp.get_iter()
+        self.log_qp_status[self.k_log] = self.box_qp.get_status()
+        self.log_qp_time[self.k_log] = self.box_qp.get_run_time()
 
         # Add deltas found by the QP problem to reference quantities
         deltaddq = self.box_qp.get_ddq_res()
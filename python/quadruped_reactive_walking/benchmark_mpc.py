@@ -0,0 +1,129 @@
+# coding: utf8
+
+import time
+import argparse
+import numpy as np
+import MPC_Backends
+
+# Parameters of the MPC (same as main_solo12_control.py)
+dt_wbc = 0.002
+dt_mpc = 0.02
+k_mpc = int(dt_mpc / dt_wbc)
+T_gait = 0.32
+T_mpc = 0.32
+h_ref = 0.2447
+
+# Default position of the robot (base + actuators)
+q_init = np.array([0.0, 0.7, -1.4, -0.0, 0.7, -1.4, 0.0, -0.7, +1.4, -0.0, -0.7, +1.4])
+
+# Initial position of footsteps (below the shoulders)
+fsteps_init = np.array([[0.1946, 0.1946, -0.1946, -0.1946],
+                        [0.14695, -0.14695, 0.14695, -0.14695],
+                        [0.0, 0.0, 0.0, 0.0]])
+
+
+def print_stats(name, t):
+    """Print the statistics of a list of durations (in ms)
+
+    Args:
+        name (string): name of the measured quantity
+        t (list): durations in seconds
+    """
+
+    t = 1000 * np.array(t)
+    print("  {:<12} mean {:7.3f} ms | median {:7.3f} ms | max {:7.3f} ms".format(
+        name, np.mean(t), np.median(t), np.max(t)))
+
+
+def run_benchmark(backend, mode, n_iter):
+    """Run a MPC backend n_iter times with the given execution mode and measure the time the control loop is blocked
+    in solve as well as the delay before the result is available
+
+    Args:
+        backend (string): name of the MPC backend (see MPC_Backends)
+        mode (string): "sync", "process" or "thread"
+        n_iter (int): number of iterations of the MPC
+    """
+
+    # Imported here so that the MPC process, which imports this script again as __mp_main__, does not load the
+    # planner and the wrapper (pinocchio, tsid)
+    import MPC_Wrapper
+    from Planner import PyPlanner
+
+    q = np.zeros((19, 1))
+    q[0:7, 0] = np.array([0.0, 0.0, h_ref, 0.0, 0.0, 0.0, 1.0])
+    q[7:, 0] = q_init
+    v = np.zeros((18, 1))
+    v_ref = np.zeros((6, 1))
+    v_ref[0, 0] = 0.3
+
+    planner = PyPlanner(dt_mpc, dt_wbc, T_gait, T_mpc, k_mpc, False, h_ref, fsteps_init)
+    wrapper = MPC_Wrapper.MPC_Wrapper(backend, dt_mpc, np.int(T_mpc/dt_mpc), k_mpc, T_mpc, q,
+                                      multiprocessing=(mode == "process"), multithreading=(mode == "thread"))
+    wrapper.wait_ready()  # The MPC process is started with the wrapper
+    wrapper.get_latest_result()  # The first call returns the default result
+
+    t_solve = []
+    t_result = []
+    for i in range(n_iter):
+        k = i * k_mpc
+        planner.run_planner(k, k_mpc, q[0:7, 0:1], v[0:6, 0:1], v_ref, h_ref, 0.0)
+
+        # Time during which the control loop is blocked by the MPC
+        seq = wrapper.result_seq
+        tic = time.time()
+        wrapper.solve(k, planner)
+        t_solve.append(time.time() - tic)
+
+        # Delay before the result is available for the control loop
+        while True:
+            wrapper.get_latest_result()
+            if wrapper.result_seq > seq:
+                break
+            time.sleep(1e-5)
+        t_result.append(time.time() - tic)
+
+    wakeup_max = wrapper.get_wakeup_latency()[1]
+    wrapper.stop_parallel_loop()
+
+    # The first iteration includes the setup of the solver (and the creation of the thread)
+    print(backend + " / " + mode)
+    print_stats("solve call", t_solve[1:])
+    print_stats("result", t_result[1:])
+    print("  {:<12} first iteration {:7.3f} ms | max wakeup latency {:7.3f} ms".format(
+        "", 1000 * t_result[0], 1000 * wakeup_max))
+    if mode == "process":
+        print("  {:<12} resident memory of the MPC process {:.1f} MB".format("", wrapper.get_worker_rss() / 1e6))
+
+    return 0
+
+
+def main():
+    """Main function
+    """
+
+    parser = argparse.ArgumentParser(description='Compare the latency of the MPC backends and execution modes.')
+    parser.add_argument('-n',
+                        '--iterations',
+                        type=int,
+                        default=500,
+                        help='Number of iterations of the MPC for each mode')
+    parser.add_argument('-b',
+                        '--backends',
+                        nargs='+',
+                        default=["osqp"],
+                        help='MPC backends to compare among ' + ', '.join(MPC_Backends.backends))
+    parser.add_argument('-m',
+                        '--modes',
+                        nargs='+',
+                        default=["sync", "process", "thread"],
+                        help='Execution modes to compare among "sync", "process" and "thread"')
+    args = parser.parse_args()
+
+    for backend in args.backends:
+        for mode in args.modes:
+            run_benchmark(backend, mode, args.iterations)
+
+
+if __name__ == "__main__":
+    main()
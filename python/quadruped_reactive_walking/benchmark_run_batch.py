@@ -0,0 +1,70 @@
+# coding: utf8
+
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import libquadruped_reactive_walking as MPC
+from benchmark_warm_start import dt_mpc, n_steps, T_gait, load_trajectory, record_trajectory
+
+
+def main():
+    """Main function
+    """
+
+    parser = argparse.ArgumentParser(description='Throughput of MPC.run_batch on recorded MPC problems.')
+    parser.add_argument('-l',
+                        '--log',
+                        type=str,
+                        default=None,
+                        help='Log saved by LoggerControl to replay (a trajectory is recorded with the planner if None)')
+    parser.add_argument('-n',
+                        '--iterations',
+                        type=int,
+                        default=1000,
+                        help='Number of iterations of the MPC when the trajectory is recorded with the planner')
+    parser.add_argument('-f',
+                        '--formulation',
+                        type=str,
+                        default="full",
+                        choices=["full", "reduced", "condensed"],
+                        help='Formulation of the QP problem')
+    args = parser.parse_args()
+
+    if args.log is not None:
+        xref, fsteps = load_trajectory(args.log)
+    else:
+        xref, fsteps = record_trajectory(args.iterations)
+    formulation = {"full": MPC.MPC.FULL, "reduced": MPC.MPC.REDUCED, "condensed": MPC.MPC.CONDENSED}[args.formulation]
+    print("Batch of " + str(xref.shape[0]) + " MPC problems")
+
+    # Sequential solves of each problem alone (MPC reset before each one) as reference
+    mpc = MPC.MPC(dt_mpc, n_steps, T_gait, formulation)
+    mpc.set_setting("verbose", 0)
+    reference = np.zeros((xref.shape[0], 24, n_steps))
+    tic = time.time()
+    for i in range(xref.shape[0]):
+        mpc.reset()
+        mpc.run(0, xref[i], fsteps[i])
+        reference[i] = mpc.get_latest_result()
+    print("  {:<10} {:9.1f} problems/s".format("run", xref.shape[0] / (time.time() - tic)))
+
+    # Each problem is solved alone whatever the number of threads so the results are the same
+    difference = 0.0
+    for n_threads in sorted(set([1, 2, 4, os.cpu_count()])):
+        tic = time.time()
+        results = MPC.MPC.run_batch(dt_mpc, n_steps, T_gait, xref, fsteps, n_threads, formulation)
+        toc = time.time()
+        difference = max(difference, np.max(np.abs(results - reference)))
+        print("  {:<10} {:9.1f} problems/s | max difference with run {:.2e}".format(
+            str(n_threads) + " thread" + ("s" if n_threads > 1 else ""), xref.shape[0] / (toc - tic),
+            np.max(np.abs(results - reference))))
+
+    if difference > 0.0:
+        print("The results of run_batch depend on the number of threads")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+# coding: utf8
+
+import time
+import argparse
+import numpy as np
+import libquadruped_reactive_walking as MPC
+from Planner import PyPlanner
+
+# Parameters of the MPC (same as main_solo12_control.py)
+dt_wbc = 0.002
+dt_mpc = 0.02
+k_mpc = int(dt_mpc / dt_wbc)
+T_gait = 0.32
+T_mpc = 0.32
+h_ref = 0.2447
+n_steps = int(T_mpc / dt_mpc)
+
+# Default position of the robot (base + actuators)
+q_init = np.array([0.0, 0.7, -1.4, -0.0, 0.7, -1.4, 0.0, -0.7, +1.4, -0.0, -0.7, +1.4])
+
+# Initial position of footsteps (below the shoulders)
+fsteps_init = np.array([[0.1946, 0.1946, -0.1946, -0.1946],
+                        [0.14695, -0.14695, 0.14695, -0.14695],
+                        [0.0, 0.0, 0.0, 0.0]])
+
+
+def load_trajectory(fileName):
+    """Load the inputs of the MPC (reference trajectory and footsteps) recorded by LoggerControl, one sample per
+    iteration of the MPC
+
+    Args:
+        fileName (string): path to the .npz file saved by LoggerControl.saveAll
+    """
+
+    data = np.load(fileName)
+    xref = data["planner_xref"][::k_mpc]
+    fsteps = data["planner_fsteps"][::k_mpc]
+
+    # Remove the samples after the end of the experiment (never written by the logger)
+    n = np.count_nonzero(np.any(fsteps[:, :, 0] != 0.0, axis=1))
+
+    return xref[:n], fsteps[:n]
+
+
+def record_trajectory(n_iter):
+    """Record the inputs of the MPC sent by the planner while the reference velocity changes
+
+    Args:
+        n_iter (int): number of iterations of the MPC
+    """
+
+    q = np.zeros((19, 1))
+    q[0:7, 0] = np.array([0.0, 0.0, h_ref, 0.0, 0.0, 0.0, 1.0])
+    q[7:, 0] = q_init
+    v = np.zeros((18, 1))
+    v_ref = np.zeros((6, 1))
+
+    planner = PyPlanner(dt_mpc, dt_wbc, T_gait, T_mpc, k_mpc, False, h_ref, fsteps_init)
+    xref = np.zeros((n_iter, 12, n_steps + 1))
+    fsteps = np.zeros((n_iter, 20, 13))
+    for i in range(n_iter):
+        # Forward velocity ramp then turn
+        t = i * dt_mpc
+        v_ref[0, 0] = 0.3 * min(t, 1.0)
+        v_ref[5, 0] = 0.3 if t > 2.0 else 0.0
+
+        planner.run_planner(i * k_mpc, k_mpc, q[0:7, 0:1], v[0:6, 0:1], v_ref, h_ref, 0.0)
+        xref[i] = planner.xref
+        fsteps[i] = planner.fsteps
+
+    return xref, np.nan_to_num(fsteps)
+
+
+def run_mpc(xref, fsteps, shifted_warm_start):
+    """Solve the MPC for each sample of the trajectory and return the number of iterations, the solve times
+    and the results of the solver
+
+    Args:
+        xref (Nx12xN+1 array): reference trajectories
+        fsteps (Nx20x13 array): footsteps
+        shifted_warm_start (bool): warm start the solver with the previous solution shifted by one time step
+    """
+
+    mpc = MPC.MPC(dt_mpc, n_steps, T_gait)
+    mpc.set_shifted_warm_start(shifted_warm_start)
+
+    iters = np.zeros(xref.shape[0], dtype=int)
+    t_solve = np.zeros(xref.shape[0])
+    t_run = np.zeros(xref.shape[0])
+    results = np.zeros((xref.shape[0], 24, n_steps))
+    for i in range(xref.shape[0]):
+        tic = time.time()
+        mpc.run(i, xref[i], fsteps[i])
+        t_run[i] = time.time() - tic
+        iters[i] = mpc.get_iter()
+        t_solve[i] = mpc.get_solve_time()
+        results[i] = mpc.get_latest_result()
+
+    # The first solve includes the setup of the solver
+    return iters[1:], t_solve[1:], t_run[1:], results
+
+
+def print_distribution(name, values, unit, scale=1.0):
+    """Print the distribution of a list of values
+
+    Args:
+        name (string): name of the measured quantity
+        values (array): measured values
+        unit (string): unit of the printed values
+        scale (float): scaling applied to the values before printing
+    """
+
+    values = scale * np.array(values)
+    print("  {:<12} mean {:8.3f} | median {:8.3f} | p95 {:8.3f} | max {:8.3f} {}".format(
+        name, np.mean(values), np.median(values), np.percentile(values, 95), np.max(values), unit))
+
+
+def main():
+    """Main function
+    """
+
+    parser = argparse.ArgumentParser(description='Compare the OSQP MPC with and without shifted warm start.')
+    parser.add_argument('-l',
+                        '--log',
+                        type=str,
+                        default=None,
+                        help='Log saved by LoggerControl to replay (a trajectory is recorded with the planner if None)')
+    parser.add_argument('-n',
+                        '--iterations',
+                        type=int,
+                        default=500,
+                        help='Number of iterations of the MPC when the trajectory is recorded with the planner')
+    args = parser.parse_args()
+
+    if args.log is not None:
+        xref, fsteps = load_trajectory(args.log)
+    else:
+        xref, fsteps = record_trajectory(args.iterations)
+    print("Trajectory of " + str(xref.shape[0]) + " iterations of the MPC")
+
+    results = []
+    for shifted_warm_start in [False, True]:
+        iters, t_solve, t_run, result = run_mpc(xref, fsteps, shifted_warm_start)
+        results.append(result)
+        print("Shifted warm start" if shifted_warm_start else "Default warm start")
+        print_distribution("iterations", iters, "")
+        print_distribution("solve time", t_solve, "ms", 1000)
+        print_distribution("run time", t_run, "ms", 1000)
+
+    # Both versions solve the same problems, their results only differ by the tolerance of the solver
+    print("Maximum difference between the results: {:.2e}".format(np.max(np.abs(results[0] - results[1]))))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+# coding: utf8
+
+import sys
+import time
+import argparse
+import numpy as np
+import libquadruped_reactive_walking as MPC
+from benchmark_warm_start import dt_mpc, n_steps, T_gait, load_trajectory, record_trajectory, print_distribution
+
+# Settings of the solver for the comparison of the solutions (the forces are weakly weighted in the cost so the
+# solutions of both formulations only match with tight tolerances)
+tight_settings = {"eps_abs": 1e-9, "eps_rel": 1e-9, "max_iter": 100000, "polish": 1}
+
+
+def run_mpc(xref, fsteps, formulation, settings, shifted_warm_start):
+    """Solve the MPC for each sample of the trajectory and return the results, the objective values, the number of
+    iterations, the run times and the size of the problems
+
+    Args:
+        xref (Nx12xN+1 array): reference trajectories
+        fsteps (Nx20x13 array): footsteps
+        formulation (int): formulation of the QP problem (MPC.MPC.FULL or MPC.MPC.REDUCED)
+        settings (dict): settings of the OSQP solver
+        shifted_warm_start (bool): warm start the solver with the previous solution shifted by one time step
+    """
+
+    mpc = MPC.MPC(dt_mpc, n_steps, T_gait, formulation)
+    mpc.set_shifted_warm_start(shifted_warm_start)
+    mpc.set_setting("verbose", 0)
+    for name, value in settings.items():
+        mpc.set_setting(name, value)
+
+    results = np.zeros((xref.shape[0], 24, n_steps))
+    obj_val = np.zeros(xref.shape[0])
+    iters = np.zeros(xref.shape[0], dtype=int)
+    t_run = np.zeros(xref.shape[0])
+    sizes = np.zeros((xref.shape[0], 2), dtype=int)
+    for i in range(xref.shape[0]):
+        tic = time.time()
+        mpc.run(i, xref[i], fsteps[i])
+        t_run[i] = time.time() - tic
+        results[i] = mpc.get_latest_result()
+        obj_val[i] = mpc.get_solver_stats()["obj_val"]
+        iters[i] = mpc.get_iter()
+        sizes[i] = [mpc.get_n_variables(), mpc.get_n_constraints()]
+
+    return results, obj_val, iters, t_run, sizes
+
+
+def main():
+    """Main function
+    """
+
+    parser = argparse.ArgumentParser(description='Check that the reduced formulation of the OSQP MPC gives the '
+                                                 'solutions of the full one and compare their solve times.')
+    parser.add_argument('-l',
+                        '--log',
+                        type=str,
+                        default=None,
+                        help='Log saved by LoggerControl to replay (a trajectory is recorded with the planner if None)')
+    parser.add_argument('-n',
+                        '--iterations',
+                        type=int,
+                        default=200,
+                        help='Number of iterations of the MPC when the trajectory is recorded with the planner')
+    parser.add_argument('-t',
+                        '--tolerance',
+                        type=float,
+                        default=1e-3,
+                        help='Maximum difference between the results of both formulations')
+    args = parser.parse_args()
+
+    if args.log is not None:
+        xref, fsteps = load_trajectory(args.log)
+    else:
+        xref, fsteps = record_trajectory(args.iterations)
+    print("Trajectory of " + str(xref.shape[0]) + " iterations of the MPC")
+
+    # Equivalence of the formulations
+    res_full, obj_full, _, _, _ = run_mpc(xref, fsteps, MPC.MPC.FULL, tight_settings, True)
+    res_red, obj_red, _, _, _ = run_mpc(xref, fsteps, MPC.MPC.REDUCED, tight_settings, True)
+    err_res = np.max(np.abs(res_full - res_red))
+    err_obj = np.max(np.abs(obj_full - obj_red) / np.maximum(np.abs(obj_full), 1e-12))
+    print("Maximum difference between the results: {:.2e}".format(err_res))
+    print("Maximum relative difference between the objective values: {:.2e}".format(err_obj))
+
+    # Solve times with the default settings of the solver
+    for shifted_warm_start in [False, True]:
+        for name, formulation in [("Full", MPC.MPC.FULL), ("Reduced", MPC.MPC.REDUCED)]:
+            _, _, iters, t_run, sizes = run_mpc(xref, fsteps, formulation, {}, shifted_warm_start)
+            print(name + " formulation, " + ("shifted" if shifted_warm_start else "default") + " warm start, " +
+                  "{:.0f} variables and {:.0f} constraints on average".format(*np.mean(sizes, axis=0)))
+            # The first solve includes the setup of the solver
+            print_distribution("iterations", iters[1:], "")
+            print_distribution("run time", t_run[1:], "ms", 1000)
+
+    if err_res > args.tolerance:
+        print("The results of the formulations differ by more than {:.2e}".format(args.tolerance))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
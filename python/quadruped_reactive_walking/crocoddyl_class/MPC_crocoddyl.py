@@ -3,8 +3,9 @@
 import crocoddyl
 import numpy as np
 import quadruped_walkgen 
+from crocoddyl_class.utils_ddp import BudgetedDDP, set_nthreads, update_models
 
-class MPC_crocoddyl:
+class MPC_crocoddyl(BudgetedDDP):
     """Wrapper class for the MPC problem to call the ddp solver and 
     retrieve the results. 
 
@@ -14,9 +15,10 @@ class MPC_crocoddyl:
         mu (float): Friction coefficient
         inner(bool): Inside or outside approximation of the friction cone
         linearModel(bool) : Approximation in the cross product by using desired state
+        nthreads(int) : Number of threads used by crocoddyl to compute the models of the nodes
     """
 
-    def __init__(self, dt = 0.02 , T_mpc = 0.32 ,  mu = 1, inner = True , linearModel = True , n_period = 1):
+    def __init__(self, dt = 0.02 , T_mpc = 0.32 ,  mu = 1, inner = True , linearModel = True , n_period = 1 , nthreads = 1):
 
         # Time step of the solver
         self.dt = dt
@@ -63,9 +65,12 @@ class MPC_crocoddyl:
         # Weight Vector : Friction cone cost
         self.frictionWeights = 1.0
 
-        # Max iteration ddp solver
+        # Max iteration ddp solver (time budget of the solves in utils_ddp.BudgetedDDP)
         self.max_iteration = 10
 
+        # Number of threads of the shooting problem
+        self.nthreads = nthreads
+
         # Warm Start for the solver
         self.warm_start =  True
 
@@ -84,6 +89,9 @@ class MPC_crocoddyl:
         # Position of the feet
         self.fsteps = np.full((20, 13), np.nan)
 
+        # Phase of the gait of each range of nodes (see utils_ddp.update_models)
+        self.phase_ranges = []
+
         # List of the actionModel
         self.ListAction = [] 
 
@@ -138,6 +146,7 @@ class MPC_crocoddyl:
 
         # Shooting problem
         self.problem = crocoddyl.ShootingProblem(np.zeros(12),  self.ListAction, self.terminalModel)
+        set_nthreads(self.problem, self.nthreads)
 
         # DDP Solver
         self.ddp = crocoddyl.SolverDDP(self.problem)
@@ -168,23 +177,26 @@ class MPC_crocoddyl:
         self.gait[:self.index, 1:] = 1.0 - (np.isnan(self.fsteps[:self.index, 1::3]) | (self.fsteps[:self.index, 1::3] == 0.0))
         # Replace NaN values by zeroes
         self.fsteps[np.isnan(self.fsteps)] = 0.0      
+
+        # Position of the feet of each phase as 3x4 blocks (np.reshape(fsteps[j, 1:], (3, 4), order='F') for all j)
+        fsteps_blocks = np.ascontiguousarray(np.reshape(self.fsteps[:, 1:], (-1, 4, 3)).transpose((0, 2, 1)))
       
         j = 0
         k_cum = 0
-        L = []
+        self.phase_ranges = []
         
         # Iterate over all phases of the gait
         # The first column of xref correspond to the current state 
         while (self.gait[j, 0] != 0):
-            for i in range(k_cum, k_cum+np.int(self.gait[j, 0])):
-                # Update model   
-                self.ListAction[i].updateModel(np.reshape(self.fsteps[j, 1:], (3, 4), order='F') , xref[:, i]  , self.gait[j, 1:])           
-                
+            self.phase_ranges.append((j, k_cum, k_cum+np.int(self.gait[j, 0])))
             k_cum += np.int(self.gait[j, 0])
             j += 1
 
+        # Update models
+        update_models(self.ListAction, self.gait, self.phase_ranges, fsteps_blocks, xref)
+
         # Update model of the terminal model
-        self.terminalModel.updateModel(np.reshape(self.fsteps[j-1, 1:], (3, 4), order='F') , xref[:,-1] , self.gait[j-1, 1:])  
+        self.terminalModel.updateModel(fsteps_blocks[j-1] , xref[:,-1] , self.gait[j-1, 1:])  
 
         return 0       
         
@@ -215,7 +227,7 @@ class MPC_crocoddyl:
             self.x_init.insert(0,fstep_planner.xref[:,0])
             self.x_init.append(self.ddp.xs[-1])  
 
-        self.ddp.solve(self.x_init ,  self.u_init, self.max_iteration )
+        self.solve_ddp(self.x_init ,  self.u_init)
 
         return 0
 
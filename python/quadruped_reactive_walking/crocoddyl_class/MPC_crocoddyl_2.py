@@ -3,8 +3,9 @@
 import crocoddyl
 import numpy as np
 import quadruped_walkgen 
+from crocoddyl_class.utils_ddp import BudgetedDDP, set_nthreads, update_models
 
-class MPC_crocoddyl_2:
+class MPC_crocoddyl_2(BudgetedDDP):
     """Wrapper class for the MPC problem to call the ddp solver and 
     retrieve the results. 
 
@@ -14,9 +15,13 @@ class MPC_crocoddyl_2:
         mu (float): Friction coefficient
         inner(bool): Inside or outside approximation of the friction cone
         linearModel(bool) : Approximation in the cross product by using desired state
+        persistent(bool) : Keep the action models, shooting problems and solvers between two updates instead of
+                           creating new ones
+        nthreads(int) : Number of threads used by crocoddyl to compute the models of the nodes
     """
 
-    def __init__(self, dt = 0.02 , T_mpc = 0.32 ,  mu = 1, inner = True , linearModel = True , n_period = 1 , dt_tsid = 0.001):    
+    def __init__(self, dt = 0.02 , T_mpc = 0.32 ,  mu = 1, inner = True , linearModel = True , n_period = 1 , dt_tsid = 0.001,
+                 persistent = False , nthreads = 1):    
 
         # Time step of the solver
         self.dt = dt
@@ -72,9 +77,12 @@ class MPC_crocoddyl_2:
         # Weight Vector : Friction cone cost
         self.frictionWeights = 1.0
 
-        # Max iteration ddp solver
+        # Max iteration ddp solver (time budget of the solves in utils_ddp.BudgetedDDP)
         self.max_iteration = 10
 
+        # Number of threads of the shooting problem
+        self.nthreads = nthreads
+
         # Warm Start for the solver
         self.warm_start =  True
 
@@ -93,6 +101,9 @@ class MPC_crocoddyl_2:
         # Position of the feet
         self.fsteps = np.full((20, 13), np.nan)
 
+        # Phase of the gait of each range of nodes (see utils_ddp.update_models)
+        self.phase_ranges = []
+
         # List of the actionModel
         self.ListAction = [] 
 
@@ -203,11 +214,28 @@ class MPC_crocoddyl_2:
         # Integration
         self.terminalModel.implicit_integration = self.implicit_integration
 
-        # Shooting problem
-        self.problem = crocoddyl.ShootingProblem(np.zeros(12),  self.ListAction, self.terminalModel)
+        # Persistent mode : the horizon has one node less when the first node is removed (less than initial_node
+        # iterations of TSID before the next iteration of the MPC). One shooting problem and one solver are created
+        # for each length, they share the action models of ListAction which are then updated in place
+        self.persistent = persistent
+        if self.persistent : 
+            self.problems = {}
+            self.solvers = {}
+            for n_nodes in [len(self.ListAction), len(self.ListAction) - 1] : 
+                self.problems[n_nodes] = crocoddyl.ShootingProblem(np.zeros(12),  self.ListAction[:n_nodes], self.terminalModel)
+                set_nthreads(self.problems[n_nodes], self.nthreads)
+                self.solvers[n_nodes] = crocoddyl.SolverDDP(self.problems[n_nodes])
+
+            self.problem = self.problems[len(self.ListAction)]
+            self.ddp = self.solvers[len(self.ListAction)]
+
+        else : 
+            # Shooting problem
+            self.problem = crocoddyl.ShootingProblem(np.zeros(12),  self.ListAction, self.terminalModel)
+            set_nthreads(self.problem, self.nthreads)
 
-        # DDP Solver
-        self.ddp = crocoddyl.SolverDDP(self.problem)
+            # DDP Solver
+            self.ddp = crocoddyl.SolverDDP(self.problem)
 
         # Warm start
         self.x_init = []
@@ -340,11 +368,13 @@ class MPC_crocoddyl_2:
         self.xref[5, 1:] = v_ref[5, 0] * self.dt_vector[1:]
         self.xref[11, 1:] = v_ref[5, 0]
 
-        i = 0
-        
+        # Position of the feet of each phase as 3x4 blocks (np.reshape(fsteps[j, 1:], (3, 4), order='F') for all j)
+        fsteps_blocks = np.ascontiguousarray(np.reshape(self.fsteps[:, 1:], (-1, 4, 3)).transpose((0, 2, 1)))
+        self.phase_ranges = []
 
+        # In persistent mode ListAction always has N_total models, the last one is not part of the shorter problem
         if k_remaining >= self.initial_node : 
-            if len(self.ListAction) != N_total : 
+            if len(self.ListAction) != N_total and not self.persistent : 
                 model = self.new_model()
                 self.ListAction.append(model)
 
@@ -354,16 +384,16 @@ class MPC_crocoddyl_2:
                 else : 
                     self.ListAction[i].dt = self.dt_tsid
 
-                self.ListAction[i].updateModel(np.reshape(self.fsteps[0, 1:], (3, 4), order='F') , self.xref[:, i]  , self.gait[0, 1:])
-            
+            self.phase_ranges.append((0, 0, self.initial_node))
 
         else : 
-            if len(self.ListAction) != N_total - 1 : 
+            if len(self.ListAction) != N_total - 1 and not self.persistent : 
                 self.ListAction.pop(-1)
 
             for i in range(k_remaining) : 
                 self.ListAction[i].dt = self.dt_tsid
-                self.ListAction[i].updateModel(np.reshape(self.fsteps[0, 1:], (3, 4), order='F') , self.xref[:, i]  , self.gait[0, 1:])
+
+            self.phase_ranges.append((0, 0, k_remaining))
 
             for i in range(k_remaining , k_remaining + self.initial_node - k_remaining) : 
                 if i == k_remaining + self.initial_node - k_remaining - 1 :                        
@@ -371,21 +401,18 @@ class MPC_crocoddyl_2:
                 else : 
                     self.ListAction[i].dt = self.dt_tsid
 
-                if self.gait[0,0] > 1 : 
-                    self.ListAction[i].updateModel(np.reshape(self.fsteps[0, 1:], (3, 4), order='F') , self.xref[:, i]  , self.gait[0, 1:])
-                else : 
-                    self.ListAction[i].updateModel(np.reshape(self.fsteps[1, 1:], (3, 4), order='F') , self.xref[:, i]  , self.gait[1, 1:])
+            if self.gait[0,0] > 1 : 
+                self.phase_ranges.append((0, k_remaining, self.initial_node))
+            else : 
+                self.phase_ranges.append((1, k_remaining, self.initial_node))
         
         k_cum = self.initial_node
-        L = []  
 
         
         # Iterate over the 1st phase of the gait
         if k_remaining >= self.initial_node : #1st node removed
             if self.gait[0,0] > 1 :
-                for i in range(k_cum, k_cum+np.int(self.gait[0, 0] - 1)):
-                    # Update model   
-                    self.ListAction[i].updateModel(np.reshape(self.fsteps[0, 1:], (3, 4), order='F') , self.xref[:, i]  , self.gait[0, 1:])  
+                self.phase_ranges.append((0, k_cum, k_cum+np.int(self.gait[0, 0] - 1)))
                 k_cum += np.int(self.gait[0, 0] - 1)
                 j_init = 1         
             else : 
@@ -393,9 +420,7 @@ class MPC_crocoddyl_2:
         
         else : # the 2 first nodes to remove
             if self.gait[0,0] > 2 :
-                for i in range(k_cum, k_cum+np.int(self.gait[0, 0]-2)):
-                    # Update model   
-                    self.ListAction[i].updateModel(np.reshape(self.fsteps[0, 1:], (3, 4), order='F') , self.xref[:, i]  , self.gait[0, 1:])           
+                self.phase_ranges.append((0, k_cum, k_cum+np.int(self.gait[0, 0]-2)))
                 k_cum += np.int(self.gait[0, 0] - 2)
                 j_init = 1
             else : 
@@ -405,9 +430,7 @@ class MPC_crocoddyl_2:
                     if self.gait[1,0] == 1 : # 1 1001 | 1 1111
                         j_init = 2
                     else : # 1 1111 | 7 1001
-                        for i in range(k_cum, k_cum+np.int(self.gait[1, 0]-1)):
-                            # Update model   
-                            self.ListAction[i].updateModel(np.reshape(self.fsteps[1, 1:], (3, 4), order='F') , self.xref[:, i]  , self.gait[1, 1:])
+                        self.phase_ranges.append((1, k_cum, k_cum+np.int(self.gait[1, 0]-1)))
                         k_cum += np.int(self.gait[1, 0] - 1)
                         j_init = 2
 
@@ -415,27 +438,32 @@ class MPC_crocoddyl_2:
         j = j_init
         # Iterate over all phases of the gait
         # The first column of xref correspond to the current state 
-        # print(len(self.ListAction))
         while (self.gait[j, 0] != 0):
-            for i in range(k_cum, k_cum+np.int(self.gait[j, 0])):
-                # Update model   
-                # print(i)
-                self.ListAction[i].updateModel(np.reshape(self.fsteps[j, 1:], (3, 4), order='F') , self.xref[:, i]  , self.gait[j, 1:])           
-                
+            self.phase_ranges.append((j, k_cum, k_cum+np.int(self.gait[j, 0])))
             k_cum += np.int(self.gait[j, 0])
             j += 1
 
+        # Update models
+        update_models(self.ListAction, self.gait, self.phase_ranges, fsteps_blocks, self.xref)
+
         # Update model of the terminal model
-        self.terminalModel.updateModel(np.reshape(self.fsteps[j-1, 1:], (3, 4), order='F') , self.xref[:,-1] , self.gait[j-1, 1:])  
+        self.terminalModel.updateModel(fsteps_blocks[j-1] , self.xref[:,-1] , self.gait[j-1, 1:])  
+
+        if self.persistent : 
+            # The models have been updated in place, only the problem with the right number of nodes is selected
+            self.problem = self.problems[nb_total - 1]
+            self.ddp = self.solvers[nb_total - 1]
+        else : 
+            # Shooting problem
+            self.problem = crocoddyl.ShootingProblem(np.zeros(12),  self.ListAction, self.terminalModel)
+            set_nthreads(self.problem, self.nthreads)
+
+            # DDP Solver
+            self.ddp = crocoddyl.SolverDDP(self.problem)
 
-         # Shooting problem
-        self.problem = crocoddyl.ShootingProblem(np.zeros(12),  self.ListAction, self.terminalModel)
         # Update initial state of the problem
         self.problem.x0 = self.xref[:,0]
 
-        # DDP Solver
-        self.ddp = crocoddyl.SolverDDP(self.problem)
-
         return 0       
         
 
@@ -465,7 +493,7 @@ class MPC_crocoddyl_2:
             self.x_init.insert(0,fstep_planner.xref[:,0])
             self.x_init.append(self.ddp.xs[-1])  
 
-        self.ddp.solve(self.x_init ,  self.u_init, self.max_iteration )
+        self.solve_ddp(self.x_init ,  self.u_init)
 
         return 0
 
@@ -8,9 +8,10 @@ import numpy as np
 import quadruped_walkgen
 import utils
 import pinocchio as pin
+from crocoddyl_class.utils_ddp import BudgetedDDP, set_nthreads
 
 
-class MPC_crocoddyl_planner():
+class MPC_crocoddyl_planner(BudgetedDDP):
     """Wrapper class for the MPC problem to call the ddp solver and 
     retrieve the results. 
 
@@ -19,9 +20,10 @@ class MPC_crocoddyl_planner():
         T_mpc (float): Duration of the prediction horizon
         mu (float): Friction coefficient
         inner(bool): Inside or outside approximation of the friction cone
+        nthreads(int): Number of threads used by crocoddyl to compute the models of the nodes
     """
 
-    def __init__(self, dt = 0.02 , T_mpc = 0.32 ,  mu = 1, inner = True  , warm_start = False , min_fz = 0.0 , n_periods = 1):    
+    def __init__(self, dt = 0.02 , T_mpc = 0.32 ,  mu = 1, inner = True  , warm_start = False , min_fz = 0.0 , n_periods = 1 , nthreads = 1):    
 
         # Time step of the solver
         self.dt = dt
@@ -73,9 +75,12 @@ class MPC_crocoddyl_planner():
         # self.frictionWeights = 10
         self.frictionWeights = 0.5
 
-        # Max iteration ddp solver
+        # Max iteration ddp solver (time budget of the solves in utils_ddp.BudgetedDDP)
         self.max_iteration = 10
 
+        # Number of threads of the shooting problem
+        self.nthreads = nthreads
+
         # Warm Start for the solver
         self.warm_start = warm_start
 
@@ -140,6 +145,11 @@ class MPC_crocoddyl_planner():
         # Initial foot location (local frame, X,Y plan)
         self.p0 = [ 0.1946,0.15005, 0.1946,-0.15005, -0.1946,   0.15005 ,-0.1946,  -0.15005]
 
+        # Pool of step models for roll : the step models removed from ListAction are kept configured and added again
+        # later instead of creating and configuring new ones (False to always create new ones)
+        self.model_pool = True
+        self.step_model_pool = []
+
     def solve(self, k, xref , l_feet ,  oMl = pin.SE3.Identity()):
         """ Solve the MPC problem 
 
@@ -153,7 +163,7 @@ class MPC_crocoddyl_planner():
         self.updateProblem( k , xref , l_feet , oMl)
 
         # Solve problem
-        self.ddp.solve(self.x_init,self.u_init, self.max_iteration)        
+        self.solve_ddp(self.x_init,self.u_init)        
         
         # Get the results
         self.get_fsteps()
@@ -255,6 +265,7 @@ class MPC_crocoddyl_planner():
 
         # Shooting problem
         self.problem = crocoddyl.ShootingProblem(np.zeros(20),  self.ListAction, self.terminalModel)
+        set_nthreads(self.problem, self.nthreads)
 
         self.problem.x0 = np.concatenate([xref[:,0] , p0   ])
 
@@ -351,8 +362,16 @@ class MPC_crocoddyl_planner():
         self.terminalModel.shoulderWeights = np.full(8,0.0)
         self.terminalModel.lastPositionWeights =  np.full(8,0.0)
 
+        # Step model ready for the first step model added by roll
+        self.step_model_pool = []
+        if self.model_pool : 
+            model = quadruped_walkgen.ActionModelQuadrupedStep()
+            self.update_model_step(model)
+            self.step_model_pool.append(model)
+
         # Shooting problem
         self.problem = crocoddyl.ShootingProblem(np.zeros(20),  self.ListAction, self.terminalModel)
+        set_nthreads(self.problem, self.nthreads)
 
         # DDP Solver
         self.ddp = crocoddyl.SolverDDP(self.problem)
@@ -406,9 +425,11 @@ class MPC_crocoddyl_planner():
             self.gait[index, 1:] = self.gait[0, 1:]
             self.gait[index, 0] = 1.0
 
-        # Remove first model
+        # Remove first model, the step model goes back to the pool
         if self.ListAction[0].__class__.__name__ == "ActionModelQuadrupedStep" :
-            self.ListAction.pop(0)
+            modelStep = self.ListAction.pop(0)
+            if self.model_pool : 
+                self.step_model_pool.append(modelStep)
         model = self.ListAction.pop(0)
 
         # Decrease the current phase by 1 step and delete it if it has ended
@@ -425,8 +446,11 @@ class MPC_crocoddyl_planner():
 
         # Add last model & step model if needed
         if np.sum(self.gait[index - 1, 1:]) == 4 and self.gait[index - 1, 0 ] != 0: 
-            modelStep = quadruped_walkgen.ActionModelQuadrupedStep()
-            self.update_model_step(modelStep)
+            if len(self.step_model_pool) > 0 : 
+                modelStep = self.step_model_pool.pop()
+            else : 
+                modelStep = quadruped_walkgen.ActionModelQuadrupedStep()
+                self.update_model_step(modelStep)
 
             # Add model to the list of model
             self.ListAction.append(modelStep)
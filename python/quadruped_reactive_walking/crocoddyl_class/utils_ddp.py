@@ -0,0 +1,131 @@
+# coding: utf8
+
+import time
+import numpy as np
+
+
+def run_ddp(ddp, x_init, u_init, max_iteration, time_budget=None, stall_threshold=1e-4):
+    """Run a ddp solver of crocoddyl and return the number of iterations and the duration of the solve (s)
+
+    Without time budget the solver runs up to max_iteration iterations like ddp.solve. With a time budget the
+    solver runs one iteration at a time and stops when the next iteration would end after the deadline (based on
+    the duration of the previous one), when it has converged or when the cost stalls. The best feasible iterate is
+    then left in the solver (ddp.xs and ddp.us).
+
+    Args:
+        ddp (crocoddyl.SolverDDP): solver of the problem
+        x_init (list): initial guess of the states (empty for none)
+        u_init (list): initial guess of the commands (empty for none)
+        max_iteration (int): maximum number of iterations
+        time_budget (float): duration allowed for the solve (s), None for no time limit
+        stall_threshold (float): minimum relative decrease of the cost for an iteration (time budget only)
+    """
+
+    tic = time.time()
+    if time_budget is None:
+        # ddp.iter is the index of the last iteration when the solver has converged
+        converged = ddp.solve(x_init, u_init, max_iteration)
+        return ddp.iter + 1 if converged else ddp.iter, time.time() - tic
+
+    deadline = tic + time_budget
+    n_iter = 0
+    t_iter = 0.0
+    cost = np.inf
+    best_cost = np.inf
+    best_xs, best_us = None, None
+    while n_iter < max_iteration:
+        t_start = time.time()
+        if n_iter > 0 and t_start + t_iter > deadline:
+            break
+
+        # One more iteration from the current iterate, with the regularization reached by the previous one
+        if n_iter == 0:
+            converged = ddp.solve(x_init, u_init, 1)
+        else:
+            converged = ddp.solve(ddp.xs, ddp.us, 1, ddp.isFeasible, ddp.x_reg)
+        t_iter = time.time() - t_start
+        n_iter += 1
+
+        if ddp.isFeasible and ddp.cost < best_cost:
+            best_cost = ddp.cost
+            best_xs, best_us = ddp.xs, ddp.us
+
+        # A rejected step leaves the cost unchanged and increases the regularization, it is not a stall. There is
+        # no previous cost after the first iteration.
+        stalled = np.isfinite(cost) and 0.0 < cost - ddp.cost <= stall_threshold * abs(cost)
+        cost = ddp.cost
+        if converged or stalled:
+            break
+
+    if best_xs is not None and (not ddp.isFeasible or best_cost < ddp.cost):
+        ddp.setCandidate(best_xs, best_us, True)
+
+    return n_iter, time.time() - tic
+
+
+class BudgetedDDP:
+    """Solve of the ddp solver of a crocoddyl MPC wrapper within a time budget (see run_ddp), the wrapper defines
+    ddp and max_iteration
+
+    Attributes:
+        time_budget (float): duration allowed for a solve (s), None to always run up to max_iteration iterations
+        stall_threshold (float): minimum relative decrease of the cost for an iteration with a time budget
+        solve_iterations (int): number of iterations of the last solve
+        solve_time (float): duration of the last solve (s)
+    """
+
+    time_budget = None
+    stall_threshold = 1e-4
+    solve_iterations = 0
+    solve_time = 0.0
+
+    def solve_ddp(self, x_init, u_init):
+        """Run the ddp solver from an initial guess, within the time budget if there is one, and record the number
+        of iterations and the duration of the solve
+
+        Args:
+            x_init (list): initial guess of the states (empty for none)
+            u_init (list): initial guess of the commands (empty for none)
+        """
+
+        self.solve_iterations, self.solve_time = run_ddp(self.ddp, x_init, u_init, self.max_iteration,
+                                                         self.time_budget, self.stall_threshold)
+
+        return 0
+
+
+def update_models(models, gait, phase_ranges, fsteps_blocks, xref):
+    """Update the dynamic of the models phase by phase of the gait, the footsteps and the contacts are the same
+    for all the nodes of a phase
+
+    Args:
+        models (list): running models of the problem
+        gait (Nx5 array): duration (first column) and contacts of each phase of the gait
+        phase_ranges (list): (j, i_start, i_end) for each range of nodes, the models i_start to i_end - 1 are
+                             in the phase j of the gait
+        fsteps_blocks (Nx3x4 array): Position of the feet for each phase of the gait
+        xref (12xN): Desired state vector of each node
+    """
+
+    xref_nodes = np.ascontiguousarray(xref.T)
+    for j, i_start, i_end in phase_ranges:
+        l_feet = fsteps_blocks[j]
+        contacts = gait[j, 1:]
+        for model, x in zip(models[i_start:i_end], xref_nodes[i_start:i_end]):
+            model.updateModel(l_feet, x, contacts)
+
+
+def set_nthreads(problem, nthreads):
+    """Set the number of threads used by a shooting problem of crocoddyl to compute the models of its nodes
+
+    Versions of crocoddyl without this setting keep computing the nodes one after the other.
+
+    Args:
+        problem (crocoddyl.ShootingProblem): shooting problem
+        nthreads (int): number of threads
+    """
+
+    if nthreads < 1:
+        raise ValueError("The number of threads should be at least 1")
+    if hasattr(problem, "nthreads") and problem.nthreads != nthreads:
+        problem.nthreads = nthreads
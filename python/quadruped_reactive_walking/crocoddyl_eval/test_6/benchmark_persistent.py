@@ -0,0 +1,77 @@
+# coding: utf8
+import sys
+import os
+sys.path.insert(0, os.getcwd()) # adds current directory to python path
+
+import time
+import argparse
+import numpy as np
+from benchmark_warm_start import dt_wbc, dt_mpc, k_mpc, T_gait, record_trajectory, print_distribution
+from crocoddyl_class.MPC_crocoddyl_2 import MPC_crocoddyl_2
+
+
+def run_mpc(xref, fsteps, persistent):
+    """Update and solve the MPC_crocoddyl_2 at each iteration of TSID and return the duration of the updates and
+    of the solves and the forces of the first node
+
+    Args:
+        xref (Nx12xN+1 array): reference trajectories, one sample per iteration of the MPC
+        fsteps (Nx20x13 array): footsteps, one sample per iteration of the MPC
+        persistent (bool): update the models, problems and solvers in place
+    """
+
+    mpc = MPC_crocoddyl_2(dt=dt_mpc, T_mpc=T_gait, mu=0.9, inner=False, linearModel=False, n_period=1,
+                          dt_tsid=dt_wbc, persistent=persistent)
+    v_ref = np.zeros((6, 1))
+
+    n_tsid = xref.shape[0] * k_mpc
+    t_update = np.zeros(n_tsid)
+    t_solve = np.zeros(n_tsid)
+    forces = np.zeros((n_tsid, 12))
+    for k in range(n_tsid):
+        # Inputs of the last iteration of the MPC
+        i = k // k_mpc
+        v_ref[:, 0] = xref[i, 6:12, 1]
+
+        tic = time.time()
+        mpc.updateProblem(k, fsteps[i], xref[i], xref[i, 0:3, 0:1], xref[i, 3:6, 0:1], xref[i, 6:9, 0:1],
+                          xref[i, 9:12, 0:1], v_ref, xref[i, 2, 1])
+        toc = time.time()
+        mpc.ddp.solve([], [], mpc.max_iteration)
+        t_solve[k] = time.time() - toc
+        t_update[k] = toc - tic
+        forces[k] = mpc.get_latest_result()
+
+    return t_update, t_solve, forces
+
+
+def main():
+    """Main function
+    """
+
+    parser = argparse.ArgumentParser(description='Latency of MPC_crocoddyl_2 at the frequency of TSID with and '
+                                                 'without persistent shooting problems.')
+    parser.add_argument('-d',
+                        '--duration',
+                        type=float,
+                        default=5.0,
+                        help='Duration of the simulation (s)')
+    args = parser.parse_args()
+
+    xref, fsteps = record_trajectory(int(args.duration / dt_mpc))
+    print("Simulation of {:.1f} s, {} calls to the MPC".format(args.duration, xref.shape[0] * k_mpc))
+
+    results = {}
+    for persistent in [False, True]:
+        t_update, t_solve, forces = run_mpc(xref, fsteps, persistent)
+        results[persistent] = forces
+        print(("Persistent" if persistent else "New") + " shooting problem at each call")
+        print_distribution("update", t_update, "ms", 1000)
+        print_distribution("solve", t_solve, "ms", 1000)
+        print_distribution("total", t_update + t_solve, "ms", 1000)
+
+    print("Maximum difference between the forces: {:.2e}".format(np.max(np.abs(results[True] - results[False]))))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+# coding: utf8
+import sys
+import os
+sys.path.insert(0, os.getcwd()) # adds current directory to python path
+
+import time
+import argparse
+import numpy as np
+from benchmark_warm_start import dt_mpc, T_gait, h_ref, fsteps_init
+from crocoddyl_class.MPC_crocoddyl import MPC_crocoddyl
+
+
+def benchmark(n_period, nthreads, n_repeat):
+    """Mean duration of the computation of the models of all the nodes (calc and calcDiff of the shooting
+    problem) and of a solve of the MPC_crocoddyl, in seconds
+
+    Args:
+        n_period (int): number of periods of gait in the prediction horizon
+        nthreads (int): number of threads of the shooting problem
+        n_repeat (int): number of repetitions of the computations
+    """
+
+    mpc = MPC_crocoddyl(dt=dt_mpc, T_mpc=T_gait, mu=0.9, inner=False, linearModel=False, n_period=n_period,
+                        nthreads=nthreads)
+    n_nodes = len(mpc.ListAction)
+
+    # All feet in contact during the whole horizon, robot at the reference height
+    fsteps = np.zeros((20, 13))
+    fsteps[0, 0] = n_nodes
+    fsteps[0, 1:] = fsteps_init.ravel(order='F')
+    xref = np.zeros((12, n_nodes + 1))
+    xref[2, :] = h_ref
+    mpc.updateProblem(fsteps, xref)
+
+    xs = [xref[:, i] for i in range(n_nodes + 1)]
+    us = [np.zeros(12) for i in range(n_nodes)]
+    tic = time.time()
+    for _ in range(n_repeat):
+        mpc.problem.calc(xs, us)
+        mpc.problem.calcDiff(xs, us)
+    t_calc = (time.time() - tic) / n_repeat
+
+    tic = time.time()
+    for _ in range(n_repeat):
+        mpc.ddp.solve([], [], mpc.max_iteration)
+    t_solve = (time.time() - tic) / n_repeat
+
+    return t_calc, t_solve
+
+
+def main():
+    """Main function
+    """
+
+    parser = argparse.ArgumentParser(description='Scaling of the crocoddyl MPC with the number of threads used to '
+                                                 'compute the models of the nodes, for several horizon lengths.')
+    parser.add_argument('-t',
+                        '--threads',
+                        type=int,
+                        default=os.cpu_count(),
+                        help='Maximum number of threads')
+    parser.add_argument('-r',
+                        '--repeat',
+                        type=int,
+                        default=100,
+                        help='Number of repetitions of each computation')
+    args = parser.parse_args()
+
+    if not hasattr(MPC_crocoddyl(n_period=1).problem, "nthreads"):
+        print("This version of crocoddyl has no multithreading setting, all the runs use one thread")
+
+    threads = sorted(set([1, 2, 4, 8, args.threads]) & set(range(1, args.threads + 1)))
+    print("nodes | threads | calc + calcDiff (us) | speedup | solve (ms) | speedup")
+    for n_period in [1, 2, 4]:
+        for nthreads in threads:
+            t_calc, t_solve = benchmark(n_period, nthreads, args.repeat)
+            if nthreads == 1:
+                t_calc_1, t_solve_1 = t_calc, t_solve
+            print("{:5d} | {:7d} | {:20.1f} | {:7.2f} | {:10.3f} | {:7.2f}".format(
+                int(T_gait / dt_mpc) * n_period, nthreads, 1e6 * t_calc, t_calc_1 / t_calc, 1e3 * t_solve,
+                t_solve_1 / t_solve))
+
+
+if __name__ == "__main__":
+    main()
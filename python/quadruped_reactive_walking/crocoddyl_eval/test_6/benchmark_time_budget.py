@@ -0,0 +1,89 @@
+# coding: utf8
+import sys
+import os
+sys.path.insert(0, os.getcwd()) # adds current directory to python path
+
+import argparse
+import numpy as np
+from benchmark_warm_start import dt_mpc, n_steps, k_mpc, T_gait, record_trajectory, print_distribution
+from MPC_Backends import create_backend
+
+
+def run_backend(name, xref, fsteps, options):
+    """Solve the MPC with a crocoddyl backend for each sample of the trajectory and return the number of iterations,
+    the durations of the solves and the forces of the first node
+
+    Args:
+        name (string): name of the backend
+        xref (Nx12xN+1 array): reference trajectories
+        fsteps (Nx20x13 array): footsteps
+        options (dict): options of the backend
+    """
+
+    backend = create_backend(name, dt_mpc, n_steps, k_mpc, T_gait, options)
+    iters = np.zeros(xref.shape[0], dtype=int)
+    t_solve = np.zeros(xref.shape[0])
+    forces = np.zeros((xref.shape[0], 12))
+    for i in range(xref.shape[0]):
+        backend.solve(i * k_mpc, xref[i], fsteps[i])
+        stats = backend.get_solver_stats()
+        iters[i] = stats["iter"]
+        t_solve[i] = stats["solve_time"]
+        forces[i] = backend.result[12:, 0]
+
+    return iters, t_solve, forces
+
+
+def main():
+    """Main function
+    """
+
+    parser = argparse.ArgumentParser(description='Iterations and duration of the solves of the crocoddyl MPC with '
+                                                 'a fixed number of iterations and with time budgets.')
+    parser.add_argument('-n',
+                        '--iterations',
+                        type=int,
+                        default=200,
+                        help='Number of iterations of the MPC in the recorded trajectory')
+    parser.add_argument('-b',
+                        '--backend',
+                        type=str,
+                        default="crocoddyl",
+                        choices=["crocoddyl", "crocoddyl_2", "crocoddyl_planner"],
+                        help='Backend of the MPC')
+    parser.add_argument('-t',
+                        '--tolerance',
+                        type=float,
+                        default=1e-9,
+                        help='Maximum difference between the forces of the fixed and of the unreached budgeted solves')
+    args = parser.parse_args()
+
+    xref, fsteps = record_trajectory(args.iterations)
+
+    # Fixed number of iterations
+    iters_ref, _, forces_ref = run_backend(args.backend, xref, fsteps, {})
+
+    # A budget that is never reached without stall detection runs the same iterations as the fixed number of
+    # iterations
+    iters, _, forces = run_backend(args.backend, xref, fsteps, {"time_budget": 1.0, "stall_threshold": 0.0})
+    err = np.max(np.abs(forces - forces_ref))
+    print("Budget of 1 s without stall detection: {} solves with other iterations than the fixed number of "
+          "iterations, maximum difference of the forces {:.2e}".format(np.count_nonzero(iters != iters_ref), err))
+    if np.any(iters != iters_ref) or err > args.tolerance:
+        print("The budgeted solve differs from the solve with a fixed number of iterations")
+        sys.exit(1)
+
+    for time_budget in [None, 0.010, 0.005, 0.002]:
+        if time_budget is None:
+            iters, t_solve, forces = run_backend(args.backend, xref, fsteps, {})
+            print("Fixed number of iterations")
+        else:
+            iters, t_solve, forces = run_backend(args.backend, xref, fsteps, {"time_budget": time_budget})
+            print("Time budget of {:.0f} ms, maximum difference of the forces with the fixed number of iterations "
+                  "{:.2e}".format(1000 * time_budget, np.max(np.abs(forces - forces_ref))))
+        # The first solve starts without warm start
+        print_distribution("iterations", iters[1:], "")
+        print_distribution("solve time", t_solve[1:], "ms", 1000)
+
+if __name__ == "__main__":
+    main()
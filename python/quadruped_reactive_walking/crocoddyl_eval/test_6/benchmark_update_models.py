@@ -0,0 +1,146 @@
+# coding: utf8
+import sys
+import os
+sys.path.insert(0, os.getcwd()) # adds current directory to python path
+
+import time
+import argparse
+import numpy as np
+from benchmark_warm_start import dt_wbc, dt_mpc, k_mpc, T_gait, record_trajectory, print_distribution
+from crocoddyl_class.MPC_crocoddyl import MPC_crocoddyl
+from crocoddyl_class.MPC_crocoddyl_2 import MPC_crocoddyl_2
+from crocoddyl_class.utils_ddp import update_models
+
+
+def update_node_by_node(mpc, xref):
+    """Update the models of the wrapper node by node with the phases of its last update, the footsteps of the
+    phase being reshaped for each node (previous implementation of updateProblem)
+
+    Args:
+        mpc (MPC_crocoddyl or MPC_crocoddyl_2): wrapper whose problem has been updated
+        xref (12xN): Desired state vector of each node
+    """
+
+    for j, i_start, i_end in mpc.phase_ranges:
+        for i in range(i_start, i_end):
+            mpc.ListAction[i].updateModel(np.reshape(mpc.fsteps[j, 1:], (3, 4), order='F'), xref[:, i],
+                                          mpc.gait[j, 1:])
+
+
+def update_by_phase(mpc, xref):
+    """Update the models of the wrapper phase by phase with the phases of its last update
+
+    Args:
+        mpc (MPC_crocoddyl or MPC_crocoddyl_2): wrapper whose problem has been updated
+        xref (12xN): Desired state vector of each node
+    """
+
+    fsteps_blocks = np.ascontiguousarray(np.reshape(mpc.fsteps[:, 1:], (-1, 4, 3)).transpose((0, 2, 1)))
+    update_models(mpc.ListAction, mpc.gait, mpc.phase_ranges, fsteps_blocks, xref)
+
+
+def evaluate_models(mpc, x, u):
+    """Next states and costs of the running models of the wrapper for the given states and commands
+
+    Args:
+        mpc (MPC_crocoddyl or MPC_crocoddyl_2): wrapper whose problem has been updated
+        x (Nx12 array): state of each node
+        u (Nx12 array): command of each node
+    """
+
+    values = []
+    for i, model in enumerate(mpc.ListAction[:len(mpc.problem.runningModels)]):
+        data = model.createData()
+        model.calc(data, x[i], u[i])
+        values.append(np.concatenate([np.asarray(data.xnext), [data.cost]]))
+
+    return np.array(values)
+
+
+def benchmark(name, mpc, updates, n_repeat):
+    """Time both ways to update the models after each update of the problem by the wrapper and check that they
+    give the same models
+
+    Args:
+        name (string): name of the wrapper
+        mpc (MPC_crocoddyl or MPC_crocoddyl_2): wrapper
+        updates (generator): updates the problem of the wrapper for each sample of the trajectory and yields the
+                             desired state vector of each node
+        n_repeat (int): number of repetitions of each way for each sample
+    """
+
+    x = np.random.rand(len(mpc.ListAction), 12)
+    u = np.random.rand(len(mpc.ListAction), 12)
+    t_node, t_phase, n_phases, n_nodes = [], [], [], []
+    err = 0.0
+    for xref in updates:
+        n_phases.append(len(mpc.phase_ranges))
+        n_nodes.append(mpc.phase_ranges[-1][2])
+
+        tic = time.time()
+        for _ in range(n_repeat):
+            update_node_by_node(mpc, xref)
+        t_node.append((time.time() - tic) / n_repeat)
+        values = evaluate_models(mpc, x, u)
+
+        tic = time.time()
+        for _ in range(n_repeat):
+            update_by_phase(mpc, xref)
+        t_phase.append((time.time() - tic) / n_repeat)
+        err = max(err, np.max(np.abs(evaluate_models(mpc, x, u) - values)))
+
+    print(name + ", {:.1f} phases for {:.1f} nodes on average".format(np.mean(n_phases), np.mean(n_nodes)))
+    print_distribution("node by node", t_node, "us", 1e6)
+    print_distribution("by phase", t_phase, "us", 1e6)
+    print("  Maximum difference between the models: {:.2e}".format(err))
+
+
+def main():
+    """Main function
+    """
+
+    parser = argparse.ArgumentParser(description='Update of the models of the crocoddyl MPC wrappers node by node '
+                                                 'and phase by phase.')
+    parser.add_argument('-n',
+                        '--iterations',
+                        type=int,
+                        default=100,
+                        help='Number of iterations of the MPC in the recorded trajectory')
+    parser.add_argument('-r',
+                        '--repeat',
+                        type=int,
+                        default=20,
+                        help='Number of repetitions of each update')
+    args = parser.parse_args()
+
+    xref, fsteps = record_trajectory(args.iterations)
+    n_steps = xref.shape[2] - 1
+
+    mpc = MPC_crocoddyl(dt=dt_mpc, T_mpc=T_gait, mu=0.9, inner=False, linearModel=True,
+                        n_period=int((dt_mpc * n_steps) / T_gait))
+
+    def updates():
+        for i in range(xref.shape[0]):
+            mpc.updateProblem(fsteps[i], xref[i])
+            yield xref[i]
+
+    benchmark("MPC_crocoddyl", mpc, updates(), args.repeat)
+
+    # At the frequency of TSID
+    mpc_2 = MPC_crocoddyl_2(dt=dt_mpc, T_mpc=T_gait, mu=0.9, inner=False, linearModel=False, n_period=1,
+                            dt_tsid=dt_wbc, persistent=True)
+    v_ref = np.zeros((6, 1))
+
+    def updates_2():
+        for k in range(xref.shape[0] * k_mpc):
+            i = k // k_mpc
+            v_ref[:, 0] = xref[i, 6:12, 1]
+            mpc_2.updateProblem(k, fsteps[i], xref[i], xref[i, 0:3, 0:1], xref[i, 3:6, 0:1], xref[i, 6:9, 0:1],
+                                xref[i, 9:12, 0:1], v_ref, xref[i, 2, 1])
+            yield mpc_2.xref
+
+    benchmark("MPC_crocoddyl_2", mpc_2, updates_2(), args.repeat)
+
+
+if __name__ == "__main__":
+    main()
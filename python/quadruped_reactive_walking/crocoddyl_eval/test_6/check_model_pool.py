@@ -0,0 +1,83 @@
+# coding: utf8
+import sys
+import os
+sys.path.insert(0, os.getcwd()) # adds current directory to python path
+
+import argparse
+import numpy as np
+from benchmark_warm_start import dt_mpc, n_steps, k_mpc, T_gait, record_trajectory
+from MPC_Backends import create_backend
+
+
+def evaluate_models(mpc, x, u):
+    """Class names of the running models of the planner MPC and values computed by their calc and calcDiff for the
+    given states and commands
+
+    Args:
+        mpc (MPC_crocoddyl_planner): planner MPC whose problem has been updated
+        x (Nx20 array): state of each node
+        u (Nx12 array): command of each node (only the first ones are used for the step models)
+    """
+
+    names = []
+    values = []
+    for i, model in enumerate(mpc.problem.runningModels):
+        data = model.createData()
+        model.calc(data, x[i], u[i, :model.nu])
+        model.calcDiff(data, x[i], u[i, :model.nu])
+        names.append(model.__class__.__name__)
+        values.append(np.concatenate([np.asarray(data.xnext), [data.cost], np.ravel(data.Fx), np.ravel(data.Fu),
+                                      np.asarray(data.Lx), np.asarray(data.Lu), np.ravel(data.Lxx),
+                                      np.ravel(data.Luu)]))
+
+    return names, values
+
+
+def main():
+    """Main function
+    """
+
+    parser = argparse.ArgumentParser(description='Check that the problem of the planner MPC rolled with the pool of '
+                                                 'step models is the same as with new step models.')
+    parser.add_argument('-n',
+                        '--iterations',
+                        type=int,
+                        default=100,
+                        help='Number of iterations of the MPC in the recorded trajectory')
+    args = parser.parse_args()
+
+    xref, fsteps = record_trajectory(args.iterations)
+
+    backends = [create_backend("crocoddyl_planner", dt_mpc, n_steps, k_mpc, T_gait) for _ in range(2)]
+    backends[1].mpc.model_pool = False
+
+    x = np.random.rand(2 * n_steps, 20)
+    u = np.random.rand(2 * n_steps, 12)
+    err_models = 0.0
+    err_result = 0.0
+    step_models = [set(), set()]
+    for i in range(xref.shape[0]):
+        names, values = [], []
+        for j, backend in enumerate(backends):
+            backend.solve(i * k_mpc, xref[i], fsteps[i])
+            step_models[j].update(id(model) for model in backend.mpc.ListAction
+                                  if model.__class__.__name__ == "ActionModelQuadrupedStep")
+            n, v = evaluate_models(backend.mpc, x, u)
+            names.append(n)
+            values.append(v)
+
+        if names[0] != names[1] or not np.array_equal(backends[0].mpc.problem.x0, backends[1].mpc.problem.x0):
+            print("The rolled problems differ at iteration " + str(i))
+            sys.exit(1)
+        err_models = max(err_models, max(np.max(np.abs(a - b)) for a, b in zip(values[0], values[1])))
+        err_result = max(err_result, np.max(np.abs(backends[0].result - backends[1].result)))
+
+    print("Step models created: {} with the pool, {} without".format(len(step_models[0]), len(step_models[1])))
+    print("Maximum difference between the models: {:.2e}".format(err_models))
+    print("Maximum difference between the results: {:.2e}".format(err_result))
+    if err_models > 0.0 or err_result > 0.0:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -7,24 +7,17 @@ sys.path.insert(0, './solopython')
 
 
 import threading
-from Controller import Controller
 import numpy as np
 import argparse
-from LoggerSensors import LoggerSensors
-from LoggerControl import LoggerControl
 
+# The controller, the loggers and the interfaces of the robot are imported in the functions that use them. The MPC
+# process (forkserver or spawn) imports this script again as __mp_main__ and must not load them (pinocchio, pybullet,
+# solopython...)
 
 SIMULATION = False
 LOGGING = False
 PLOTTING = False
 
-if SIMULATION:
-    from PyBulletSimulator import PyBulletSimulator
-else:
-    # from pynput import keyboard
-    from solopython.solo12 import Solo12
-    from solopython.utils.qualisysClient import QualisysClient
-
 DT = 0.0020
 
 key_pressed = False
@@ -69,6 +62,8 @@ def put_on_the_floor(device, q_init):
 
 def clone_movements(name_interface_clone, q_init, cloneP, cloneD, cloneQdes, cloneDQdes, cloneRunning, cloneResult):
 
+    from solopython.solo12 import Solo12
+
     print("-- Launching clone interface --")
 
     print(name_interface_clone, DT)
@@ -101,6 +96,16 @@ def control_loop(name_interface, name_interface_clone=None):
         name_interface_clone (string): name of the interface that will mimic the movements of the first
     """
 
+    from Controller import Controller
+    from LoggerSensors import LoggerSensors
+    from LoggerControl import LoggerControl
+    if SIMULATION:
+        from PyBulletSimulator import PyBulletSimulator
+    else:
+        # from pynput import keyboard
+        from solopython.solo12 import Solo12
+        from solopython.utils.qualisysClient import QualisysClient
+
     ################################
     # PARAMETERS OF THE CONTROLLER #
     ################################
@@ -170,6 +175,9 @@ def control_loop(name_interface, name_interface_clone=None):
         clone.start()
         print(cloneResult.value)
 
+    # Pin the processes to their CPU cores and set their real-time priorities
+    controller.apply_scheduling(clone.pid if name_interface_clone is not None else None)
+
     if LOGGING or PLOTTING:
         loggerSensors = LoggerSensors(device, qualisys=qc, logSize=N_SIMULATION-3)
         loggerControl = LoggerControl(dt_wbc, joystick=controller.joystick, estimator=controller.estimator,
@@ -260,10 +268,20 @@ def control_loop(name_interface, name_interface_clone=None):
     if not SIMULATION and name_interface_clone is not None:
         cloneResult.value = False
 
-    # Stop MPC running in a parallel process
-    if controller.enable_multiprocessing:
+    # Stop MPC running in a parallel process or thread
+    if controller.enable_multiprocessing or controller.enable_multithreading:
         print("Stopping parallel process")
+        print("Maximum wakeup latency of the MPC process: ",
+              1000 * controller.mpc_wrapper.get_wakeup_latency()[1], " ms")
+        print("Late / missed solves of the MPC: ", *controller.mpc_wrapper.get_deadline_stats())
+        print("Restarts of the MPC: ", controller.mpc_wrapper.n_restarts)
+        if controller.enable_adaptive_mpc:
+            f_mpc = controller.list_mpc_frequency[1:controller.k]
+            print("Effective frequency of the MPC: {:.1f} Hz on average, {:.1f} Hz minimum".format(
+                controller.n_mpc_solves / (controller.k * dt_wbc), np.min(f_mpc)))
         controller.mpc_wrapper.stop_parallel_loop()
+        if controller.mpc_wrapper_spec is not None:
+            controller.mpc_wrapper_spec.stop_parallel_loop()
     # controller.view.stop()  # Stop viewer
 
     # DAMPING TO GET ON THE GROUND PROGRESSIVELY *********************
@@ -307,8 +325,13 @@ def control_loop(name_interface, name_interface_clone=None):
     plt.plot(controller.t_list_loop[1:], 'k+')
     plt.plot(controller.t_list_InvKin[1:], 'o', color="darkgreen")
     plt.plot(controller.t_list_QPWBC[1:], 'o', color="royalblue")
-    plt.legend(["Estimator", "Planner", "MPC", "WBC", "Whole loop", "InvKin", "QP WBC"])
+    plt.plot(controller.t_list_mpc_wakeup[1:], 'x', color="darkorange")
+    plt.legend(["Estimator", "Planner", "MPC", "WBC", "Whole loop", "InvKin", "QP WBC", "MPC wakeup"])
     plt.title("Loop time [s]")
+    if controller.enable_adaptive_mpc:
+        plt.figure()
+        plt.plot(controller.list_mpc_frequency[1:controller.k], 'b')
+        plt.title("Effective frequency of the MPC [Hz]")
     plt.show(block=True)
 
     # Plot recorded data
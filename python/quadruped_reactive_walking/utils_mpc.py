@@ -1,3 +1,4 @@
+import os
 import math
 import numpy as np
 
@@ -192,3 +193,53 @@ def getSkew(a):
     a -- the column vector
     """
     return np.array([[0, -a[2], a[1]], [a[2], 0, -a[0]], [-a[1], a[0], 0]], dtype=a.dtype)
+
+
+##############
+# Scheduling #
+##############
+
+
+def set_process_scheduling(name, pid, cores=None, priority=None):
+    """Pin a process (or thread) to some CPU cores and give it a SCHED_FIFO real-time priority if it is permitted,
+    otherwise keep the current placement. Return a line describing the placement that is actually applied.
+
+    The SCHED_FIFO policy is not inherited by the processes that are forked afterwards.
+
+    Args:
+        name (string): name of the process in the report
+        pid (int): id of the process or thread (0 for the calling thread)
+        cores (list): CPU cores the process can run on (None to keep the current affinity)
+        priority (int): SCHED_FIFO priority between 1 and 99 (None to keep the current policy)
+    """
+
+    if not hasattr(os, "sched_setaffinity"):
+        return "{:<12} pid {:<8} scheduling not supported on this platform".format(name, pid)
+
+    errors = []
+    if cores is not None:
+        try:
+            os.sched_setaffinity(pid, cores)
+        except (OSError, ValueError) as e:
+            errors.append("cores {} refused: {}".format(list(cores), e))
+    if priority is not None:
+        try:
+            os.sched_setscheduler(pid, os.SCHED_FIFO | os.SCHED_RESET_ON_FORK, os.sched_param(priority))
+        except (OSError, ValueError) as e:
+            errors.append("SCHED_FIFO {} refused: {}".format(priority, e))
+
+    # Placement that is actually applied
+    try:
+        affinity = sorted(os.sched_getaffinity(pid))
+        policy = os.sched_getscheduler(pid) & ~os.SCHED_RESET_ON_FORK
+        prio = os.sched_getparam(pid).sched_priority
+    except OSError as e:
+        return "{:<12} pid {:<8} process not found ({})".format(name, pid, e)
+    policy_name = "SCHED_FIFO {}".format(prio) if policy == os.SCHED_FIFO else \
+        ("SCHED_RR {}".format(prio) if policy == os.SCHED_RR else "default policy")
+
+    report = "{:<12} pid {:<8} cores {} | {}".format(name, pid, affinity, policy_name)
+    if errors:
+        report += " | " + ", ".join(errors)
+
+    return report
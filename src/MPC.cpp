@@ -1,6 +1,19 @@
 #include "quadruped-reactive-walking/MPC.hpp"
 
-MPC::MPC(double dt_in, int n_steps_in, double T_gait_in) {
+/*
+Return the formulation if it is a known one, throw an exception otherwise
+*/
+int MPC::check_formulation(int formulation_in) {
+  if (formulation_in != FULL && formulation_in != REDUCED && formulation_in != CONDENSED) {
+    throw std::invalid_argument("Unknown formulation of the MPC " + std::to_string(formulation_in));
+  }
+  return formulation_in;
+}
+
+// The formulation is checked when it is initialized, before the workspace and the settings of the solver are
+// allocated (members declared after it), so that nothing leaks if it is invalid
+MPC::MPC(double dt_in, int n_steps_in, double T_gait_in, int formulation_in)
+    : formulation(check_formulation(formulation_in)) {
   dt = dt_in;
   n_steps = n_steps_in;
   T_gait = T_gait_in;
@@ -25,10 +38,108 @@ MPC::MPC(double dt_in, int n_steps_in, double T_gait_in) {
   h_ref = q(2, 0);
   g(8, 0) = -9.81f * dt;
 
+  // Number of non-zero values in ML: M (identity, A and B matrices), lines to enable/disable forces and L
+  size_nz_ML = 12 * n_steps + 18 * (n_steps - 1) + 48 * n_steps + 12 * n_steps + 36 * n_steps;
+
+  // Inverse of the inertia matrix, rotated for each time step in update_ML
+  gI_inv = gI.inverse();
+
+  // Empty cache of the coefficients of B (NaN keys are never equal)
+  B_keys = Eigen::Matrix<double, 17, Eigen::Dynamic>::Constant(17, n_steps, std::numeric_limits<double>::quiet_NaN());
+  B_keys_prev = B_keys;
+  B_values = Eigen::Matrix<double, 48, Eigen::Dynamic>::Zero(48, n_steps);
+  B_values_prev = B_values;
+  I_inv_values = Eigen::Matrix<double, 9, Eigen::Dynamic>::Zero(9, n_steps);
+  I_inv_values_prev = I_inv_values;
+
+  // Tuning parameters of the OSQP solver (can be changed with set_setting)
   osqp_set_default_settings(settings);
+  settings->eps_abs = (float)1e-5;
+  settings->eps_rel = (float)1e-5;
+  settings->adaptive_rho = (c_int)1;
+  settings->adaptive_rho_interval = (c_int)200;
+  settings->adaptive_rho_tolerance = (float)5.0;
+  settings->adaptive_rho_fraction = (float)0.7;
+  settings_reset = *settings;
+
+  // Statistics of the condensed formulation before the first solve
+  std::memset(&info_cond, 0, sizeof(OSQPInfo));
+  info_cond.status_val = OSQP_UNSOLVED;
+  std::strcpy(info_cond.status, "unsolved");
+
+  // All nodes last one time step by default
+  set_blocks(Eigen::MatrixXd::Ones(n_steps, 1));
+}
+
+MPC::MPC(double dt_in, const Eigen::MatrixXd &blocks_in, double T_gait_in, int formulation_in)
+    : MPC(dt_in, (int)blocks_in.size(), T_gait_in, formulation_in) {
+  set_blocks(blocks_in);
+}
+
+MPC::MPC() : MPC(0.02, 32, 0.64) {}
+
+/*
+Free a matrix in compressed sparse column format created by create_ML or create_weight_matrices
+*/
+static void free_csc(csc *M) {
+  if (M != nullptr) {
+    free(M->x);
+    free(M->i);
+    free(M->p);
+    c_free(M);
+  }
+}
+
+MPC::~MPC() {
+  // The active workspace is only a placeholder until the first setup of the solver
+  if (initialized) {
+    osqp_cleanup(workspce);
+  } else {
+    delete workspce;
+  }
+  for (PooledWorkspace &pooled : workspace_pool) {
+    osqp_cleanup(pooled.work);
+  }
+  free_csc(ML);
+  free_csc(P);
+  c_free(data);
+  c_free(settings);
 }
 
-MPC::MPC() { MPC(0.02, 32, 0.64); }
+/*
+Set the number of time steps dt of each node of the prediction horizon and the quantities that depend on it.
+The matrices of the QP problem are created with these durations during the first iteration so the blocks should
+be set before it.
+*/
+void MPC::set_blocks(const Eigen::MatrixXd &blocks_in) {
+  blocks = Eigen::Matrix<int, Eigen::Dynamic, 1>::Zero(n_steps, 1);
+  dt_nodes = Eigen::Matrix<double, Eigen::Dynamic, 1>::Zero(n_steps, 1);
+  i_xref = Eigen::Matrix<int, Eigen::Dynamic, 1>::Zero(n_steps, 1);
+  i_shift = Eigen::Matrix<int, Eigen::Dynamic, 1>::Zero(n_steps, 1);
+  node_phase = Eigen::Matrix<int, Eigen::Dynamic, 1>::Zero(n_steps, 1);
+
+  n_steps_dt = 0;
+  for (int k = 0; k < n_steps; k++) {
+    blocks(k, 0) = (int)std::lround(blocks_in(k));
+    if (blocks(k, 0) < 1) {
+      throw std::invalid_argument("Each node of the MPC lasts at least one time step");
+    }
+    dt_nodes(k, 0) = blocks(k, 0) * dt;
+    n_steps_dt += blocks(k, 0);
+    i_xref(k, 0) = n_steps_dt;
+  }
+
+  // Once the horizon is shifted by dt, node k ends during node i_shift(k) of the previous solve
+  for (int k = 0; k < n_steps; k++) {
+    i_shift(k, 0) = n_steps - 1;
+    for (int j = 0; j < n_steps; j++) {
+      if (i_xref(j, 0) >= i_xref(k, 0) + 1) {
+        i_shift(k, 0) = j;
+        break;
+      }
+    }
+  }
+}
 
 /*
 Create the constraint matrices of the MPC (M.X = N and L.X <= K)
@@ -69,6 +180,7 @@ inline void MPC::add_to_P(int i, int j, double v, int *r_P, int *c_P, double *v_
 Create the M and L matrices involved in the MPC constraint equations M.X = N and L.X <= K
 */
 int MPC::create_ML() {
+  cpt_ML = 0;                             // the matrix is created again when the MPC restarts (k == 0)
   int *r_ML = new int[size_nz_ML];        // row indexes of non-zero values in matrix ML
   int *c_ML = new int[size_nz_ML];        // col indexes of non-zero values in matrix ML
   double *v_ML = new double[size_nz_ML];  // non-zero values in matrix ML
@@ -82,8 +194,8 @@ int MPC::create_ML() {
     add_to_ML(k, k, -1.0, r_ML, c_ML, v_ML);
   }
 
-  // Fill matrix A (for other functions)
-  A.block(0, 6, 6, 6) = dt * Eigen::Matrix<double, 6, 6>::Identity();
+  // Fill matrix A of the first node (for other functions)
+  A.block(0, 6, 6, 6) = dt_nodes(0, 0) * Eigen::Matrix<double, 6, 6>::Identity();
 
   // Put A matrices in M
   for (int k = 0; k < (n_steps - 1); k++) {
@@ -91,13 +203,13 @@ int MPC::create_ML() {
       add_to_ML((k + 1) * 12 + i, (k * 12) + i, 1.0, r_ML, c_ML, v_ML);
     }
     for (int j = 0; j < 6; j++) {
-      add_to_ML((k + 1) * 12 + j, (k * 12) + j + 6, dt, r_ML, c_ML, v_ML);
+      add_to_ML((k + 1) * 12 + j, (k * 12) + j + 6, dt_nodes(k + 1, 0), r_ML, c_ML, v_ML);
     }
   }
 
   // Put B matrices in M
-  double div_tmp = dt / mass;
   for (int k = 0; k < n_steps; k++) {
+    double div_tmp = dt_nodes(k, 0) / mass;
     for (int i = 0; i < 4; i++) {
       add_to_ML(12 * k + 6, 12 * (n_steps + k) + 0 + 3 * i, div_tmp, r_ML, c_ML, v_ML);
       add_to_ML(12 * k + 7, 12 * (n_steps + k) + 1 + 3 * i, div_tmp, r_ML, c_ML, v_ML);
@@ -110,9 +222,6 @@ int MPC::create_ML() {
     }
   }
   for (int i = 0; i < 4; i++) {
-    B(6, 0 + 3 * i) = div_tmp;
-    B(7, 1 + 3 * i) = div_tmp;
-    B(8, 2 + 3 * i) = div_tmp;
     B(9, i) = 8.0;
     B(10, i) = 8.0;
     B(11, i) = 8.0;
@@ -166,6 +275,7 @@ int MPC::create_ML() {
   acc = st_to_cc_values(nst, r_ML, c_ML, v_ML, ncc, n, icc, ccc);
 
   // Assign values to the csc object
+  free_csc(ML);
   ML = (csc *)c_malloc(sizeof(csc));
   ML->m = 12 * n_steps * 2 + 20 * n_steps;
   ML->n = 12 * n_steps * 2;
@@ -209,22 +319,19 @@ int MPC::create_ML() {
   // Update state of B
   for (int k = 0; k < n_steps; k++) {
     // Get inverse of the inertia matrix for time step k
-    double c = cos(xref(5, k));
-    double s = sin(xref(5, k));
-    Eigen::Matrix<double, 3, 3> R;
-    R << c, -s, 0.0, s, c, 0.0, 0.0, 0.0, 1.0;
-    Eigen::Matrix<double, 3, 3> R_gI = R.transpose() * gI * R;
-    Eigen::Matrix<double, 3, 3> I_inv = R_gI.inverse();
+    Eigen::Matrix<double, 3, 3> I_inv = get_I_inv(xref(5, k));
 
     // Get skew-symetric matrix for each foothold
     Eigen::Matrix<double, 3, 4> l_arms = footholds - (xref.block(0, k, 3, 1)).replicate<1, 4>();
     for (int i = 0; i < 4; i++) {
-      B.block(9, 3 * i, 3, 3) = dt * (I_inv * getSkew(l_arms.col(i)));
+      B.block(6, 3 * i, 3, 3) = (dt_nodes(k, 0) / mass) * Eigen::Matrix<double, 3, 3>::Identity();
+      B.block(9, 3 * i, 3, 3) = dt_nodes(k, 0) * (I_inv * getSkew(l_arms.col(i)));
     }
 
     int i_iter = 24 * 4 * k;
     for (int j = 0; j < 12 * 4; j++) {
-      ML->x[i_update_B[j] + i_iter] = B(i_x_B[j], i_y_B[j]);
+      B_values(j, k) = B(i_x_B[j], i_y_B[j]);
+      ML->x[i_update_B[j] + i_iter] = B_values(j, k);
     }
   }
 
@@ -262,7 +369,7 @@ int MPC::create_NK() {
 
   // Fill N matrix with g matrices
   for (int k = 0; k < n_steps; k++) {
-    NK_up(12 * k + 8, 0) = -g(8, 0);  // only 8-th coeff is non zero
+    NK_up(12 * k + 8, 0) = -g(8, 0) * blocks(k, 0);  // only 8-th coeff is non zero
   }
 
   // Including - A*X0 in the first row of N
@@ -277,7 +384,7 @@ int MPC::create_NK() {
       D((k + 1) * 12 + i, (k * 12) + i) = -1.0;
     }
     for (int i = 0; i < 6; i++) {
-      D((k + 1) * 12 + i, (k * 12) + i + 6) = -dt;
+      D((k + 1) * 12 + i, (k * 12) + i + 6) = -dt_nodes(k + 1, 0);
     }
   }
 
@@ -312,6 +419,7 @@ int MPC::create_NK() {
 Create the weight matrices P and q in the cost function x^T.P.x + x^T.q of the QP problem
 */
 int MPC::create_weight_matrices() {
+  cpt_P = 0;                            // the matrix is created again when the MPC restarts (k == 0)
   int *r_P = new int[size_nz_P];        // row indexes of non-zero values in matrix P
   int *c_P = new int[size_nz_P];        // col indexes of non-zero values in matrix P
   double *v_P = new double[size_nz_P];  // non-zero values in matrix P
@@ -363,6 +471,7 @@ int MPC::create_weight_matrices() {
   acc = st_to_cc_values(nst, r_P, c_P, v_P, ncc, n, icc, ccc);
 
   // Assign values to the csc object
+  free_csc(P);
   P = (csc *)c_malloc(sizeof(csc));
   P->m = 12 * n_steps * 2;
   P->n = 12 * n_steps * 2;
@@ -412,48 +521,71 @@ Update the M and L constaint matrices depending on the current state of the gait
 
 */
 int MPC::update_ML(Eigen::MatrixXd fsteps) {
-  int j = 0;
-  int k_cum = 0;
-  // Iterate over all phases of the gait
-  while (gait(j, 0) != 0) {
-    for (int k = k_cum; k < (k_cum + gait(j, 0)); k++) {
-      // Get inverse of the inertia matrix for time step k
-      double c = cos(xref(5, k));
-      double s = sin(xref(5, k));
-      Eigen::Matrix<double, 3, 3> R;
-      R << c, -s, 0.0, s, c, 0.0, 0.0, 0.0, 1.0;
-      Eigen::Matrix<double, 3, 3> R_gI = R.transpose() * gI * R;
-      Eigen::Matrix<double, 3, 3> I_inv = R_gI.inverse();
+  // The cache of the previous solve is kept to be compared with the current one
+  B_keys.swap(B_keys_prev);
+  B_values.swap(B_values_prev);
+  I_inv_values.swap(I_inv_values_prev);
+  B_keys.setConstant(std::numeric_limits<double>::quiet_NaN());
+
+  // Construct the activation/desactivation matrix and the phase of each node based on the current gait
+  construct_S();
+
+  // Iterate over all nodes, with the footholds of the phase of the gait at the start of the node
+  for (int k = 0; k < n_steps; k++) {
+    footholds_tmp = fsteps.block(node_phase(k, 0), 1, 1, 12);
+    B_keys(0, k) = xref(5, k);
+    B_keys.block(1, k, 3, 1) = xref.block(0, k, 3, 1);
+    B_keys.block(4, k, 12, 1) = footholds_tmp.transpose();
+    B_keys(16, k) = dt_nodes(k, 0);
+
+    // Coefficients of a time step with the same yaw, position, footholds and duration
+    int i_cached = use_B_cache ? find_cached(k, 17) : -1;
+    if (i_cached >= n_steps) {
+      B_values.col(k) = B_values.col(i_cached - n_steps);
+      I_inv_values.col(k) = I_inv_values.col(i_cached - n_steps);
+    } else if (i_cached >= 0) {
+      B_values.col(k) = B_values_prev.col(i_cached);
+      I_inv_values.col(k) = I_inv_values_prev.col(i_cached);
+    } else {
+      // Get inverse of the inertia matrix for time step k (only depends on yaw)
+      Eigen::Map<Eigen::Matrix<double, 3, 3>> I_inv(I_inv_values.col(k).data());
+      i_cached = use_B_cache ? find_cached(k, 1) : -1;
+      if (i_cached >= n_steps) {
+        I_inv_values.col(k) = I_inv_values.col(i_cached - n_steps);
+      } else if (i_cached >= 0) {
+        I_inv_values.col(k) = I_inv_values_prev.col(i_cached);
+      } else {
+        I_inv = get_I_inv(xref(5, k));
+      }
 
       // Get skew-symetric matrix for each foothold
-      // Eigen::Map<Eigen::Matrix<double, 3, 4>> fsteps_tmp((fsteps.block(j, 1, 1, 12)).data(), 3, 4);
-      footholds_tmp = fsteps.block(j, 1, 1, 12);
-      // footholds = footholds_tmp.reshaped(3, 4);
       Eigen::Map<Eigen::MatrixXd> footholds_bis(footholds_tmp.data(), 3, 4);
-
       lever_arms = footholds_bis - (xref.block(0, k, 3, 1)).replicate<1, 4>();
       for (int i = 0; i < 4; i++) {
-        B.block(9, 3 * i, 3, 3) = dt * (I_inv * getSkew(lever_arms.col(i)));
+        B.block(6, 3 * i, 3, 3) = (dt_nodes(k, 0) / mass) * Eigen::Matrix<double, 3, 3>::Identity();
+        B.block(9, 3 * i, 3, 3) = dt_nodes(k, 0) * (I_inv * getSkew(lever_arms.col(i)));
       }
-
-      // Replace the coefficient directly in ML.data
-      int i_iter = 24 * 4 * k;
       for (int i = 0; i < 12 * 4; i++) {
-        ML->x[i_update_B[i] + i_iter] = B(i_x_B[i], i_y_B[i]);
+        B_values(i, k) = B(i_x_B[i], i_y_B[i]);
       }
     }
 
-    k_cum += gait(j, 0);
-    j++;
+    // Replace the coefficient directly in ML.data
+    int i_iter = 24 * 4 * k;
+    for (int i = 0; i < 12 * 4; i++) {
+      ML->x[i_update_B[i] + i_iter] = B_values(i, k);
+    }
   }
 
-  // Construct the activation/desactivation matrix based on the current gait
-  construct_S();
-
-  // Update lines to enable/disable forces
+  // Update lines to enable/disable forces of the nodes whose contact state changed
   int i_start = 30 * n_steps - 18;
-  for (int k = 0; k < 12 * n_steps; k++) {
-    ML->x[i_off(k, 0) + i_start] = S_gait(k, 0);
+  for (int k : S_changed) {
+    for (int j = 12 * k; j < 12 * (k + 1); j++) {
+      ML->x[i_off(j, 0) + i_start] = S_gait(j, 0);
+    }
+  }
+  if (check_S_update) {
+    check_S();
   }
 
   return 0;
@@ -470,7 +602,7 @@ int MPC::update_NK() {
 
   // Fill N matrix with g matrices
   for (int k = 0; k < n_steps; k++) {
-    NK_up(12 * k + 8, 0) = -g(8, 0);  // only 8-th coeff is non zero
+    NK_up(12 * k + 8, 0) = -g(8, 0) * blocks(k, 0);  // only 8-th coeff is non zero
   }
 
   // Including - A*X0 in the first row of N
@@ -491,20 +623,173 @@ int MPC::update_NK() {
   return 0;
 }
 
+/*
+Create an initial guess from the previous solution shifted by one time step of the MPC
+The states of the optimization vector are expressed relatively to xref so the previous predicted trajectory
+is expressed relatively to the new reference. The last state is repeated and the forces of the last time step
+are the weight of the robot evenly supported by the feet in contact. The dual variables of each time step are
+shifted the same way for the dynamics, the contact and the friction constraints, with zeros for the last one.
+*/
+int MPC::shift_warm_start() {
+  // States: previous prediction (absolute) minus the new reference
+  // Forces: previous prediction shifted by one time step
+  for (int i = 0; i < n_steps; i++) {
+    int j = i_shift(i, 0);
+    warmxf.block(12 * i, 0, 12, 1) = x_f_applied.block(0, j, 12, 1) - xref.block(0, 1 + i, 12, 1);
+    warmxf.block(12 * (n_steps + i), 0, 12, 1) = x_f_applied.block(12, j, 12, 1);
+  }
+
+  // Initial guess for the forces of the last time step (mass evenly supported by all legs in contact)
+  int i_last = 12 * (n_steps - 1);
+  int nb_ctc = 0;
+  for (int i = 0; i < 4; i++) {
+    nb_ctc += 1 - S_gait(i_last + 3 * i, 0);
+  }
+  warmxf.block(12 * n_steps + i_last, 0, 12, 1).setZero();
+  for (int i = 0; i < 4; i++) {
+    if ((nb_ctc > 0) && (S_gait(i_last + 3 * i, 0) == 0)) {
+      warmxf(12 * n_steps + i_last + 3 * i + 2, 0) = 9.81 * mass / nb_ctc;
+    }
+  }
+
+  // Forces of the feet that are not in contact according to the current gait are set to zero
+  for (int k = 0; k < 12 * n_steps; k++) {
+    warmxf(12 * n_steps + k, 0) *= (1 - S_gait(k, 0));
+  }
+  Eigen::Matrix<double, Eigen::Dynamic, 1>::Map(&v_warmxf[0], warmxf.size()) = warmxf;
+
+  // Dual variables: [dynamics (12 per step), contact (12 per step), friction (20 per step)]
+  // (the constraints of the reduced formulation change with the contact sequence so only x is warm started)
+  if (formulation == REDUCED) {
+    return 0;
+  }
+  int offsets[3] = {0, 12 * n_steps, 24 * n_steps};
+  int sizes[3] = {12, 12, 20};
+  for (int c = 0; c < 3; c++) {
+    for (int i = 0; i < n_steps - 1; i++) {
+      const c_float *y_prev = workspce->solution->y + offsets[c] + sizes[c] * i_shift(i, 0);
+      std::copy(y_prev, y_prev + sizes[c], v_warmy + offsets[c] + sizes[c] * i);
+    }
+    std::fill_n(v_warmy + offsets[c] + sizes[c] * (n_steps - 1), sizes[c], 0.0);
+  }
+
+  return 0;
+}
+
+/*
+Create the QP problem of the reduced formulation from the matrices of the full formulation (the columns of the
+forces of the feet in swing phase and their friction constraints are removed), in the same order:
+ - variables: 12 states per time step then 3 forces per (time step, foot) in contact
+ - constraints: 12 dynamics equations per time step then 5 friction constraints per (time step, foot) in contact
+*/
+int MPC::create_reduced_problem() {
+  int n_x = 12 * n_steps;
+  n_contacts = 0;
+  for (int k = 0; k < 4 * n_steps; k++) {
+    n_contacts += 1 - S_gait(3 * k, 0);
+  }
+  int n = n_x + 3 * n_contacts;
+  int m = n_x + 5 * n_contacts;
+
+  // Constraint matrix in CSC format, column by column with increasing row indexes
+  A_p_red.resize(n + 1);
+  A_i_red.clear();
+  A_x_red.clear();
+  auto add_to_A = [this](int i, double v) {
+    A_i_red.push_back(i);
+    A_x_red.push_back(v);
+  };
+
+  // Columns of the states: -I then the A matrix of the next time step
+  int col = 0;
+  for (int k = 0; k < n_steps; k++) {
+    for (int i = 0; i < 12; i++) {
+      A_p_red[col++] = A_i_red.size();
+      add_to_A(12 * k + i, -1.0);
+      if (k < n_steps - 1) {
+        if (i >= 6) add_to_A(12 * (k + 1) + i - 6, dt_nodes(k + 1, 0));
+        add_to_A(12 * (k + 1) + i, 1.0);
+      }
+    }
+  }
+
+  // Columns of the forces of the feet in contact: B matrix (coefficients of update_ML) then friction cone
+  int c = 0;
+  for (int k = 0; k < 4 * n_steps; k++) {
+    if (S_gait(3 * k, 0) == 1) continue;
+    int t = k / 4;
+    int foot = k % 4;
+    int r = n_x + 5 * c;
+    for (int j = 0; j < 3; j++) {
+      A_p_red[col++] = A_i_red.size();
+      add_to_A(12 * t + 6 + j, B_values(12 * foot + 4 * j, t));
+      for (int i = 0; i < 3; i++) {
+        add_to_A(12 * t + 9 + i, B_values(12 * foot + 4 * j + 1 + i, t));
+      }
+      if (j < 2) {
+        add_to_A(r + 2 * j, 1.0);
+        add_to_A(r + 2 * j + 1, -1.0);
+      } else {
+        for (int i = 0; i < 4; i++) {
+          add_to_A(r + i, -mu);
+        }
+        add_to_A(r + 4, -1.0);
+      }
+    }
+    c++;
+  }
+  A_p_red[n] = A_i_red.size();
+
+  // Diagonal weight matrix P taken from the one of the full formulation and null q
+  P_p_red.resize(n + 1);
+  P_i_red.resize(n);
+  P_x_red.resize(n);
+  for (int i = 0; i < n_x; i++) {
+    P_x_red[i] = P->x[i];
+  }
+  c = 0;
+  for (int k = 0; k < 4 * n_steps; k++) {
+    if (S_gait(3 * k, 0) == 1) continue;
+    for (int j = 0; j < 3; j++) {
+      P_x_red[n_x + 3 * c + j] = P->x[n_x + 3 * k + j];
+    }
+    c++;
+  }
+  for (int i = 0; i < n; i++) {
+    P_p_red[i] = i;
+    P_i_red[i] = i;
+  }
+  P_p_red[n] = n;
+  q_red.assign(n, 0.0);
+
+  // Bounds: dynamics of the full formulation, then 0 <= f_z <= 25 and friction cone
+  l_red.assign(m, -std::numeric_limits<double>::infinity());
+  u_red.assign(m, 0.0);
+  std::copy(v_NK_low, v_NK_low + n_x, l_red.begin());
+  std::copy(v_NK_up, v_NK_up + n_x, u_red.begin());
+  for (int i = 0; i < n_contacts; i++) {
+    l_red[n_x + 5 * i + 4] = -25.0;
+  }
+
+  return 0;
+}
+
 /*
 Create an initial guess and call the solver to solve the QP problem
 */
 int MPC::call_solver(int k) {
-  // Initial guess for forces (mass evenly supported by all legs in contact)
-  warmxf.block(0, 0, 12 * (n_steps - 1), 1) = x.block(12, 0, 12 * (n_steps - 1), 1);
-  warmxf.block(12 * n_steps, 0, 12 * (n_steps - 1), 1) = x.block(12 * (n_steps + 1), 0, 12 * (n_steps - 1), 1);
-  warmxf.block(12 * (2 * n_steps - 1), 0, 12, 1) = x.block(12 * n_steps, 0, 12, 1);
-  Eigen::Matrix<double, Eigen::Dynamic, 1>::Map(&v_warmxf[0], warmxf.size()) = warmxf;
+  if (formulation == REDUCED) {
+    return call_solver_reduced(k);
+  } else if (formulation == CONDENSED) {
+    return call_solver_condensed();
+  }
 
   // Setup the solver (first iteration) then just update it
   if (k == 0)  // Setup the solver with the matrices
   {
-    data = (OSQPData *)c_malloc(sizeof(OSQPData));
+    if (data == nullptr) {
+      data = (OSQPData *)c_malloc(sizeof(OSQPData));
+    }
     data->n = 12 * n_steps * 2;                 // number of variables
     data->m = 12 * n_steps * 2 + 20 * n_steps;  // number of constraints
     data->P = P;             // the upper triangular part of the quadratic cost matrix P in csc format (size n x n)
@@ -519,31 +804,52 @@ int MPC::call_solver(int k) {
     save_dns_matrix(v_NK_low, 12 * n_steps * 2 + 20 * n_steps, "l");
     save_dns_matrix(v_NK_up, 12 * n_steps * 2 + 20 * n_steps, "u");*/
 
-    // settings->rho = 0.1f;
-    // settings->sigma = 1e-6f;
-    // settings->max_iter = 4000;
-    settings->eps_abs = (float)1e-5;
-    settings->eps_rel = (float)1e-5;
-    /*settings->eps_prim_inf = 1e-4f;
-    settings->eps_dual_inf = 1e-4f;
-    settings->alpha = 1.6f;
-    settings->delta = 1e-6f;
-    settings->polish = 0;
-    settings->polish_refine_iter = 3;*/
-    settings->adaptive_rho = (c_int)1;
-    settings->adaptive_rho_interval = (c_int)200;
-    settings->adaptive_rho_tolerance = (float)5.0;
-    settings->adaptive_rho_fraction = (float)0.7;
+    // The settings have been set in the constructor and with set_setting
+    if (initialized) {
+      osqp_cleanup(workspce);
+    } else {
+      delete workspce;
+    }
     osqp_setup(&workspce, data, settings);
+    initialized = true;
+    S_gait_red = S_gait;
+    A_x_solver.assign(ML->x, ML->x + ML->nzmax);
+    n_setups++;
 
     /*self.prob.setup(P=self.P, q=self.Q, A=self.ML, l=self.NK_inf, u=self.NK.ravel(), verbose=False)
     self.prob.update_settings(eps_abs=1e-5)
     self.prob.update_settings(eps_rel=1e-5)*/
   } else  // Code to update the QP problem without creating it again
   {
-    osqp_update_A(workspce, &ML->x[0], OSQP_NULL, 0);
+    // Status of the previous solve (reset by the updates of the problem)
+    c_int status = workspce->info->status_val;
+
+    // Warm start with the previous solution shifted in time if it has been solved
+    bool warm_start = shifted_warm_start && (status == OSQP_SOLVED || status == OSQP_SOLVED_INACCURATE);
+    if (warm_start) {
+      shift_warm_start();
+    }
+
+    // With a pool of workspaces, the one of the contact sequence is used (set up if it is not in the pool)
+    bool switched = (workspace_pool_size > 1) && (S_gait != S_gait_red);
+    bool reused = switched && switch_workspace();
+    if (switched && !reused) {
+      osqp_setup(&workspce, data, settings);
+      A_x_solver.assign(ML->x, ML->x + ML->nzmax);
+      n_setups++;
+    }
+
+    bool updated = update_A_values(&ML->x[0], (int)ML->nzmax);
     osqp_update_bounds(workspce, &v_NK_low[0], &v_NK_up[0]);
-    // osqp_warm_start_x(workspce, &v_warmxf[0]);
+
+    if (warm_start) {
+      osqp_warm_start(workspce, &v_warmxf[0], &v_warmy[0]);
+    } else if (switched && (updated || !reused)) {
+      // A workspace whose factorization is reused starts from its solution of the previous solve with this contact
+      // sequence, otherwise it starts from the previous solution like a single workspace
+      const OSQPSolution *previous = workspace_pool.front().work->solution;
+      osqp_warm_start(workspce, previous->x, previous->y);
+    }
   }
 
   // Run the solver to solve the QP problem
@@ -555,15 +861,320 @@ int MPC::call_solver(int k) {
   return 0;
 }
 
+/*
+Create an initial guess for the reduced formulation from the previous solution shifted by one time step (see
+shift_warm_start). The dual variables of the friction constraints of a foot in contact are the ones of the same
+foot at the next time step in the previous solve (zero if it was not in contact).
+*/
+int MPC::shift_warm_start_reduced() {
+  shift_warm_start();
+
+  int n_x = 12 * n_steps;
+  const c_float *y = workspce->solution->y;
+  warm_red.resize(q_red.size());
+  warm_y_red.assign(l_red.size(), 0.0);
+  std::copy(v_warmxf, v_warmxf + n_x, warm_red.begin());
+  for (int i = 0; i < n_steps - 1; i++) {
+    std::copy(y + 12 * i_shift(i, 0), y + 12 * i_shift(i, 0) + 12, warm_y_red.begin() + 12 * i);
+  }
+
+  // Index of the contact of each (time step, foot) in the previous solve
+  std::vector<int> i_prev(4 * n_steps, -1);
+  int c = 0;
+  for (int j = 0; j < 4 * n_steps; j++) {
+    if (S_gait_red(3 * j, 0) == 0) i_prev[j] = c++;
+  }
+
+  c = 0;
+  for (int j = 0; j < 4 * n_steps; j++) {
+    if (S_gait(3 * j, 0) == 1) continue;
+    std::copy(v_warmxf + n_x + 3 * j, v_warmxf + n_x + 3 * j + 3, warm_red.begin() + n_x + 3 * c);
+    int j_prev = 4 * i_shift(j / 4, 0) + j % 4;
+    if ((j / 4 < n_steps - 1) && (i_prev[j_prev] >= 0)) {
+      std::copy(y + n_x + 5 * i_prev[j_prev], y + n_x + 5 * i_prev[j_prev] + 5, warm_y_red.begin() + n_x + 5 * c);
+    }
+    c++;
+  }
+
+  return 0;
+}
+
+/*
+Put the active workspace of the solver in the pool and take the one of the contact sequence S_gait from it.
+Return false if there is none, then a new workspace has to be set up with the settings of the previous one.
+*/
+bool MPC::switch_workspace() {
+  // The settings changed after the previous setup are kept for a new one
+  *settings = *(workspce->settings);
+
+  PooledWorkspace active = {S_gait_red, workspce, A_x_solver, initialized};
+  bool found = false;
+  for (auto it = workspace_pool.begin(); it != workspace_pool.end(); ++it) {
+    if (it->S_gait == S_gait) {
+      workspce = it->work;
+      A_x_solver.swap(it->A_x);
+      workspace_pool.erase(it);
+      found = true;
+      break;
+    }
+  }
+  S_gait_red = S_gait;
+  workspace_pool.insert(workspace_pool.begin(), active);
+
+  // Least recently used workspaces are removed
+  while ((int)workspace_pool.size() > workspace_pool_size - 1) {
+    osqp_cleanup(workspace_pool.back().work);
+    workspace_pool.pop_back();
+  }
+
+  return found;
+}
+
+/*
+Update the values of the constraint matrix in the active workspace if they changed since the previous update,
+return false if they did not
+*/
+bool MPC::update_A_values(const c_float *A_x, int n) {
+  if ((int)A_x_solver.size() == n && std::equal(A_x, A_x + n, A_x_solver.begin())) {
+    return false;
+  }
+  osqp_update_A(workspce, A_x, OSQP_NULL, 0);
+  A_x_solver.assign(A_x, A_x + n);
+  n_updates_A++;
+  return true;
+}
+
+/*
+Set the maximum number of workspaces of the solver kept for the contact sequences (1 to only keep the active one)
+*/
+void MPC::set_workspace_pool_size(int size) {
+  if (size < 1) {
+    throw std::invalid_argument("The pool of workspaces contains at least the active one");
+  }
+  workspace_pool_size = size;
+  while ((int)workspace_pool.size() > workspace_pool_size - 1) {
+    osqp_cleanup(workspace_pool.back().work);
+    workspace_pool.pop_back();
+  }
+}
+
+/*
+Solve the QP problem of the reduced formulation. The solver is set up again when the contact sequence is not the
+one of the previous solve (the size of the problem changes) and updated otherwise.
+*/
+int MPC::call_solver_reduced(int k) {
+  create_reduced_problem();
+
+  // A new problem starts from zero so it is always warm started with the previous solution shifted in time,
+  // otherwise OSQP starts from its previous solution unless the shifted warm start is enabled
+  bool new_problem = !initialized || S_gait != S_gait_red;
+  bool warm_start = false;
+  if (k > 0) {
+    c_int status = workspce->info->status_val;
+    warm_start = new_problem || (shifted_warm_start && (status == OSQP_SOLVED || status == OSQP_SOLVED_INACCURATE));
+  }
+  if (warm_start) {
+    shift_warm_start_reduced();
+  }
+
+  // Workspace of the contact sequence from the pool, if it is not there a new one is set up
+  if (new_problem && initialized && switch_workspace()) {
+    update_A_values(A_x_red.data(), (int)A_x_red.size());
+    osqp_update_bounds(workspce, l_red.data(), u_red.data());
+  } else if (new_problem) {
+    csc A_red = {(c_int)A_x_red.size(), (c_int)l_red.size(), (c_int)q_red.size(), A_p_red.data(), A_i_red.data(),
+                 A_x_red.data(), -1};
+    csc P_red = {(c_int)P_x_red.size(), (c_int)q_red.size(), (c_int)q_red.size(), P_p_red.data(), P_i_red.data(),
+                 P_x_red.data(), -1};
+    OSQPData data_red = {(c_int)q_red.size(), (c_int)l_red.size(), &P_red, &A_red, q_red.data(), l_red.data(),
+                         u_red.data()};
+    if (!initialized) {
+      delete workspce;  // Placeholder before the first setup, otherwise it has been put in the pool
+    }
+    osqp_setup(&workspce, &data_red, settings);
+    initialized = true;
+    S_gait_red = S_gait;
+    A_x_solver = A_x_red;
+    n_setups++;
+  } else {
+    update_A_values(A_x_red.data(), (int)A_x_red.size());
+    osqp_update_bounds(workspce, l_red.data(), u_red.data());
+  }
+
+  if (warm_start) {
+    osqp_warm_start(workspce, warm_red.data(), warm_y_red.data());
+  }
+
+  // Run the solver to solve the QP problem
+  osqp_solve(workspce);
+
+  return 0;
+}
+
+/*
+Create the dense QP problem of the condensed formulation from the matrices of the full formulation. The states over
+the horizon are X = X_free + Gamma.F with F the forces of the feet in contact (same order as in the reduced
+formulation), so the cost 1/2 (X - Xref)^T.W.(X - Xref) + 1/2 F^T.R.F becomes 1/2 F^T.H.F + g^T.F + constant.
+The friction cone and the bounds of the normal force are 6 inequality constraints CI.F + ci0 >= 0 per contact.
+*/
+int MPC::create_condensed_problem() {
+  int n_x = 12 * n_steps;
+  n_contacts = 0;
+  for (int k = 0; k < 4 * n_steps; k++) {
+    n_contacts += 1 - S_gait(3 * k, 0);
+  }
+  int n = 3 * n_contacts;
+
+  // States without forces, X_k = A_k.X_k-1 + g_k starting from x0 (A_k and g_k with the duration of node k)
+  Eigen::Matrix<double, 12, 1> x_k = x0;
+  X_free.resize(n_x);
+  for (int k = 0; k < n_steps; k++) {
+    x_k.head(6) += dt_nodes(k, 0) * x_k.tail(6);
+    x_k += g * blocks(k, 0);
+    X_free.segment(12 * k, 12) = x_k;
+  }
+
+  // Effect of the forces of each contact on the states of its time step and of the following ones
+  Gamma.setZero(n_x, n);
+  R_cond.resize(n);
+  int c = 0;
+  for (int j = 0; j < 4 * n_steps; j++) {
+    if (S_gait(3 * j, 0) == 1) continue;
+    int t = j / 4;
+    int foot = j % 4;
+
+    // Velocity rows of B for the forces of this foot (coefficients of update_ML)
+    Eigen::Matrix<double, 6, 3> B_c = Eigen::Matrix<double, 6, 3>::Zero();
+    for (int i = 0; i < 3; i++) {
+      B_c(i, i) = B_values(12 * foot + 4 * i, t);
+      B_c.block(3, i, 3, 1) = B_values.block(12 * foot + 4 * i + 1, t, 3, 1);
+    }
+
+    // Product of the A matrices is [I, T.I; 0, I] with T the time between the end of both nodes so the positions
+    // integrate the change of velocities
+    for (int k = t; k < n_steps; k++) {
+      Gamma.block(12 * k, 3 * c, 6, 3) = ((i_xref(k, 0) - i_xref(t, 0)) * dt) * B_c;
+      Gamma.block(12 * k + 6, 3 * c, 6, 3) = B_c;
+    }
+    for (int i = 0; i < 3; i++) {
+      R_cond(3 * c + i) = P->x[n_x + 3 * j + i];
+    }
+    c++;
+  }
+
+  // Cost with the weights of the full formulation
+  W_cond = Eigen::Map<const Eigen::VectorXd>(P->x, n_x);
+  Eigen::VectorXd e = X_free - Eigen::Map<const Eigen::VectorXd>(xref.data() + 12, n_x);
+  Eigen::MatrixXd W_Gamma = W_cond.asDiagonal() * Gamma;
+  H_cond.noalias() = Gamma.transpose() * W_Gamma;
+  H_cond.diagonal() += R_cond;
+  g_cond.noalias() = W_Gamma.transpose() * e;
+  cost_free = 0.5 * e.dot(W_cond.cwiseProduct(e));
+
+  // Friction cone (|f_x| <= mu.f_z and |f_y| <= mu.f_z) and 0 <= f_z <= 25 for each contact, no equality constraint
+  CE_cond.resize(0, n);
+  ce0_cond.resize(0);
+  CI_cond.setZero(6 * n_contacts, n);
+  ci0_cond.setZero(6 * n_contacts);
+  for (int i = 0; i < n_contacts; i++) {
+    int r = 6 * i;
+    for (int j = 0; j < 2; j++) {
+      CI_cond(r + 2 * j, 3 * i + j) = -1.0;
+      CI_cond(r + 2 * j + 1, 3 * i + j) = 1.0;
+      CI_cond(r + 2 * j, 3 * i + 2) = mu;
+      CI_cond(r + 2 * j + 1, 3 * i + 2) = mu;
+    }
+    CI_cond(r + 4, 3 * i + 2) = 1.0;
+    CI_cond(r + 5, 3 * i + 2) = -1.0;
+    ci0_cond(r + 5) = 25.0;
+  }
+
+  return 0;
+}
+
+/*
+Solve the QP problem of the condensed formulation with eiquadprog and store its statistics in the format of OSQP
+(the time to condense the problem is the setup time)
+*/
+int MPC::call_solver_condensed() {
+  auto t_start = std::chrono::steady_clock::now();
+  create_condensed_problem();
+  auto t_setup = std::chrono::steady_clock::now();
+
+  int n = 3 * n_contacts;
+  qp_cond.reset(n, 0, 6 * n_contacts);
+  f_cond.setZero(n);
+  eiquadprog::solvers::EiquadprogFast_status status =
+      qp_cond.solve_quadprog(H_cond, g_cond, CE_cond, ce0_cond, CI_cond, ci0_cond, f_cond);
+  auto t_end = std::chrono::steady_clock::now();
+
+  std::memset(&info_cond, 0, sizeof(OSQPInfo));
+  info_cond.iter = qp_cond.getIteratios();
+  switch (status) {
+    case eiquadprog::solvers::EIQUADPROG_FAST_OPTIMAL:
+      info_cond.status_val = OSQP_SOLVED;
+      std::strcpy(info_cond.status, "solved");
+      break;
+    case eiquadprog::solvers::EIQUADPROG_FAST_MAX_ITER_REACHED:
+      info_cond.status_val = OSQP_MAX_ITER_REACHED;
+      std::strcpy(info_cond.status, "maximum iterations reached");
+      break;
+    case eiquadprog::solvers::EIQUADPROG_FAST_UNBOUNDED:
+      info_cond.status_val = OSQP_DUAL_INFEASIBLE;
+      std::strcpy(info_cond.status, "dual infeasible");
+      break;
+    default:
+      info_cond.status_val = OSQP_PRIMAL_INFEASIBLE;
+      std::strcpy(info_cond.status, "primal infeasible");
+  }
+  info_cond.obj_val = qp_cond.getObjValue() + cost_free;
+  info_cond.setup_time = std::chrono::duration<double>(t_setup - t_start).count();
+  info_cond.solve_time = std::chrono::duration<double>(t_end - t_setup).count();
+  info_cond.run_time = std::chrono::duration<double>(t_end - t_start).count();
+
+  return 0;
+}
+
 /*
 Extract relevant information from the output of the QP solver
 */
 int MPC::retrieve_result() {
+  if (formulation == CONDENSED) {
+    // States from the dynamics, forces of the feet in contact and zero for feet in swing phase
+    Eigen::VectorXd X = X_free + Gamma * f_cond;
+    x_f_applied.block(0, 0, 12, n_steps) = Eigen::Map<Eigen::MatrixXd>(X.data(), 12, n_steps);
+    x_f_applied.block(12, 0, 12, n_steps).setZero();
+    int c = 0;
+    for (int j = 0; j < 4 * n_steps; j++) {
+      if (S_gait(3 * j, 0) == 1) continue;
+      x_f_applied.block(12 + 3 * (j % 4), j / 4, 3, 1) = f_cond.segment(3 * c, 3);
+      c++;
+    }
+    for (int k = 0; k < 12; k++) {
+      x_next[k] = X(k) - xref(k, 1);
+    }
+    return 0;
+  }
+
   // Retrieve the "contact forces" part of the solution of the QP problem
   for (int i = 0; i < (n_steps); i++) {
     for (int k = 0; k < 12; k++) {
       x_f_applied(k, i) = (workspce->solution->x)[k + 12*i] + xref(k, 1+i);
-      x_f_applied(k + 12, i) = (workspce->solution->x)[12 * (n_steps+i) + k];
+      if (formulation == FULL) {
+        x_f_applied(k + 12, i) = (workspce->solution->x)[12 * (n_steps+i) + k];
+      }
+    }
+  }
+  if (formulation == REDUCED) {
+    // Forces of the feet in contact in the order of the optimization vector, zero for feet in swing phase
+    x_f_applied.block(12, 0, 12, n_steps).setZero();
+    int c = 0;
+    for (int j = 0; j < 4 * n_steps; j++) {
+      if (S_gait_red(3 * j, 0) == 1) continue;
+      for (int i = 0; i < 3; i++) {
+        x_f_applied(12 + 3 * (j % 4) + i, j / 4) = (workspce->solution->x)[12 * n_steps + 3 * c + i];
+      }
+      c++;
     }
   }
   for (int k = 0; k < 12; k++) {
@@ -595,6 +1206,41 @@ Return the latest desired contact forces that have been computed
 */
 Eigen::MatrixXd MPC::get_latest_result() { return x_f_applied; }
 
+/*
+Return the number of iterations of the solver during the last solve (0 before the first one)
+*/
+int MPC::get_iter() { return (get_info() != OSQP_NULL) ? (int)get_info()->iter : 0; }
+
+/*
+Return the duration of the last solve in seconds (setup excluded)
+*/
+double MPC::get_solve_time() { return (get_info() != OSQP_NULL) ? get_info()->solve_time : 0.0; }
+
+/*
+Return the information of the solver about the last solve (iterations, status, residuals, timings),
+null before the first solve (statistics of eiquadprog in the same format for the condensed formulation)
+*/
+const OSQPInfo *MPC::get_info() {
+  if (formulation == CONDENSED) return &info_cond;
+  return initialized ? workspce->info : OSQP_NULL;
+}
+
+/*
+Return the number of variables of the QP problem of the last solve (0 before the first one)
+*/
+int MPC::get_n_variables() {
+  if (formulation == CONDENSED) return 3 * n_contacts;
+  return initialized ? (int)workspce->data->n : 0;
+}
+
+/*
+Return the number of constraints of the QP problem of the last solve (0 before the first one)
+*/
+int MPC::get_n_constraints() {
+  if (formulation == CONDENSED) return 6 * n_contacts;
+  return initialized ? (int)workspce->data->m : 0;
+}
+
 /*
 Return the next predicted state of the base
 */
@@ -612,15 +1258,20 @@ void MPC::run_python(const matXd &xref_py, const matXd &fsteps_py) {
 }
 
 /*
-Run one iteration of the whole MPC by calling all the necessary functions (data retrieval,
-update of constraint matrices, update of the solver, running the solver, retrieving result)
+Create (first iteration) or update the constraint and weight matrices of the QP problem for new inputs
 */
-int MPC::run(int num_iter, const Eigen::MatrixXd &xref_in, const Eigen::MatrixXd &fsteps_in) {
+int MPC::update_problem(int num_iter, const Eigen::MatrixXd &xref_in, const Eigen::MatrixXd &fsteps_in) {
   // Recontruct the gait based on the computed footsteps
   construct_gait(fsteps_in);
 
-  // Retrieve data required for the MPC
-  xref = xref_in;
+  // Retrieve data required for the MPC, the reference is sampled at the end of each node
+  if (xref_in.cols() != 1 + n_steps_dt) {
+    throw std::invalid_argument("The reference trajectory should have one column per time step of the horizon + 1");
+  }
+  xref.col(0) = xref_in.col(0);
+  for (int k = 0; k < n_steps; k++) {
+    xref.col(1 + k) = xref_in.col(i_xref(k, 0));
+  }
   x0 = xref_in.block(0, 0, 12, 1);
 
   // Create the constraint and weight matrices used by the QP solver
@@ -631,6 +1282,17 @@ int MPC::run(int num_iter, const Eigen::MatrixXd &xref_in, const Eigen::MatrixXd
     update_matrices(fsteps_in);
   }
 
+  return 0;
+}
+
+/*
+Run one iteration of the whole MPC by calling all the necessary functions (data retrieval,
+update of constraint matrices, update of the solver, running the solver, retrieving result)
+*/
+int MPC::run(int num_iter, const Eigen::MatrixXd &xref_in, const Eigen::MatrixXd &fsteps_in) {
+  // Update the QP problem with the new inputs
+  update_problem(num_iter, xref_in, fsteps_in);
+
   // Create an initial guess and call the solver to solve the QP problem
   call_solver(num_iter);
 
@@ -640,6 +1302,134 @@ int MPC::run(int num_iter, const Eigen::MatrixXd &xref_in, const Eigen::MatrixXd
   return 0;
 }
 
+/*
+Forget the problems solved so far: the next one (num_iter = 0) gets the same result as with a new MPC. The settings
+of the solver, the move blocking and the options are kept, the workspaces of the solver are cleaned up.
+*/
+void MPC::reset() {
+  if (initialized) {
+    osqp_cleanup(workspce);
+    workspce = new OSQPWorkspace();
+    initialized = false;
+  }
+  for (PooledWorkspace &pooled : workspace_pool) {
+    osqp_cleanup(pooled.work);
+  }
+  workspace_pool.clear();
+  A_x_solver.clear();
+  *settings = settings_reset;  // The settings of the workspaces also hold the adapted rho
+
+  // State of the previous solves
+  xref.setZero();
+  x.setZero();
+  S_gait.setZero();
+  S_gait_red.resize(0);
+  warmxf.setZero();
+  x_f_applied.setZero();
+  x0.setZero();
+  std::fill_n(x_next, 12, 0.0);
+  gait.setZero();
+  A.setIdentity();
+  B.setZero();
+  B_keys.setConstant(std::numeric_limits<double>::quiet_NaN());
+  B_keys_prev.setConstant(std::numeric_limits<double>::quiet_NaN());
+  std::memset(&info_cond, 0, sizeof(OSQPInfo));
+  info_cond.status_val = OSQP_UNSOLVED;
+  std::strcpy(info_cond.status, "unsolved");
+}
+
+/*
+Solve a batch of independent MPC problems (reference trajectory and footsteps of each problem) with n_threads threads
+(one per core if 0) and return the latest result of each problem. Each thread solves a contiguous part of the batch
+with its own MPC, which is reset before each problem: the result of a problem is the one of a new MPC, it does not
+depend on the number of threads nor on the order of the problems.
+*/
+std::vector<Eigen::MatrixXd> MPC::run_batch(double dt_in, int n_steps_in, double T_gait_in,
+                                            const std::vector<Eigen::MatrixXd> &xrefs,
+                                            const std::vector<Eigen::MatrixXd> &fsteps, int n_threads,
+                                            int formulation_in) {
+  int n_problems = (int)xrefs.size();
+  check_formulation(formulation_in);
+  if ((int)fsteps.size() != n_problems) {
+    throw std::invalid_argument("run_batch needs as many footsteps as reference trajectories");
+  }
+  for (int i = 0; i < n_problems; i++) {
+    if (xrefs[i].rows() != 12 || xrefs[i].cols() != n_steps_in + 1 || fsteps[i].rows() != 20 ||
+        fsteps[i].cols() != 13) {
+      throw std::invalid_argument("Problem " + std::to_string(i) + " of run_batch has a xref or fsteps of wrong size");
+    }
+  }
+
+  if (n_problems == 0) {
+    return std::vector<Eigen::MatrixXd>();
+  }
+  if (n_threads <= 0) {
+    n_threads = std::max(1, (int)std::thread::hardware_concurrency());
+  }
+  n_threads = std::min(n_threads, n_problems);
+
+  // An exception escaping a thread would terminate the program, it is rethrown once all threads have ended
+  std::vector<Eigen::MatrixXd> results(n_problems);
+  std::vector<std::exception_ptr> errors(n_threads);
+  std::vector<std::thread> threads;
+  for (int t = 0; t < n_threads; t++) {
+    int i_start = (t * n_problems) / n_threads;
+    int i_end = ((t + 1) * n_problems) / n_threads;
+    threads.push_back(std::thread([&, t, i_start, i_end]() {
+      try {
+        MPC mpc(dt_in, n_steps_in, T_gait_in, formulation_in);
+        mpc.set_setting("verbose", 0);
+        for (int i = i_start; i < i_end; i++) {
+          mpc.reset();
+          mpc.run(0, xrefs[i], fsteps[i]);
+          results[i] = mpc.get_latest_result();
+        }
+      } catch (...) {
+        errors[t] = std::current_exception();
+      }
+    }));
+  }
+  for (std::thread &thread : threads) {
+    thread.join();
+  }
+  for (const std::exception_ptr &error : errors) {
+    if (error) {
+      std::rethrow_exception(error);
+    }
+  }
+
+  return results;
+}
+
+/*
+Find a time step whose n_rows first values of the key of the cache of B are equal to the ones of time step k.
+Return the index of the time step in the previous solve (next or same time step since the horizon is shifted),
+or n_steps plus the index of the previous time step of the current solve, or -1 if there is none.
+*/
+int MPC::find_cached(int k, int n_rows) {
+  if (B_keys_prev.block(0, i_shift(k, 0), n_rows, 1) == B_keys.block(0, k, n_rows, 1)) {
+    return i_shift(k, 0);
+  }
+  if (B_keys_prev.block(0, k, n_rows, 1) == B_keys.block(0, k, n_rows, 1)) {
+    return k;
+  }
+  if ((k > 0) && (B_keys.block(0, k - 1, n_rows, 1) == B_keys.block(0, k, n_rows, 1))) {
+    return n_steps + k - 1;
+  }
+  return -1;
+}
+
+/*
+Returns the inverse of the inertia matrix rotated by a yaw angle: (R^T gI R)^-1 = R^T gI^-1 R
+*/
+Eigen::Matrix<double, 3, 3> MPC::get_I_inv(double yaw) {
+  double c = cos(yaw);
+  double s = sin(yaw);
+  Eigen::Matrix<double, 3, 3> R;
+  R << c, -s, 0.0, s, c, 0.0, 0.0, 0.0, 1.0;
+  return R.transpose() * gI_inv * R;
+}
+
 /*
 Returns the skew matrix of a 3 by 1 column vector
 */
@@ -652,30 +1442,67 @@ Eigen::Matrix<double, 3, 3> MPC::getSkew(Eigen::Matrix<double, 3, 1> v) {
 /*
 Construct an array of size 12*N that contains information about the contact state of feet.
 This matrix is used to enable/disable contact forces in the QP problem.
-N is the number of time step in the prediction horizon.
+N is the number of nodes in the prediction horizon. Each node takes the contact state of the phase of the gait
+at its start, which is stored in node_phase.
+The array is updated incrementally: only the nodes whose contact state changed are written, they are listed in
+S_changed (since the gait rolls by one time step between two solves, only the nodes at the changes of phase).
 */
 int MPC::construct_S() {
   int i = 0;
-  int k = 0;
+  int end_phase = gait(0, 0);
 
-  Eigen::Matrix<int, 20, 5> inv_gait = Eigen::Matrix<int, 20, 5>::Ones() - gait;
-  while (gait(i, 0) != 0) {
-    // S_gait.block(k*12, 0, gait[i, 0]*12, 1) = (1 - (gait.block(i, 1, 1, 4)).transpose()).replicate<gait[i, 0], 1>()
-    // not finished;
-    for (int a = 0; a < gait(i, 0); a++) {
+  S_changed.clear();
+  for (int k = 0; k < n_steps; k++) {
+    int start = i_xref(k, 0) - blocks(k, 0);
+    while (start >= end_phase && gait(i + 1, 0) != 0) {
+      i++;
+      end_phase += gait(i, 0);
+    }
+    node_phase(k, 0) = i;
+
+    bool changed = false;
+    for (int b = 0; b < 4; b++) {
+      changed = changed || (S_gait(k * 12 + 3 * b, 0) != 1 - gait(i, 1 + b));
+    }
+    if (changed) {
       for (int b = 0; b < 4; b++) {
-        for (int c = 0; c < 3; c++) {
-          S_gait(k * 12 + 12 * a + 3 * b + c, 0) = inv_gait(i, 1 + b);
-        }
+        S_gait.block(k * 12 + 3 * b, 0, 3, 1).setConstant(1 - gait(i, 1 + b));
       }
+      S_changed.push_back(k);
     }
-    k += gait(i, 0);
-    i++;
   }
 
   return 0;
 }
 
+/*
+Check the incremental update of the contact state of the nodes (construct_S and update_ML) against a full
+rebuild from the gait matrix, throw an exception if they differ
+*/
+void MPC::check_S() {
+  int i_start = 30 * n_steps - 18;
+  for (int k = 0; k < n_steps; k++) {
+    // Phase of the gait at the start of the node
+    int start = i_xref(k, 0) - blocks(k, 0);
+    int i = 0;
+    int end_phase = gait(0, 0);
+    while (start >= end_phase && gait(i + 1, 0) != 0) {
+      i++;
+      end_phase += gait(i, 0);
+    }
+
+    bool valid = (node_phase(k, 0) == i);
+    for (int j = 0; j < 12; j++) {
+      int S = 1 - gait(i, 1 + j / 3);
+      valid = valid && (S_gait(12 * k + j, 0) == S) && (ML->x[i_off(12 * k + j, 0) + i_start] == S);
+    }
+    if (!valid) {
+      throw std::logic_error("The incremental update of the contact state of node " + std::to_string(k) +
+                             " differs from the full rebuild");
+    }
+  }
+}
+
 /*
 Reconstruct the gait matrix based on the fsteps matrix since only the last one is received by the MPC
 */
@@ -699,9 +1526,29 @@ int MPC::construct_gait(Eigen::MatrixXd fsteps_in) {
 }
 
 /*
-Set all the parameters of the OSQP solver
+Set a parameter of the OSQP solver (see OSQPSettings.hpp for the available ones), before the first solve or
+after it for the parameters that can be updated
+*/
+void MPC::set_setting(const std::string &name, double value) {
+  // The setting is checked before any workspace is changed. An invalid value is rejected by the first workspace
+  // (the active one) so the pooled ones are only changed once it has been accepted.
+  bool any_initialized = initialized;
+  for (const PooledWorkspace &pooled : workspace_pool) {
+    any_initialized = any_initialized || pooled.initialized;
+  }
+  check_osqp_setting(name, any_initialized);
+
+  set_osqp_setting(settings, workspce, initialized, name, value);
+  for (PooledWorkspace &pooled : workspace_pool) {
+    set_osqp_setting(settings, pooled.work, pooled.initialized, name, value);
+  }
+  set_osqp_setting(&settings_reset, OSQP_NULL, false, name, value);
+}
+
+/*
+Get a parameter of the OSQP solver
 */
-int set_settings() { return 0; }
+double MPC::get_setting(const std::string &name) { return get_osqp_setting(settings, workspce, initialized, name); }
 
 void MPC::my_print_csc_matrix(csc *M, const char *name) {
   c_int j, i, row_start, row_stop;
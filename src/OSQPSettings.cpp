@@ -0,0 +1,97 @@
+#include "quadruped-reactive-walking/OSQPSettings.hpp"
+
+#include <algorithm>
+
+std::vector<std::string> get_osqp_setting_names() {
+  return {"eps_abs", "eps_rel", "eps_prim_inf", "eps_dual_inf", "max_iter", "time_limit", "polish",
+          "polish_refine_iter", "rho", "alpha", "delta", "sigma", "scaling", "adaptive_rho", "adaptive_rho_interval",
+          "adaptive_rho_tolerance", "adaptive_rho_fraction", "warm_start", "check_termination", "verbose"};
+}
+
+void check_osqp_setting(const std::string &name, bool initialized) {
+  std::vector<std::string> names = get_osqp_setting_names();
+  if (std::find(names.begin(), names.end(), name) == names.end()) {
+    throw std::invalid_argument("Unknown OSQP setting " + name);
+  }
+  if (initialized && (name == "sigma" || name == "scaling" || name.compare(0, 12, "adaptive_rho") == 0)) {
+    throw std::invalid_argument("OSQP setting " + name + " can only be set before the first solve");
+  }
+}
+
+void set_osqp_setting(OSQPSettings *settings, OSQPWorkspace *work, bool initialized, const std::string &name,
+                      double value) {
+  check_osqp_setting(name, initialized);
+  c_int value_int = (c_int)value;
+
+  if (!initialized) {
+    // Settings given to osqp_setup during the first solve
+    if (name == "eps_abs") settings->eps_abs = value;
+    else if (name == "eps_rel") settings->eps_rel = value;
+    else if (name == "eps_prim_inf") settings->eps_prim_inf = value;
+    else if (name == "eps_dual_inf") settings->eps_dual_inf = value;
+    else if (name == "max_iter") settings->max_iter = value_int;
+    else if (name == "time_limit") settings->time_limit = value;
+    else if (name == "polish") settings->polish = value_int;
+    else if (name == "polish_refine_iter") settings->polish_refine_iter = value_int;
+    else if (name == "rho") settings->rho = value;
+    else if (name == "alpha") settings->alpha = value;
+    else if (name == "delta") settings->delta = value;
+    else if (name == "sigma") settings->sigma = value;
+    else if (name == "scaling") settings->scaling = value_int;
+    else if (name == "adaptive_rho") settings->adaptive_rho = value_int;
+    else if (name == "adaptive_rho_interval") settings->adaptive_rho_interval = value_int;
+    else if (name == "adaptive_rho_tolerance") settings->adaptive_rho_tolerance = value;
+    else if (name == "adaptive_rho_fraction") settings->adaptive_rho_fraction = value;
+    else if (name == "warm_start") settings->warm_start = value_int;
+    else if (name == "check_termination") settings->check_termination = value_int;
+    else if (name == "verbose") settings->verbose = value_int;
+    return;
+  }
+
+  // Settings of a solver that has already been set up
+  c_int err = 0;
+  if (name == "eps_abs") err = osqp_update_eps_abs(work, value);
+  else if (name == "eps_rel") err = osqp_update_eps_rel(work, value);
+  else if (name == "eps_prim_inf") err = osqp_update_eps_prim_inf(work, value);
+  else if (name == "eps_dual_inf") err = osqp_update_eps_dual_inf(work, value);
+  else if (name == "max_iter") err = osqp_update_max_iter(work, value_int);
+  else if (name == "time_limit") err = osqp_update_time_limit(work, value);
+  else if (name == "polish") err = osqp_update_polish(work, value_int);
+  else if (name == "polish_refine_iter") err = osqp_update_polish_refine_iter(work, value_int);
+  else if (name == "rho") err = osqp_update_rho(work, value);
+  else if (name == "alpha") err = osqp_update_alpha(work, value);
+  else if (name == "delta") err = osqp_update_delta(work, value);
+  else if (name == "warm_start") err = osqp_update_warm_start(work, value_int);
+  else if (name == "check_termination") err = osqp_update_check_termination(work, value_int);
+  else if (name == "verbose") err = osqp_update_verbose(work, value_int);
+
+  if (err != 0) throw std::invalid_argument("Invalid value for OSQP setting " + name);
+}
+
+double get_osqp_setting(const OSQPSettings *settings, const OSQPWorkspace *work, bool initialized,
+                        const std::string &name) {
+  // The workspace has its own copy of the settings once the solver has been set up
+  const OSQPSettings *s = initialized ? work->settings : settings;
+
+  if (name == "eps_abs") return s->eps_abs;
+  if (name == "eps_rel") return s->eps_rel;
+  if (name == "eps_prim_inf") return s->eps_prim_inf;
+  if (name == "eps_dual_inf") return s->eps_dual_inf;
+  if (name == "max_iter") return (double)s->max_iter;
+  if (name == "time_limit") return s->time_limit;
+  if (name == "polish") return (double)s->polish;
+  if (name == "polish_refine_iter") return (double)s->polish_refine_iter;
+  if (name == "rho") return s->rho;
+  if (name == "alpha") return s->alpha;
+  if (name == "delta") return s->delta;
+  if (name == "sigma") return s->sigma;
+  if (name == "scaling") return (double)s->scaling;
+  if (name == "adaptive_rho") return (double)s->adaptive_rho;
+  if (name == "adaptive_rho_interval") return (double)s->adaptive_rho_interval;
+  if (name == "adaptive_rho_tolerance") return s->adaptive_rho_tolerance;
+  if (name == "adaptive_rho_fraction") return s->adaptive_rho_fraction;
+  if (name == "warm_start") return (double)s->warm_start;
+  if (name == "check_termination") return (double)s->check_termination;
+  if (name == "verbose") return (double)s->verbose;
+  throw std::invalid_argument("Unknown OSQP setting " + name);
+}
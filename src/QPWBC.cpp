@@ -24,8 +24,15 @@ QPWBC::QPWBC() {
   std::fill_n(v_NK_up, size_nz_NK, 25.0);
   std::fill_n(v_NK_low, size_nz_NK, 0.0);
 
-  // Set OSQP settings to default
+  // Set OSQP settings to default then tune them (can be changed with set_setting)
   osqp_set_default_settings(settings);
+  settings->eps_abs = (float)1e-5;
+  settings->eps_rel = (float)1e-5;
+  settings->adaptive_rho = (c_int)1;
+  settings->adaptive_rho_interval = (c_int)200;
+  settings->adaptive_rho_tolerance = (float)5.0;
+  settings->adaptive_rho_fraction = (float)0.7;
+  settings->verbose = true;
 
 }
 
@@ -232,23 +239,7 @@ int QPWBC::call_solver() {
     std::cout << data->A << std::endl;
     std::cout << data->u << std::endl;*/
 
-    // Tuning parameters of the OSQP solver
-    // settings->rho = 0.1f;
-    // settings->sigma = 1e-6f;
-    // settings->max_iter = 4000;
-    settings->eps_abs = (float)1e-5;
-    settings->eps_rel = (float)1e-5;
-    /*settings->eps_prim_inf = 1e-4f;
-    settings->eps_dual_inf = 1e-4f;
-    settings->alpha = 1.6f;
-    settings->delta = 1e-6f;
-    settings->polish = 0;
-    settings->polish_refine_iter = 3;*/
-    settings->adaptive_rho = (c_int)1;
-    settings->adaptive_rho_interval = (c_int)200;
-    settings->adaptive_rho_tolerance = (float)5.0;
-    settings->adaptive_rho_fraction = (float)0.7;
-    settings->verbose = true;
+    // Tuning parameters of the OSQP solver are set in the constructor and with set_setting
     osqp_setup(&workspce, data, settings);
 
     initialized = true;
@@ -306,6 +297,23 @@ Eigen::MatrixXd QPWBC::get_H() {
   Hxd = H;
   return Hxd; 
 }
+const OSQPInfo *QPWBC::get_info() { return initialized ? workspce->info : OSQP_NULL; }
+
+/*
+Statistics of the last solve without building the dictionary of get_solver_stats (called at each iteration of the
+control loop): number of iterations, status (OSQP_UNSOLVED before the first solve) and duration in seconds
+*/
+int QPWBC::get_iter() { return initialized ? (int)workspce->info->iter : 0; }
+int QPWBC::get_status() { return initialized ? (int)workspce->info->status_val : OSQP_UNSOLVED; }
+double QPWBC::get_run_time() { return initialized ? workspce->info->run_time : 0.0; }
+
+/*
+Settings of the OSQP solver (see OSQPSettings.hpp for the available ones)
+*/
+void QPWBC::set_setting(const std::string &name, double value) {
+  set_osqp_setting(settings, workspce, initialized, name, value);
+}
+double QPWBC::get_setting(const std::string &name) { return get_osqp_setting(settings, workspce, initialized, name); }
 
 int QPWBC::run(const Eigen::MatrixXd &M, const Eigen::MatrixXd &Jc, const Eigen::MatrixXd &f_cmd, const Eigen::MatrixXd &RNEA,
                const Eigen::MatrixXd &k_contact) {
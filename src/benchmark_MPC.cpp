@@ -0,0 +1,198 @@
+#include <chrono>
+#include <iostream>
+#include <vector>
+
+#include <Eigen/Core>
+#include "quadruped-reactive-walking/MPC.hpp"
+
+/*
+Micro-benchmark of the update of the constraint matrices of the MPC (update_problem, mostly update_matrices) for
+several lengths of the prediction horizon, with and without the cache of the coefficients of B
+
+The reference trajectory is moved by one time step between two updates like in the control loop, either without
+motion (same yaw and position for all time steps), straight forward (same yaw for all time steps) or while turning
+(a new yaw for each time step).
+
+Then benchmark of a whole iteration of the MPC (update and solve) with the full and reduced formulations solved
+by OSQP and the condensed formulation solved by eiquadprog, to find the horizon length up to which the dense
+condensed problem is the fastest on this computer.
+
+Then latency of one iteration of the MPC against the duration of the prediction horizon, either with one node
+per time step or with move blocking (nodes lasting more and more time steps towards the end of the horizon).
+
+Finally duration of one iteration of the MPC with a pool of workspaces of the solver keyed by contact sequence,
+while trotting in place (the constraint matrix of a contact sequence is the same at each gait period so its
+factorization is reused) and while walking (only the setups of the reduced formulation are saved).
+*/
+
+// Reference trajectory starting at time t for a forward velocity vx and a yaw velocity wz
+Eigen::MatrixXd get_xref(int n_steps, double dt, double t, double vx, double wz) {
+  Eigen::MatrixXd xref = Eigen::MatrixXd::Zero(12, n_steps + 1);
+  for (int k = 0; k <= n_steps; k++) {
+    double t_k = t + k * dt;
+    xref(0, k) = vx * t_k;
+    xref(2, k) = 0.2027682;
+    xref(5, k) = wz * t_k;
+    xref(6, k) = vx;
+    xref(11, k) = wz;
+  }
+  return xref;
+}
+
+// Trotting gait with phases of 8 time steps, starting i time steps after the beginning of a phase
+Eigen::MatrixXd get_fsteps(int n_steps, int i) {
+  double f0[12] = {0.19, 0.15005, 0.0, 0.19, -0.15005, 0.0, -0.19, 0.15005, 0.0, -0.19, -0.15005, 0.0};
+  Eigen::MatrixXd fsteps = Eigen::MatrixXd::Zero(20, 13);
+  int n_phases = 0;
+  int remaining = n_steps;
+  while (remaining > 0) {
+    int n = (n_phases == 0) ? 8 - (i % 8) : std::min(8, remaining);
+    n = std::min(n, remaining);
+    fsteps(n_phases, 0) = n;
+    bool diagonal = ((i / 8 + n_phases) % 2 == 0);
+    for (int foot = 0; foot < 4; foot++) {
+      bool contact = diagonal ? (foot == 0 || foot == 3) : (foot == 1 || foot == 2);
+      for (int c = 0; c < 3; c++) {
+        fsteps(n_phases, 1 + 3 * foot + c) = contact ? f0[3 * foot + c] : 0.0;
+      }
+    }
+    remaining -= n;
+    n_phases++;
+  }
+  return fsteps;
+}
+
+// Mean duration of the update of the constraint matrices in microseconds
+double benchmark(int n_steps, double vx, double wz, bool cache, int n_iter) {
+  double dt = 0.02;
+  MPC mpc(dt, n_steps, 0.32);
+  mpc.set_B_cache(cache);
+  mpc.set_setting("verbose", 0);
+
+  // Creation of the matrices and of the solver
+  mpc.run(0, get_xref(n_steps, dt, 0.0, vx, wz), get_fsteps(n_steps, 0));
+
+  // Inputs are created before the timing
+  std::vector<Eigen::MatrixXd> xrefs, fsteps;
+  for (int i = 1; i <= n_iter; i++) {
+    xrefs.push_back(get_xref(n_steps, dt, i * dt, vx, wz));
+    fsteps.push_back(get_fsteps(n_steps, i));
+  }
+
+  auto tic = std::chrono::high_resolution_clock::now();
+  for (int i = 0; i < n_iter; i++) {
+    mpc.update_problem(1 + i, xrefs[i], fsteps[i]);
+  }
+  auto toc = std::chrono::high_resolution_clock::now();
+
+  return std::chrono::duration<double, std::micro>(toc - tic).count() / n_iter;
+}
+
+// Nodes of 1 time step for the first 8 ones, then 4 nodes of 2, 4 of 4, 4 of 8... up to n_steps time steps
+Eigen::MatrixXd get_blocks(int n_steps) {
+  std::vector<double> blocks;
+  int remaining = n_steps;
+  for (int i = 0; remaining > 0; i++) {
+    int n = std::min((i < 8) ? 1 : (1 << ((i - 4) / 4)), remaining);
+    blocks.push_back(n);
+    remaining -= n;
+  }
+  return Eigen::Map<Eigen::MatrixXd>(blocks.data(), blocks.size(), 1);
+}
+
+// Mean duration of one iteration of the MPC (update of the problem and solve) in milliseconds, with the number
+// of time steps of each node of the horizon, the size of the pool of workspaces and the forward velocity
+double benchmark_run(const Eigen::MatrixXd &blocks, int formulation, int n_iter, int pool_size = 1,
+                     double vx = 0.3) {
+  double dt = 0.02;
+  int n_steps = (int)blocks.sum();
+  MPC mpc(dt, blocks, 0.32, formulation);
+  mpc.set_setting("verbose", 0);
+  mpc.set_workspace_pool_size(pool_size);
+
+  // Creation of the matrices and of the solver
+  mpc.run(0, get_xref(n_steps, dt, 0.0, vx, 0.0), get_fsteps(n_steps, 0));
+
+  // Inputs are created before the timing
+  std::vector<Eigen::MatrixXd> xrefs, fsteps;
+  for (int i = 1; i <= n_iter; i++) {
+    xrefs.push_back(get_xref(n_steps, dt, i * dt, vx, 0.0));
+    fsteps.push_back(get_fsteps(n_steps, i));
+  }
+
+  auto tic = std::chrono::high_resolution_clock::now();
+  for (int i = 0; i < n_iter; i++) {
+    mpc.run(1 + i, xrefs[i], fsteps[i]);
+  }
+  auto toc = std::chrono::high_resolution_clock::now();
+
+  return std::chrono::duration<double, std::milli>(toc - tic).count() / n_iter;
+}
+
+int main(int /*argc*/, char** /*argv*/) {
+  int n_iter = 2000;
+  std::cout << "Mean duration of update_matrices (us)" << std::endl;
+  std::cout << "n_steps | static no cache / cache | straight no cache / cache | turning no cache / cache" << std::endl;
+  double velocities[3][2] = {{0.0, 0.0}, {0.3, 0.0}, {0.3, 0.5}};
+  for (int n_steps : {16, 32, 64}) {
+    std::cout << n_steps;
+    for (int i = 0; i < 3; i++) {
+      std::cout << " | " << benchmark(n_steps, velocities[i][0], velocities[i][1], false, n_iter);
+      std::cout << " / " << benchmark(n_steps, velocities[i][0], velocities[i][1], true, n_iter);
+    }
+    std::cout << std::endl;
+  }
+
+  int n_iter_run = 100;
+  int crossover = 0;  // Longest horizon up to which the condensed formulation is the fastest
+  bool fastest = true;
+  std::cout << std::endl << "Mean duration of one iteration of the MPC (ms)" << std::endl;
+  std::cout << "n_steps | full | reduced | condensed" << std::endl;
+  for (int n_steps : {4, 8, 12, 16, 24, 32, 48, 64}) {
+    Eigen::MatrixXd blocks = Eigen::MatrixXd::Ones(n_steps, 1);
+    double t_full = benchmark_run(blocks, MPC::FULL, n_iter_run);
+    double t_reduced = benchmark_run(blocks, MPC::REDUCED, n_iter_run);
+    double t_condensed = benchmark_run(blocks, MPC::CONDENSED, n_iter_run);
+    std::cout << n_steps << " | " << t_full << " | " << t_reduced << " | " << t_condensed << std::endl;
+    fastest = fastest && (t_condensed < std::min(t_full, t_reduced));
+    if (fastest) {
+      crossover = n_steps;
+    }
+  }
+  if (crossover > 0) {
+    std::cout << "The condensed formulation is the fastest up to n_steps = " << crossover << std::endl;
+  } else {
+    std::cout << "The condensed formulation is never the fastest" << std::endl;
+  }
+
+  std::cout << std::endl << "Mean duration of one iteration of the MPC against the horizon (ms)" << std::endl;
+  std::cout << "horizon (s) | nodes | full | reduced | condensed" << std::endl;
+  for (int n_steps : {16, 32, 64}) {
+    for (bool blocking : {false, true}) {
+      Eigen::MatrixXd blocks = blocking ? get_blocks(n_steps) : Eigen::MatrixXd::Ones(n_steps, 1);
+      std::cout << n_steps * 0.02 << " | " << blocks.size() << (blocking ? " (blocked)" : "");
+      for (int formulation : {MPC::FULL, MPC::REDUCED, MPC::CONDENSED}) {
+        std::cout << " | " << benchmark_run(blocks, formulation, n_iter_run);
+      }
+      std::cout << std::endl;
+    }
+  }
+
+  // A trotting period of 16 time steps has 16 contact sequences
+  std::cout << std::endl << "Mean duration of one iteration of the MPC with a pool of workspaces (ms)" << std::endl;
+  std::cout << "n_steps | in place full 1 / 16 workspaces | reduced 1 / 16 | walking full 1 / 16 | reduced 1 / 16"
+            << std::endl;
+  for (int n_steps : {16, 32}) {
+    Eigen::MatrixXd blocks = Eigen::MatrixXd::Ones(n_steps, 1);
+    std::cout << n_steps;
+    for (double vx : {0.0, 0.3}) {
+      for (int formulation : {MPC::FULL, MPC::REDUCED}) {
+        std::cout << " | " << benchmark_run(blocks, formulation, 4 * n_iter_run, 1, vx);
+        std::cout << " / " << benchmark_run(blocks, formulation, 4 * n_iter_run, 16, vx);
+      }
+    }
+    std::cout << std::endl;
+  }
+
+  return 0;
+}